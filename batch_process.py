@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序批量处理工具
+扫描文件夹中的全部录像，在进程池中并行处理 (总进程数有上限)：每段录像提取关键帧到各自的数据集目录，
+再生成 waypoints.json；最后汇总各路线的耗时和失败原因
+用法: python batch_process.py -i recordings -o dataset -j 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
+
+from core.ui_mask import load_ui_mask, save_ui_mask
+from utils.frame_similarity import SIMILARITY_BACKENDS, DEFAULT_SIMILARITY
+from utils.generate_waypoints import generate_json
+from video_processor import extract_keyframes
+
+
+VIDEO_EXTS = ('.mp4', '.mov', '.mkv', '.avi', '.flv', '.webm')
+SUMMARY_FILE = "batch_summary.json"
+LOG_FILE = "process.log"
+
+
+def discover_videos(input_dir, recursive=False):
+    """
+    查找文件夹中的录像
+
+    Returns:
+        list: 录像路径，按路径排序
+    """
+    videos = []
+    for dirpath, _, filenames in os.walk(input_dir):
+        videos.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith(VIDEO_EXTS))
+        if not recursive:
+            break
+    return sorted(videos)
+
+
+def route_name(video_path, input_dir):
+    """数据集目录名：录像相对输入目录的路径去掉扩展名 (子目录层级用 _ 连接，避免同名录像冲突)"""
+    rel = os.path.splitext(os.path.relpath(video_path, input_dir))[0]
+    return rel.replace(os.sep, "_").replace("/", "_")
+
+
+def process_route(video_path, dataset_dir, options):
+    """
+    子进程：处理一段录像 (可选学习 UI 遮罩 -> 提取关键帧 -> 生成路点)，输出写到数据集目录的 process.log
+
+    Args:
+        video_path: 录像路径
+        dataset_dir: 该路线的数据集目录
+        options: 提取参数字典 (threshold / size / similarity / stride / features / thumbs / writers /
+            learn_mask / dedup / calibrate)
+
+    Returns:
+        dict: 处理结果 (status 为 ok 或 failed，以及关键帧数、路点数、各阶段耗时、错误信息)
+    """
+    result = {"video": video_path, "dataset": dataset_dir, "status": "ok"}
+    os.makedirs(dataset_dir, exist_ok=True)
+    log_path = os.path.join(dataset_dir, LOG_FILE)
+    start = time.perf_counter()
+    try:
+        with open(log_path, 'w', encoding='utf-8') as log, redirect_stdout(log), redirect_stderr(log):
+            if options["learn_mask"] and load_ui_mask(dataset_dir) is None:
+                from learn_ui_mask import learn_ui_mask
+                t0 = time.perf_counter()
+                mask, _ = learn_ui_mask(video_path, options["size"])
+                if mask is not None:
+                    save_ui_mask(dataset_dir, mask)
+                result["mask_seconds"] = time.perf_counter() - t0
+
+            stats = {}
+            t0 = time.perf_counter()
+            count = extract_keyframes(video_path, dataset_dir, options["threshold"], target_size=options["size"],
+                                      stats=stats, similarity=options["similarity"], features=options["features"],
+                                      stride=options["stride"], thumbs=options["thumbs"], writers=options["writers"])
+            result["extract_seconds"] = time.perf_counter() - t0
+            if not count:
+                raise RuntimeError("没有提取到关键帧 (录像无法打开或为空)")
+            result.update(keyframes=count, frames=stats.get("frames", 0))
+
+            t0 = time.perf_counter()
+            waypoints_path = os.path.join(dataset_dir, "waypoints.json")
+            generate_json(dataset_dir, waypoints_path, options["dedup"], options["calibrate"], workers=1)
+            result["waypoints_seconds"] = time.perf_counter() - t0
+            with open(waypoints_path, 'r', encoding='utf-8') as f:
+                result["waypoints"] = len(json.load(f))
+    except Exception as e:
+        result.update(status="failed", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    result["seconds"] = time.perf_counter() - start
+    result["log"] = log_path
+    return result
+
+
+def _is_done(video_path, dataset_dir):
+    """路点文件已存在且比录像新：已处理过 (路点文件可能已手工修改，不应覆盖)"""
+    waypoints_path = os.path.join(dataset_dir, "waypoints.json")
+    return os.path.exists(waypoints_path) and os.path.getmtime(waypoints_path) >= os.path.getmtime(video_path)
+
+
+def batch_process(input_dir, output_root, options, workers=None, recursive=False, force=False):
+    """
+    批量处理文件夹中的录像
+
+    Args:
+        input_dir: 录像文件夹
+        output_root: 数据集根目录，每段录像输出到其中的同名子目录
+        options: 提取参数字典，见 process_route
+        workers: 同时处理的录像数上限，为 None 时使用 CPU 核数
+        recursive: 是否递归查找子目录
+        force: 重新处理已生成路点的录像 (会覆盖手工修改过的 waypoints.json)
+
+    Returns:
+        dict: 汇总 (同时写到 <output_root>/batch_summary.json)
+    """
+    videos = discover_videos(input_dir, recursive)
+    if not videos:
+        print(f"未找到录像 ({', '.join(VIDEO_EXTS)}): {input_dir}")
+        return None
+    os.makedirs(output_root, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(videos)))
+
+    routes = []
+    skipped = []
+    for video in videos:
+        dataset_dir = os.path.join(output_root, route_name(video, input_dir))
+        if not force and _is_done(video, dataset_dir):
+            skipped.append({"video": video, "dataset": dataset_dir, "status": "skipped"})
+        else:
+            routes.append((video, dataset_dir))
+    # 先处理大文件，减少最后只剩一个长任务在跑的时间
+    routes.sort(key=lambda route: os.path.getsize(route[0]), reverse=True)
+
+    print(f"共 {len(videos)} 段录像：待处理 {len(routes)}，跳过已处理 {len(skipped)}，{workers} 个进程")
+    results = list(skipped)
+    start = time.perf_counter()
+    # 与引擎子进程一致使用 spawn，Linux 和 Windows 行为相同
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = {pool.submit(process_route, video, dataset_dir, options): (video, dataset_dir)
+                   for video, dataset_dir in routes}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 子进程崩溃 (如被系统杀掉) 时拿不到结果
+                    video, dataset_dir = futures[future]
+                    result = {"video": video, "dataset": dataset_dir, "status": "failed",
+                              "error": f"{type(e).__name__}: {e}"}
+                results.append(result)
+                name = os.path.basename(result["dataset"])
+                if result["status"] == "ok":
+                    print(f"[{done}/{len(routes)}] {name} 完成：{result['keyframes']} 个关键帧，"
+                          f"{result['waypoints']} 个路点，耗时 {result['seconds']:.1f}s")
+                else:
+                    print(f"[{done}/{len(routes)}] {name} 失败：{result['error']}")
+        except KeyboardInterrupt:
+            print("批量处理中断，正在停止尚未开始的任务 (已开始的提取会保存断点，重新运行即可继续)")
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda r: r["video"])
+    ok = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] == "failed"]
+    frames = sum(r.get("frames", 0) for r in ok)
+    busy = sum(r.get("seconds", 0.0) for r in results)
+    summary = {
+        "input": os.path.abspath(input_dir),
+        "workers": workers,
+        "options": options,
+        "seconds": elapsed,
+        "busy_seconds": busy,
+        "ok": len(ok),
+        "failed": len(failed),
+        "skipped": len(skipped),
+        "frames": frames,
+        "routes": results,
+    }
+    with open(os.path.join(output_root, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print(f"批量处理完成：成功 {len(ok)}，失败 {len(failed)}，跳过 {len(skipped)}，"
+          f"总耗时 {elapsed:.1f}s (各任务累计 {busy:.1f}s，并行度 {busy / elapsed if elapsed > 0 else 0:.2f})")
+    if frames:
+        print(f"共解码 {frames} 帧，整体吞吐 {frames / elapsed:.1f} 帧/秒")
+    for r in ok:
+        print(f"  {os.path.basename(r['dataset'])}: {r['keyframes']} 关键帧 / {r['waypoints']} 路点，"
+              f"提取 {r['extract_seconds']:.1f}s，路点 {r['waypoints_seconds']:.1f}s")
+    for r in failed:
+        print(f"  失败 {os.path.basename(r['dataset'])}: {r['error']}" + (f" (日志: {r['log']})" if "log" in r else ""))
+    print(f"汇总已保存: {os.path.join(output_root, SUMMARY_FILE)}")
+    return summary
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序批量处理工具")
+    parser.add_argument('--input', '-i', required=True, help='录像文件夹')
+    parser.add_argument('--output', '-o', default="dataset", help='数据集根目录 (每段录像一个子目录)')
+    parser.add_argument('--workers', '-j', type=int, default=0, help='同时处理的录像数上限 (0 为 CPU 核数)')
+    parser.add_argument('--recursive', '-r', action='store_true', help='递归查找子目录中的录像')
+    parser.add_argument('--force', action='store_true',
+                        help='重新处理已生成路点的录像 (会覆盖手工修改过的 waypoints.json)')
+    parser.add_argument('--threshold', '-t', type=float, default=0.6, help='关键帧提取阈值 (0-1)')
+    parser.add_argument('--width', '-w', type=int, default=640, help='目标宽度')
+    parser.add_argument('--height', '-H', type=int, default=360, help='目标高度')
+    parser.add_argument('--similarity', choices=sorted(SIMILARITY_BACKENDS), default=DEFAULT_SIMILARITY,
+                        help='关键帧相似度后端')
+    parser.add_argument('--min_overlap', type=float, default=None,
+                        help='按导航特征重叠率选择关键帧 (使用 nav_orb，阈值为 1 - 重叠率)')
+    parser.add_argument('--stride', type=int, default=1, help='采样间隔')
+    parser.add_argument('--features', action='store_true', help='同时保存导航特征')
+    parser.add_argument('--thumbs', action='store_true', help='同时写出缩略图')
+    parser.add_argument('--writers', type=int, default=2, help='每个进程的关键帧写出线程数')
+    parser.add_argument('--learn_mask', action='store_true',
+                        help='数据集目录中还没有 ui_mask.png 时先从录像学习 UI 遮罩')
+    parser.add_argument('--dedup', type=int, default=None, help='生成路点时按感知哈希去重的汉明距离阈值')
+    parser.add_argument('--calibrate', action='store_true', help='生成路点时为每个路点校准到达阈值')
+
+    args = parser.parse_args()
+    if not os.path.isdir(args.input):
+        print(f"错误：目录不存在 -> {args.input}")
+        sys.exit(1)
+    if args.min_overlap is not None:
+        args.similarity = "nav_orb"
+        args.threshold = 1 - args.min_overlap
+
+    options = {
+        "threshold": args.threshold,
+        "size": (args.width, args.height),
+        "similarity": args.similarity,
+        "stride": args.stride,
+        "features": args.features,
+        "thumbs": args.thumbs,
+        "writers": args.writers,
+        "learn_mask": args.learn_mask,
+        "dedup": args.dedup,
+        "calibrate": args.calibrate,
+    }
+    summary = batch_process(args.input, args.output, options, args.workers or None, args.recursive, args.force)
+    if summary is not None and summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
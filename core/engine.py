@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序常驻导航引擎
+截屏、输入、路线和特征只加载一次；界面的启动/停止只是恢复/暂停导航循环
+"""
+
+import os
+import threading
+import time
+
+import cv2
+
+from core.input_controller import InputController
+from core.input_emul import InputManager
+from core.metrics import PerfMonitor
+from core.navigator import SkyNavigator
+from core.vision import VisionSystem
+
+
+class NavigationEngine:
+    """
+    导航引擎
+    - run(stop_event): 在当前线程执行一轮 "校准 -> 导航"，直到 stop_event 置位
+    - start()/resume()/pause()/shutdown(): 常驻模式，由后台线程执行，
+      暂停时松开所有按键但保留已加载的模块，恢复后直接从当前路点继续
+    """
+
+    def __init__(self, dataset_path, waypoints_file, width=640, height=360, perf=None,
+                 status_callback=None, telemetry=None, frame_sink=None, profiler=None,
+                 recorder_factory=None, exporter_factory=None, window_title="Sky"):
+        """
+        Args:
+            dataset_path: 数据集目录
+            waypoints_file: 路点配置文件
+            width / height: 标准处理分辨率 (与数据集图片一致)
+            perf: PerfMonitor 实例
+            status_callback: 状态回调 status_callback(img_path, score, threshold)
+            telemetry: 可选的遥测通道，发布帧时间戳、丢失/盲飞状态和首次动作耗时
+            frame_sink: 可选的回调，每帧接收缩放后的画面
+            profiler: 可选的 ProfilerHook，用于按需采样导航线程
+            recorder_factory: 每轮运行开始时调用 recorder_factory(nav) 创建 RunRecorder
+            exporter_factory: 加载时调用 exporter_factory(perf) 启动性能指标导出
+            window_title: 游戏窗口标题
+        """
+        self.dataset_path = dataset_path
+        self.waypoints_file = waypoints_file
+        self.width = width
+        self.height = height
+        self.perf = perf if perf is not None else PerfMonitor()
+        self.status_callback = status_callback
+        self.telemetry = telemetry
+        self.frame_sink = frame_sink
+        self.profiler = profiler
+        self.recorder_factory = recorder_factory
+        self.exporter_factory = exporter_factory
+        self.window_title = window_title
+
+        self.vision = None
+        self.input_mgr = None
+        self.nav = None
+        self.ctrl = None
+        self.exporter = None
+        self.load_time = None
+        # 每次启动到第一次发出输入指令的耗时 (秒)
+        self.first_action_times = []
+        self._requested_at = None
+
+        # 常驻模式的线程和状态
+        self._thread = None
+        self._resume_event = threading.Event()
+        self._pause_event = threading.Event()
+        self._state_lock = threading.Lock()
+        # 上一轮还在收尾 (松键、关闭录制) 时收到的恢复请求，收尾结束后立即开始新一轮
+        self._resume_pending = False
+        # 遥测通道在恢复时的 run_id，停止事件带上它，界面忽略上一轮迟到的停止事件
+        self._run_id = None
+        self._shutdown = False
+        self.running = False
+
+    def load(self):
+        """加载截屏、输入和导航模块 (只在第一次调用时执行)"""
+        if self.nav is not None:
+            return self
+        start = time.perf_counter()
+        if self.exporter_factory is not None:
+            self.exporter = self.exporter_factory(self.perf)
+        self.vision = VisionSystem(window_title=self.window_title)
+        self.input_mgr = InputManager(window_title=self.window_title)
+        self.nav = SkyNavigator(
+            self.dataset_path,
+            self.waypoints_file,
+            use_edge_feature=True,
+            perf=self.perf
+        )
+        self.ctrl = InputController(perf=self.perf)
+        self.load_time = time.perf_counter() - start
+        print(f"导航引擎加载完成，耗时 {self.load_time:.2f}s")
+        return self
+
+    def run(self, stop_event, requested_at=None):
+        """
+        执行一轮 "校准 -> 导航"
+
+        Args:
+            stop_event: 停止 (或暂停) 事件
+            requested_at: 用户发出启动指令的时间 (perf_counter)，用于统计首次动作耗时
+
+        Returns:
+            bool: 校准成功并正常停止返回 True，校准失败返回 False
+        """
+        self._requested_at = requested_at if requested_at is not None else time.perf_counter()
+        self.load()
+        nav, ctrl = self.nav, self.ctrl
+        ctrl.pid.reset()
+        nav.consecutive_misses = 0
+
+        recorder = None
+        if self.recorder_factory is not None:
+            recorder = self.recorder_factory(nav)
+            ctrl.recorder = recorder
+        try:
+            # 初始校准：发送当前路点图给 UI
+            if self.status_callback:
+                wp = nav.waypoints[nav.current_idx]
+                self.status_callback(os.path.join(nav.dataset_path, wp['img_name']), 0.0, 0.0)
+
+            print("开始初始校准...")
+            if not self._calibrate(stop_event, recorder):
+                print("校准失败，停止运行")
+                return False
+
+            print("校准成功，开始导航")
+            while not stop_event.is_set():
+                self._step(recorder)
+            return True
+        finally:
+            # 暂停/停止时松开所有按键，避免角色继续移动
+            ctrl.release_all()
+            ctrl.recorder = None
+            if recorder is not None:
+                recorder.close()
+
+    def _note_first_action(self):
+        """本轮第一次发出输入指令时记录首次动作耗时"""
+        if self._requested_at is None:
+            return
+        ts = self.ctrl.last_action_ts
+        if ts is None or ts < self._requested_at:
+            return
+        elapsed = ts - self._requested_at
+        self._requested_at = None
+        self.first_action_times.append(elapsed)
+        self.perf.record("first_action", elapsed)
+        if self.telemetry is not None:
+            self.telemetry.publish(first_action=elapsed)
+        print(f"首次动作耗时: {elapsed * 1000:.0f}ms")
+
+    def _capture(self):
+        frame = self.vision.capture_screen()
+        return cv2.resize(frame, (self.width, self.height))
+
+    def _step(self, recorder=None):
+        """导航循环的一帧"""
+        nav, ctrl, perf = self.nav, self.ctrl, self.perf
+        frame_start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.poll()
+
+        # 1. 屏幕截图 & 缩放 - 使用区域截屏
+        with perf.span("capture"):
+            frame = self.vision.capture_screen()
+        with perf.span("resize"):
+            resized_frame = cv2.resize(frame, (self.width, self.height))
+        if self.frame_sink is not None:
+            self.frame_sink(resized_frame)
+
+        # === 调试代码 Start ===
+        # 调用预处理，看看机器看到的是什么
+        debug_edge = nav._preprocess(resized_frame)
+        if debug_edge is not None:
+            cv2.imshow("DEBUG: What Bot Sees", debug_edge)
+            cv2.waitKey(1)
+        # === 调试代码 End ===
+
+        # 2. 计算偏移量
+        frame_seq = recorder.record_frame(resized_frame) if recorder else -1
+        nav_start = time.perf_counter()
+        offset_x, similarity = nav.calculate_offset(resized_frame)
+        current_thresh = nav.waypoints[nav.current_idx].get('match_threshold', 0.6)
+        arrived = nav.check_arrival(similarity)
+
+        if frame_seq >= 0:
+            recorder.record_nav(
+                frame_seq, phase="navigate", idx=nav.current_idx,
+                offset=float(offset_x), score=float(similarity), thresh=current_thresh,
+                arrived=arrived, misses=nav.consecutive_misses, blind=nav.is_blind(),
+                latency=time.perf_counter() - nav_start
+            )
+
+        # 3. 汇报状态给 UI
+        if self.telemetry is not None:
+            self.telemetry.publish(frame_ts=time.time(), misses=nav.consecutive_misses, blind=nav.is_blind())
+        if self.status_callback:
+            with perf.span("callback"):
+                # 获取当前目标图片的绝对路径
+                wp = nav.waypoints[nav.current_idx]
+                img_path = os.path.join(nav.dataset_path, wp['img_name'])
+
+                self.status_callback(img_path, similarity, current_thresh)
+
+        # 4. 检查是否到达目标
+        if arrived:
+            print(f"到达目标 ID: {nav.current_idx}")
+            # 执行路点定义的特殊动作
+            current_action = nav.get_current_action()
+            action = current_action.get('action', 'walk')
+
+            if action == 'fly_start':
+                print("执行起飞动作")
+                ctrl.jump()
+                time.sleep(0.5)
+                ctrl.fly_toggle()
+                time.sleep(1) # 等待起飞动画
+            elif action == 'interact':
+                print("执行交互动作")
+                ctrl.interact()
+                time.sleep(1) # 等待交互完成
+            elif action == 'jump':
+                print("执行跳跃动作")
+                ctrl.jump()
+                time.sleep(0.5)
+
+            # 切换下一个目标
+            nav.next_waypoint()
+            self._note_first_action()
+            perf.record("frame", time.perf_counter() - frame_start)
+            return
+
+        with perf.span("control"):
+            # 5. 自动视角调整
+            # 只有在非盲飞模式下才调整视角
+            if not nav.is_blind():
+                ctrl.align_camera(offset_x, similarity)
+
+            # 6. 保持前进 (按键状态由控制器跟踪，已按下时不会重复发送)
+            ctrl.move_forward()
+        self._note_first_action()
+
+        perf.record("frame", time.perf_counter() - frame_start)
+
+        # 7. 限制帧率
+        time.sleep(0.1)
+
+    def _calibrate(self, stop_event, recorder=None):
+        """
+        初始校准：寻找匹配的环境
+
+        Args:
+            stop_event: 停止事件
+            recorder: 可选的 RunRecorder
+
+        Returns:
+            bool: 校准成功返回 True，否则返回 False
+        """
+        nav, ctrl = self.nav, self.ctrl
+        search_attempts = 0
+
+        while not stop_event.is_set():
+            # 1. 看一眼 - 使用区域截屏
+            resized_frame = self._capture()
+
+            frame_seq = recorder.record_frame(resized_frame) if recorder else -1
+            nav_start = time.perf_counter()
+            offset, score = nav.calculate_offset(resized_frame)
+            if frame_seq >= 0:
+                recorder.record_nav(
+                    frame_seq, phase="calibrate", idx=nav.current_idx,
+                    offset=float(offset), score=float(score), thresh=0.6, arrived=False,
+                    misses=nav.consecutive_misses, blind=nav.is_blind(),
+                    latency=time.perf_counter() - nav_start
+                )
+
+            # 2. 汇报状态
+            if self.status_callback:
+                wp = nav.waypoints[nav.current_idx]
+                img_path = os.path.join(nav.dataset_path, wp['img_name'])
+                self.status_callback(img_path, score, 0.6)  # 校准阈值固定为0.6
+
+            # 3. 判断
+            if score > 0.6: # 找到了高置信度的匹配
+                print(f"校准成功！当前匹配分: {score:.2f}")
+                # 进行微调，把视角对正 (死区内不会移动，不必再等)
+                if abs(offset) >= ctrl.pid.deadzone:
+                    ctrl.center_camera(offset, score)
+                    self._note_first_action()
+                    time.sleep(0.5)
+                    continue
+                return True # 进入正式导航
+
+            # 4. 没找到，尝试原地旋转寻找
+            print(f"未找到目标 (Score: {score:.2f})，正在搜索环境...")
+            # 向右转一点 (与旧版 P 控制器 align_camera(30) 的移动量一致)
+            ctrl.rotate(15)
+            self._note_first_action()
+            time.sleep(0.5) # 等画面稳定
+
+            search_attempts += 1
+            if search_attempts > 12: # 转了一圈也没找到
+                print("校准失败：请手动移动角色到近似起始位置")
+                return False
+        return False
+
+    # === 常驻模式 ===
+
+    def start(self):
+        """启动常驻线程并在后台预加载模块，之后用 resume()/pause() 控制导航"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="NavigationEngine", daemon=True)
+            self._thread.start()
+        return self
+
+    def resume(self):
+        """恢复导航 (F9)；上一轮正在收尾时排队，收尾结束后开始新一轮"""
+        with self._state_lock:
+            if self.running:
+                if self._pause_event.is_set():
+                    self._requested_at = time.perf_counter()
+                    self._run_id = getattr(self.telemetry, "run_id", None)
+                    self._resume_pending = True
+                return
+            self._requested_at = time.perf_counter()
+            self._run_id = getattr(self.telemetry, "run_id", None)
+            self._pause_event.clear()
+            self.running = True
+            self._resume_event.set()
+
+    def pause(self):
+        """暂停导航 (F10)，松开按键但保留已加载的模块；同时取消排队中的恢复"""
+        with self._state_lock:
+            self._resume_pending = False
+            self._pause_event.set()
+
+    def _worker(self):
+        if self.profiler is not None:
+            self.profiler.attach()
+        try:
+            self.load()
+        except Exception as e:
+            print(f"导航引擎加载失败: {e}")
+
+        while True:
+            self._resume_event.wait()
+            self._resume_event.clear()
+            if self._shutdown:
+                break
+            run_id = self._run_id
+            try:
+                self.run(self._pause_event, requested_at=self._requested_at)
+            except Exception as e:
+                print(f"运行出错: {e}")
+            finally:
+                with self._state_lock:
+                    restart = self._resume_pending and not self._shutdown
+                    self._resume_pending = False
+                    if restart:
+                        # 收尾期间已请求恢复：保持运行状态，直接开始下一轮 (不发停止事件，界面仍显示运行中)
+                        self._pause_event.clear()
+                        self._resume_event.set()
+                    else:
+                        self.running = False
+                if not restart and self.telemetry is not None:
+                    self.telemetry.emit("stop", run=run_id)
+        self.close()
+
+    def shutdown(self, timeout=5.0):
+        """结束常驻线程并释放资源"""
+        self._shutdown = True
+        self._pause_event.set()
+        self._resume_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        """松开所有按键并关闭输入线程、导出线程和采样钩子 (先松键，确保窗口清理失败也不会卡键)"""
+        if self.ctrl is not None:
+            self.ctrl.close()
+        if self.profiler is not None:
+            self.profiler.detach()
+        if self.exporter is not None:
+            self.exporter.stop()
+        cv2.destroyAllWindows()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序独立进程导航引擎
+在子进程中运行导航主循环，避免与 Tk 和全局热键争抢 GIL；
+画面和遥测经 multiprocessing.shared_memory 环形缓冲区传给界面进程，控制指令走管道
+"""
+
+import multiprocessing as mp
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core.metrics import PerfMonitor
+from core.profiler import ProfilerHook
+from core.telemetry import make_status_callback
+
+
+# 共享画面环形缓冲区的槽位数和画面尺寸 (与 main.DATASET_WIDTH/HEIGHT 一致)
+FRAME_SLOTS = 4
+FRAME_SHAPE = (360, 640, 3)
+# 遥测环形缓冲区的槽位数 (每个槽位记录一次指标更新)
+TELEMETRY_SLOTS = 4096
+# 可经共享内存发布的数值指标，按下标编码
+TELEMETRY_KEYS = ("score", "thresh", "frame_ts", "misses", "blind", "first_action")
+TELEMETRY_DTYPE = np.dtype([("seq", "<i8"), ("key", "<i4"), ("value", "<f8")])
+# 子进程向界面进程同步阶段计时累计值的间隔 (秒)
+PERF_SYNC_INTERVAL = 0.5
+
+
+def frame_dtype(shape=FRAME_SHAPE):
+    """画面槽位的记录类型"""
+    return np.dtype([("seq", "<i8"), ("ts", "<f8"), ("frame", "u1", shape)])
+
+
+class SharedRing:
+    """
+    单写多读的共享内存环形缓冲区
+    头部记录已写入的总条数；每个槽位带序号，读取后校验序号，
+    被写入方覆盖的槽位 (读者落后超过一圈或读到一半被改写) 计为丢失
+    """
+
+    HEADER_BYTES = 64
+
+    def __init__(self, dtype, slots, name=None, create=False):
+        """
+        Args:
+            dtype: 槽位的 numpy 结构化类型，必须包含 int64 字段 "seq"
+            slots: 槽位数
+            name: 共享内存名称，连接已有缓冲区时必填
+            create: 为 True 时新建共享内存
+        """
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        size = self.HEADER_BYTES + self.dtype.itemsize * slots
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._head = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self._data = np.ndarray((slots,), dtype=self.dtype, buffer=self.shm.buf, offset=self.HEADER_BYTES)
+        if create:
+            self._head[0] = 0
+            self._data["seq"] = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        return int(self._head[0])
+
+    def write(self, **fields):
+        """写入一条记录 (只能由唯一的写入方调用)，返回记录序号"""
+        seq = int(self._head[0])
+        slot = seq % self.slots
+        # 先作废槽位序号，写完数据再填入新序号，读者据此识别写到一半的槽位
+        self._data["seq"][slot] = -1
+        for field, value in fields.items():
+            self._data[field][slot] = value
+        self._data["seq"][slot] = seq
+        self._head[0] = seq + 1
+        return seq
+
+    def read_since(self, cursor):
+        """
+        读取 cursor 之后的全部记录
+
+        Returns:
+            tuple: (记录列表, 新游标, 丢失条数)
+        """
+        head = int(self._head[0])
+        dropped = 0
+        if head - cursor > self.slots:
+            dropped = head - self.slots - cursor
+            cursor = head - self.slots
+        records = []
+        for seq in range(cursor, head):
+            record = self._data[seq % self.slots].copy()
+            if record["seq"] != seq:
+                dropped += 1
+                continue
+            records.append(record)
+        return records, head, dropped
+
+    def latest(self):
+        """读取最新一条记录的副本，缓冲区为空或恰好被改写时返回 None"""
+        head = int(self._head[0])
+        if head == 0:
+            return None
+        slot = (head - 1) % self.slots
+        record = self._data[slot].copy()
+        if record["seq"] != head - 1 or self._data["seq"][slot] != head - 1:
+            return None
+        return record
+
+    def close(self):
+        # 先释放 numpy 视图，否则 SharedMemory.close 会因缓冲区仍被引用而失败
+        self._head = None
+        self._data = None
+        self.shm.close()
+
+    def unlink(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedTelemetryWriter:
+    """
+    子进程内的遥测写入端，接口与 TelemetryChannel 相同：
+    数值指标逐条写入共享内存环形缓冲区，离散事件经管道发送
+    """
+
+    def __init__(self, ring, conn, send_lock):
+        self.ring = ring
+        self.conn = conn
+        self.send_lock = send_lock
+        self._key_index = {name: i for i, name in enumerate(TELEMETRY_KEYS)}
+
+    def publish(self, **metrics):
+        for name, value in metrics.items():
+            key = self._key_index.get(name)
+            if key is None:
+                continue  # 只有约定的数值指标走共享内存
+            self.ring.write(key=key, value=float(value))
+
+    def emit(self, event_type, **payload):
+        payload.setdefault("ts", time.time())
+        with self.send_lock:
+            self.conn.send(("event", event_type, payload))
+
+
+class RemotePerfView:
+    """界面进程中的阶段计时视图，提供与 PerfMonitor.totals() 相同的读取接口"""
+
+    def __init__(self):
+        self._totals = {}
+
+    def update(self, totals):
+        self._totals = totals
+
+    def totals(self):
+        return dict(self._totals)
+
+
+def _control_loop(conn, stop_event, profiler):
+    """子进程的控制指令线程"""
+    while not stop_event.is_set():
+        try:
+            command = conn.recv()
+        except (EOFError, OSError):
+            # 界面进程已退出：停止导航，松开按键
+            stop_event.set()
+            return
+        if command == "stop":
+            stop_event.set()
+        elif command == "profile":
+            profiler.toggle()
+
+
+def _perf_sync_loop(conn, send_lock, perf, stop_event):
+    """子进程定时把阶段计时累计值发给界面进程 (不占用导航线程)"""
+    while not stop_event.wait(PERF_SYNC_INTERVAL):
+        try:
+            with send_lock:
+                conn.send(("perf", perf.totals()))
+        except (BrokenPipeError, OSError):
+            return
+
+
+def _engine_main(conn, frame_ring_name, telemetry_ring_name, frame_shape, target, target_kwargs):
+    """子进程入口"""
+    frames = SharedRing(frame_dtype(frame_shape), FRAME_SLOTS, name=frame_ring_name)
+    telemetry_ring = SharedRing(TELEMETRY_DTYPE, TELEMETRY_SLOTS, name=telemetry_ring_name)
+    send_lock = threading.Lock()
+    writer = SharedTelemetryWriter(telemetry_ring, conn, send_lock)
+    stop_event = threading.Event()
+    perf = PerfMonitor()
+    profiler = ProfilerHook()
+
+    threading.Thread(target=_control_loop, args=(conn, stop_event, profiler),
+                     name="EngineControl", daemon=True).start()
+    threading.Thread(target=_perf_sync_loop, args=(conn, send_lock, perf, stop_event),
+                     name="EnginePerfSync", daemon=True).start()
+
+    def frame_sink(frame):
+        if frame.shape == frame_shape:
+            frames.write(ts=time.time(), frame=frame)
+
+    try:
+        target(stop_event, make_status_callback(writer), perf=perf, profiler=profiler,
+               telemetry=writer, frame_sink=frame_sink, **target_kwargs)
+    except Exception:
+        with send_lock:
+            conn.send(("error", traceback.format_exc()))
+    finally:
+        stop_event.set()
+        try:
+            with send_lock:
+                conn.send(("perf", perf.totals()))
+                conn.send(("event", "stop", {"ts": time.time()}))
+        except (BrokenPipeError, OSError):
+            pass
+        frames.close()
+        telemetry_ring.close()
+
+
+class EngineProcess:
+    """
+    界面进程中的子进程引擎句柄
+    poll() 由界面定时调用：把共享内存中的指标和管道中的事件转发到本地 TelemetryChannel，
+    并检测子进程退出 (包括崩溃)；子进程退出后自动回收共享内存
+    """
+
+    def __init__(self, telemetry, target=None, target_kwargs=None, frame_shape=FRAME_SHAPE):
+        """
+        Args:
+            telemetry: 界面进程的 TelemetryChannel
+            target: 子进程中运行的主循环，签名与 main.main_loop 相同；为 None 时使用 main_loop
+            target_kwargs: 传给 target 的额外关键字参数 (必须可 pickle)
+            frame_shape: 共享画面的尺寸 (高, 宽, 通道)
+        """
+        if target is None:
+            from main import main_loop
+            target = main_loop
+        self.telemetry = telemetry
+        self.target = target
+        self.target_kwargs = target_kwargs or {}
+        self.frame_shape = tuple(frame_shape)
+        self.perf = RemotePerfView()
+        self.stats = {"telemetry_dropped": 0, "exitcode": None}
+        # 本次运行的编号：转发的事件都带上它，界面据此忽略上一个子进程迟到的事件
+        self.run_id = getattr(telemetry, "run_id", None)
+        self.process = None
+        self._conn = None
+        self._frames = None
+        self._telemetry_ring = None
+        self._cursor = 0
+        self._stopped = False
+
+    @property
+    def running(self):
+        return self.process is not None and not self._stopped
+
+    def start(self):
+        self._frames = SharedRing(frame_dtype(self.frame_shape), FRAME_SLOTS, create=True)
+        self._telemetry_ring = SharedRing(TELEMETRY_DTYPE, TELEMETRY_SLOTS, create=True)
+        # 与 Windows 默认行为一致，统一使用 spawn，子进程不继承界面进程的线程和热键钩子
+        ctx = mp.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_engine_main,
+            args=(child_conn, self._frames.name, self._telemetry_ring.name, self.frame_shape,
+                  self.target, self.target_kwargs),
+            name="NavigationEngine", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        print(f"导航引擎子进程已启动 (pid={self.process.pid})")
+        return self
+
+    def _send(self, command):
+        try:
+            self._conn.send(command)
+        except (BrokenPipeError, OSError):
+            pass
+
+    def request_stop(self):
+        """请求子进程停止 (不阻塞，退出后由 poll() 回收)"""
+        if self.running:
+            self._send("stop")
+
+    def toggle_profile(self):
+        """开始/提前结束子进程导航线程的性能采样"""
+        if self.running:
+            self._send("profile")
+
+    def latest_frame(self):
+        """
+        读取子进程最新发布的画面
+
+        Returns:
+            tuple: (时间戳, 画面副本)，尚无画面时返回 None
+        """
+        if self._frames is None:
+            return None
+        record = self._frames.latest()
+        if record is None:
+            return None
+        return float(record["ts"]), record["frame"]
+
+    def poll(self):
+        """
+        转发遥测并检测子进程状态
+
+        Returns:
+            bool: 子进程是否仍在运行
+        """
+        if self.process is None or self._stopped:
+            return False
+
+        stop_seen = False
+        try:
+            while self._conn.poll():
+                message = self._conn.recv()
+                if message[0] == "event":
+                    _, event_type, payload = message
+                    if event_type == "stop":
+                        stop_seen = True
+                    else:
+                        payload["run"] = self.run_id
+                        self.telemetry.emit(event_type, **payload)
+                elif message[0] == "perf":
+                    self.perf.update(message[1])
+                elif message[0] == "error":
+                    print(f"导航引擎出错:\n{message[1]}")
+        except (EOFError, OSError):
+            stop_seen = True
+
+        self._drain_telemetry()
+
+        if stop_seen or not self.process.is_alive():
+            self._finish()
+            return False
+        return True
+
+    def _drain_telemetry(self):
+        records, self._cursor, dropped = self._telemetry_ring.read_since(self._cursor)
+        self.stats["telemetry_dropped"] += dropped
+        for record in records:
+            name = TELEMETRY_KEYS[record["key"]]
+            value = float(record["value"])
+            if name == "misses":
+                value = int(value)
+            elif name == "blind":
+                value = bool(value)
+            self.telemetry.publish(**{name: value})
+
+    def _finish(self, timeout=5.0):
+        """回收子进程和共享内存，并向界面发出停止事件"""
+        self.process.join(timeout)
+        if self.process.is_alive():
+            print("导航引擎未按时退出，强制结束")
+            self.process.terminate()
+            self.process.join(1.0)
+        self.stats["exitcode"] = self.process.exitcode
+        if self.process.exitcode not in (0, None):
+            print(f"导航引擎异常退出 (exitcode={self.process.exitcode})")
+        self._stopped = True
+        self._conn.close()
+        for ring in (self._frames, self._telemetry_ring):
+            ring.close()
+            ring.unlink()
+        self._frames = None
+        self.telemetry.emit("stop", exitcode=self.process.exitcode, run=self.run_id)
+
+    def stop(self, timeout=5.0):
+        """请求停止并阻塞等待子进程退出 (用于脚本和程序退出时)"""
+        if not self.running:
+            return
+        self.request_stop()
+        deadline = time.time() + timeout
+        while self.poll() and time.time() < deadline:
+            time.sleep(0.05)
+        if not self._stopped:
+            self._finish(timeout=0)
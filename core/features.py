@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序路点特征模块
+导航匹配使用的 ORB 特征参数，以及路点特征的持久化：
+提取关键帧时把导航同款特征写到数据集的 features/ 目录，运行时直接加载，省去读图和特征提取
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from core.ui_mask import fit_mask, mask_signature
+
+
+# 与 SkyNavigator 的匹配参数保持一致，修改时持久化的特征会因参数不符自动失效
+ORB_NFEATURES = 1500
+CANNY_LOW = 20
+CANNY_HIGH = 60
+MATCH_MAX_DISTANCE = 60
+
+FEATURE_DIR = "features"
+
+
+def create_orb():
+    """导航使用的 ORB：1500 个特征点，FAST_SCORE 对边缘图更敏感"""
+    return cv2.ORB_create(nfeatures=ORB_NFEATURES, scoreType=cv2.ORB_FAST_SCORE)
+
+
+def edge_map(gray):
+    """导航使用的 Canny 边缘图 (低阈值，淡的云彩轮廓也能提取出来)"""
+    return cv2.Canny(gray, CANNY_LOW, CANNY_HIGH)
+
+
+def select_good_matches(matcher, target_des, screen_des):
+    """
+    导航的匹配筛选：交叉验证的匹配按距离排序，取前 15% 且距离小于 MATCH_MAX_DISTANCE 的点
+    (边缘图上的匹配容错率要低一点)
+
+    Returns:
+        list: cv2.DMatch 列表，queryIdx 对应目标图，trainIdx 对应屏幕画面
+    """
+    matches = sorted(matcher.match(target_des, screen_des), key=lambda x: x.distance)
+    return [m for m in matches[:int(len(matches) * 0.15)] if m.distance < MATCH_MAX_DISTANCE]
+
+
+def match_similarity(good_matches):
+    """导航的匹配度：1 - 优质匹配的平均汉明距离 / 80，不低于 0 (分母适应边缘特征)"""
+    avg_dist = np.mean([m.distance for m in good_matches])
+    return max(0, 1 - (avg_dist / 80.0))
+
+
+def navigation_score(matcher, target_des, screen_des):
+    """
+    与 SkyNavigator.calculate_offset 相同的匹配度 (含特征太少、匹配太少时的 0 分)，用于离线评估
+
+    Returns:
+        float: 匹配度 (0.0 - 1.0)
+    """
+    if target_des is None or screen_des is None or len(screen_des) < 5:
+        return 0.0
+    good_matches = select_good_matches(matcher, target_des, screen_des)
+    if len(good_matches) < 4:
+        return 0.0
+    return float(match_similarity(good_matches))
+
+
+def feature_params(preprocess="edge", mask=None):
+    """
+    特征的参数签名，用于判断持久化的特征是否还能用
+
+    Args:
+        preprocess: 预处理方式 (edge / clahe / gray)
+        mask: 检测特征点时使用的 UI 遮罩，为 None 时签名与不带遮罩的旧特征文件一致
+    """
+    params = [ORB_NFEATURES, cv2.ORB_FAST_SCORE, CANNY_LOW, CANNY_HIGH, ("edge", "clahe", "gray").index(preprocess)]
+    if mask is not None:
+        params.append(mask_signature(mask))
+    return np.array(params, dtype=np.int64)
+
+
+def feature_path(dataset_path, img_name):
+    """路点图片对应的特征文件路径：<数据集>/features/<图片名>.npz"""
+    return os.path.join(dataset_path, FEATURE_DIR, os.path.splitext(img_name)[0] + ".npz")
+
+
+def save_features(path, keypoints, descriptors, preprocess="edge", mask=None):
+    """
+    保存特征点和描述符
+
+    Args:
+        path: 特征文件路径
+        keypoints: cv2.KeyPoint 列表
+        descriptors: ORB 描述符 (N x 32 uint8)，可为 None
+        preprocess: 计算特征时使用的预处理方式
+        mask: 计算特征时使用的 UI 遮罩
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    points = np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+                       for kp in keypoints], dtype=np.float32).reshape(-1, 7)
+    if descriptors is None:
+        descriptors = np.zeros((0, 32), dtype=np.uint8)
+    np.savez(path, keypoints=points, descriptors=descriptors, params=feature_params(preprocess, mask))
+
+
+def load_features(path, preprocess="edge", source=None, mask=None):
+    """
+    加载特征点和描述符
+
+    Args:
+        path: 特征文件路径
+        preprocess: 运行时的预处理方式，与保存时不一致则视为失效
+        source: 可选，对应的图片路径；图片比特征文件新 (被替换过) 时视为失效
+        mask: 运行时使用的 UI 遮罩 (与图片同分辨率)，与保存时不一致则视为失效
+
+    Returns:
+        tuple: (cv2.KeyPoint 列表, 描述符)，文件不存在或已失效时返回 None
+    """
+    if not os.path.exists(path):
+        return None
+    if source is not None and os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if not np.array_equal(data["params"], feature_params(preprocess, mask)):
+                return None
+            points = data["keypoints"]
+            descriptors = data["descriptors"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"特征文件读取失败，改为重新提取: {path} ({e})")
+        return None
+    keypoints = [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response),
+                              int(octave), int(class_id))
+                 for x, y, size, angle, response, octave, class_id in points]
+    return keypoints, (descriptors if len(descriptors) else None)
+
+
+def compute_features(img, orb=None, preprocess="edge", mask=None):
+    """
+    按导航的方式计算一张路点图片的特征
+
+    Args:
+        img: BGR 或灰度图
+        orb: 可选的 ORB 实例，默认用 create_orb()
+        preprocess: edge / clahe / gray
+        mask: 可选的 UI 遮罩，只在可用区域检测特征点 (分辨率不同时自动缩放)
+
+    Returns:
+        tuple: (特征点, 描述符)
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    if preprocess == "edge":
+        gray = edge_map(gray)
+    elif preprocess == "clahe":
+        gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    if mask is not None:
+        mask = fit_mask(mask, gray.shape[1], gray.shape[0])
+    return (orb or create_orb()).detectAndCompute(gray, mask)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序输入后端模块
+抽象底层键鼠接口 (pydirectinput / 录制桩)，并提供带合并功能的独立输入线程
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class InputBackend:
+    """输入后端接口：所有键鼠操作最终都经过这四个方法"""
+
+    name = "base"
+
+    def move_rel(self, dx, dy):
+        raise NotImplementedError
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+    def press(self, key):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyDirectInputBackend(InputBackend):
+    """基于 pydirectinput 的真实输入后端 (仅 Windows)"""
+
+    name = "pydirectinput"
+
+    def __init__(self, pause=0.001):
+        import pydirectinput
+        # 库内部在每次调用后 sleep(PAUSE)
+        pydirectinput.PAUSE = pause
+        self._pdi = pydirectinput
+
+    def move_rel(self, dx, dy):
+        self._pdi.moveRel(dx, dy, relative=True)
+
+    def key_down(self, key):
+        self._pdi.keyDown(key)
+
+    def key_up(self, key):
+        self._pdi.keyUp(key)
+
+    def press(self, key):
+        self._pdi.press(key)
+
+
+class RecordingBackend(InputBackend):
+    """
+    录制桩后端：不产生真实输入，只记录事件
+    可在 Linux / 无游戏环境下运行回放、基准测试
+    """
+
+    name = "recording"
+
+    def __init__(self):
+        self.events = []   # [(时间戳, 指令, 参数)]
+
+    def move_rel(self, dx, dy):
+        self.events.append((time.perf_counter(), "move_rel", (dx, dy)))
+
+    def key_down(self, key):
+        self.events.append((time.perf_counter(), "key_down", (key,)))
+
+    def key_up(self, key):
+        self.events.append((time.perf_counter(), "key_up", (key,)))
+
+    def press(self, key):
+        self.events.append((time.perf_counter(), "press", (key,)))
+
+
+def create_default_backend(pause=0.001):
+    """
+    创建默认输入后端：优先使用 pydirectinput，不可用时退回录制桩
+
+    Args:
+        pause: pydirectinput 的 PAUSE 延迟 (秒)
+    """
+    try:
+        return PyDirectInputBackend(pause)
+    except ImportError as e:
+        print(f"警告：pydirectinput 不可用 ({e})，使用录制桩后端，不会产生真实输入")
+        return RecordingBackend()
+
+
+class InputDispatcher:
+    """
+    独立输入线程
+    视觉循环只负责入队，真正的系统调用 (及其 PAUSE 延迟) 在本线程中执行。
+    只与队尾尚未派发的同类指令合并，保证指令之间的先后顺序不变：
+    - 队尾是相对鼠标移动时，新的移动累加到它上面
+    - 队尾是同一按键的同一状态切换时，重复的 key_down/key_up 丢弃；
+      相反的切换 (如尚未派发的 key_down 之后的 key_up) 照常排队，短按不会丢失
+    - press 保留，不合并
+    """
+
+    def __init__(self, backend, perf=None):
+        """
+        Args:
+            backend: InputBackend 实例
+            perf: 可选的 PerfMonitor，记录指令从入队到派发的延迟 (input_dispatch)
+        """
+        self.backend = backend
+        self.perf = perf
+        self.stats = {"submitted": 0, "dispatched": 0, "coalesced": 0, "dropped": 0}
+        self._pending = deque()   # [指令, 参数列表, 入队时间]
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="InputDispatcher", daemon=True)
+        self._thread.start()
+
+    # === 与 InputBackend 相同的接口 ===
+
+    def move_rel(self, dx, dy):
+        with self._cond:
+            self.stats["submitted"] += 1
+            if self._pending and self._pending[-1][0] == "move_rel":
+                tail = self._pending[-1][1]
+                tail[0] += dx
+                tail[1] += dy
+                self.stats["coalesced"] += 1
+                return
+            self._submit("move_rel", [dx, dy])
+
+    def key_down(self, key):
+        self._set_key("key_down", key)
+
+    def key_up(self, key):
+        self._set_key("key_up", key)
+
+    def press(self, key):
+        with self._cond:
+            self.stats["submitted"] += 1
+            self._submit("press", [key])
+
+    # === 队列管理 ===
+
+    def _set_key(self, command, key):
+        with self._cond:
+            self.stats["submitted"] += 1
+            if self._pending and self._pending[-1][0] == command and self._pending[-1][1][0] == key:
+                self.stats["dropped"] += 1
+                return
+            self._submit(command, [key])
+
+    def _submit(self, command, args):
+        self._pending.append([command, args, time.perf_counter()])
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                command, args, queued_at = self._pending.popleft()
+                self._busy = True
+            # 正负移动合并后互相抵消时无需派发
+            dispatched = not (command == "move_rel" and args[0] == 0 and args[1] == 0)
+            if dispatched:
+                if self.perf is not None:
+                    self.perf.record("input_dispatch", time.perf_counter() - queued_at)
+                try:
+                    getattr(self.backend, command)(*args)
+                except Exception as e:
+                    print(f"输入指令执行失败 {command}{tuple(args)}: {e}")
+            with self._cond:
+                self._busy = False
+                if dispatched:
+                    self.stats["dispatched"] += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout=1.0):
+        """等待队列中的指令全部派发完成"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """派发完剩余指令后结束输入线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+        self.backend.close()
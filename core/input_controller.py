@@ -5,80 +5,179 @@
 封装底层键鼠操作，加入PID控制算法
 """
 
-import pydirectinput
 import time
 import threading
+from core.input_backend import InputDispatcher, create_default_backend
+from core.pid_controller import PIDController
 
 
 class InputController:
-    def __init__(self):
-        pydirectinput.PAUSE = 0.001  # 降低库内部延迟
+    def __init__(self, backend=None, perf=None, threaded=True):
+        """
+        Args:
+            backend: InputBackend 实例，默认使用 pydirectinput (PAUSE=0.001)
+            perf: 可选的 PerfMonitor，记录输入指令的派发延迟
+            threaded: 为 True 时由独立输入线程派发指令，视觉循环不再承担 PAUSE 延迟
+        """
+        if backend is None:
+            backend = create_default_backend(pause=0.001)  # 降低库内部延迟
+        self.backend = backend
+        # 实际发出指令的对象：输入线程或直接调用后端
+        self.input = InputDispatcher(backend, perf) if threaded else backend
         self.screen_width = 1920     # 根据屏幕分辨率调整
         self.screen_height = 1080
         
-        # PID 控制参数 (需要调试)
-        # P (比例): 偏差越大，修正越快
-        self.kp = 0.5
-        # 死区: 偏差小于这个值时不移动，防止抖动
-        self.deadzone = 15
+        # PID 控制参数 (参数由 pid_benchmark.py 离线仿真标定)
+        # P (比例): 偏差越大，修正越快；I (积分): 抵消角色前进造成的持续漂移；
+        # D (微分): 抑制视角惯性带来的过冲
+        # 死区: 偏差小于 15 时不移动，防止抖动；单次移动限幅 ±50，防止甩飞
+        self.pid = PIDController(kp=0.6, ki=0.6, kd=0.02, output_limit=50, deadzone=15)
+        
+        # 可选的 RunRecorder，记录发出的每条输入指令
+        self.recorder = None
+        
+        # 按键状态：记录经本控制器按下的键，只有真正的状态切换才发出系统调用。
+        # 这里只跟踪自己发出的指令，看不到系统里的真实按键状态：用户手动松开、窗口失焦等外部原因
+        # 造成的松开无法察觉，之后的 move_forward() 会被当作重复调用省掉；
+        # 需要重新同步时调用 release_all() 清空状态 (每轮导航结束时都会调用)
+        self.keys_down = set()
+        self._key_lock = threading.Lock()
+        self.key_stats = {"sent": 0, "suppressed": 0}
+        # 最近一次真正发出输入指令的时间 (perf_counter)，用于统计启动后的首次动作耗时
+        self.last_action_ts = None
+
+    def _move_rel(self, dx, dy):
+        if self.recorder is not None:
+            self.recorder.record_input("move_rel", dx, dy)
+        self.input.move_rel(dx, dy)
+        self.last_action_ts = time.perf_counter()
 
-    def align_camera(self, offset_x):
+    def _key_down(self, key):
+        with self._key_lock:
+            if key in self.keys_down:
+                self.key_stats["suppressed"] += 1
+                return
+            self.keys_down.add(key)
+            self.key_stats["sent"] += 1
+            if self.recorder is not None:
+                self.recorder.record_input("key_down", key)
+            self.input.key_down(key)
+            self.last_action_ts = time.perf_counter()
+
+    def _key_up(self, key):
+        with self._key_lock:
+            if key not in self.keys_down:
+                self.key_stats["suppressed"] += 1
+                return
+            self.keys_down.discard(key)
+            self.key_stats["sent"] += 1
+            if self.recorder is not None:
+                self.recorder.record_input("key_up", key)
+            self.input.key_up(key)
+            self.last_action_ts = time.perf_counter()
+
+    def _press(self, key):
+        if self.recorder is not None:
+            self.recorder.record_input("press", key)
+        self.input.press(key)
+        self.last_action_ts = time.perf_counter()
+
+    def align_camera(self, offset_x, similarity=None):
         """
         根据视觉偏差调整视角
         offset_x > 0: 目标在右，鼠标向右移
         offset_x < 0: 目标在左，鼠标向左移
+        similarity: 本帧匹配度，用于增益调度；为 0 时视为无有效测量
         """
-        if abs(offset_x) < self.deadzone:
-            return
+        move_x = self.pid.update(offset_x, similarity)
+        if move_x:
+            self._move_rel(move_x, 0)
 
-        # 简单的 P 控制器
-        # 限制单次最大移动量，防止甩飞
-        move_x = int(offset_x * self.kp)
-        move_x = max(min(move_x, 50), -50)
-        
-        pydirectinput.moveRel(move_x, 0, relative=True)
+    def center_camera(self, offset_x, similarity=None):
+        """
+        静止时把视角对正一步 (初始校准用，每步之后等画面稳定再测量)
+        只用 PID 的比例项，不经过按帧间隔积分的 update：校准每 0.5s 以上才测一次，超过 max_dt，
+        走 update 会每次都被当作新一轮对准而清空状态
+        """
+        move_x = self.pid.proportional(offset_x, similarity)
+        if move_x:
+            self._move_rel(move_x, 0)
+
+    def rotate(self, dx):
+        """直接旋转视角 dx (不经过 PID，用于原地搜索)"""
+        self.pid.reset()
+        self._move_rel(dx, 0)
 
     def move_forward(self, duration=None):
         """按住W前进"""
         if duration:
-            pydirectinput.keyDown('w')
+            self._key_down('w')
             time.sleep(duration)
-            pydirectinput.keyUp('w')
+            self._key_up('w')
         else:
-            # 持续按住模式（需要在主循环外部管理状态）
-            pydirectinput.keyDown('w')
+            # 持续按住模式：可每帧调用，已按下时不会重复发送 (只知道本控制器的按键状态，见 keys_down)
+            self._key_down('w')
 
     def stop_moving(self):
         """停止前进"""
-        pydirectinput.keyUp('w')
+        self._key_up('w')
+
+    def is_key_down(self, key):
+        """查询按键当前是否处于按下状态"""
+        return key in self.keys_down
 
     def jump(self):
         """跳跃"""
-        pydirectinput.press('space')
+        self._press('space')
         
     def fly_toggle(self):
         """切换飞行模式"""
-        pydirectinput.press('space') # 根据键位配置调整
+        self._press('space') # 根据键位配置调整
         
     def interact(self):
         """交互动作（点火、点蜡烛等）"""
-        pydirectinput.press('e')
+        self._press('e')
         
     def move_left(self):
         """按住A向左移动"""
-        pydirectinput.keyDown('a')
+        self._key_down('a')
         
     def move_right(self):
         """按住D向右移动"""
-        pydirectinput.keyDown('d')
+        self._key_down('d')
+
+    def stop_left(self):
+        """松开A"""
+        self._key_up('a')
+
+    def stop_right(self):
+        """松开D"""
+        self._key_up('d')
         
     def move_backward(self):
         """按住S向后移动"""
-        pydirectinput.keyDown('s')
+        self._key_down('s')
         
     def stop_all_movement(self):
-        """停止所有移动"""
-        pydirectinput.keyUp('w')
-        pydirectinput.keyUp('a')
-        pydirectinput.keyUp('s')
-        pydirectinput.keyUp('d')
\ No newline at end of file
+        """停止所有移动 (只松开确实按下的键)"""
+        for key in ('w', 'a', 's', 'd'):
+            self._key_up(key)
+
+    def release_all(self):
+        """原子地松开所有按下的键，期间其他线程不能再按下新键"""
+        with self._key_lock:
+            keys = sorted(self.keys_down)
+            self.keys_down.clear()
+            for key in keys:
+                self.key_stats["sent"] += 1
+                if self.recorder is not None:
+                    self.recorder.record_input("key_up", key)
+                self.input.key_up(key)
+        return keys
+
+    def close(self):
+        """松开所有按键，派发完剩余指令并关闭输入线程"""
+        self.release_all()
+        self.input.close()
+        print(f"按键状态跟踪：发送 {self.key_stats['sent']} 次按键指令，"
+              f"省去 {self.key_stats['suppressed']} 次重复调用")
\ No newline at end of file
@@ -5,19 +5,22 @@
 实现窗口焦点控制和启动自检程序
 """
 
-import pydirectinput
 import time
 import random
 import pygetwindow as gw
 import win32gui
 import win32con
+from core.input_backend import create_default_backend
+from core.input_scheduler import InputTimeline, TimelineScheduler
 
 
 class InputManager:
-    def __init__(self, window_title="Sky"):
+    def __init__(self, window_title="Sky", backend=None):
         # 极低延迟，防止操作卡顿
-        pydirectinput.PAUSE = 0.005  
+        self.backend = backend if backend is not None else create_default_backend(pause=0.005)
         self.window_title = window_title
+        # 键鼠序列由调度线程按时间线派发，避免 sleep 链受系统定时器粒度影响
+        self.scheduler = TimelineScheduler(self.backend)
         
     def focus_game_window(self):
         """
@@ -56,15 +59,15 @@ class InputManager:
 
         time.sleep(1) # 等待窗口切换完成
 
+        timeline = InputTimeline()
+        t = 0.0
+
         # 2. 测试视角旋转 (模拟鼠标向右持续移动)
-        print("测试：旋转视角 (360度)...")
+        timeline.call(t, lambda: print("测试：旋转视角 (360度)..."))
         # 在3D游戏中，鼠标通常被锁定在中心，需要多次相对移动
-        for _ in range(50):
-            # X轴移动 30 像素 (向右)，Y轴 0
-            pydirectinput.moveRel(30, 0, relative=True)
-            time.sleep(0.02)
-        
-        time.sleep(0.5)
+        # X轴每 20ms 移动 30 像素 (向右)，共 50 次，Y轴 0
+        timeline.mouse_path(t, 30 * 50, 0, steps=50, interval=0.02)
+        t += 50 * 0.02 + 0.5
 
         # 3. 测试移动 (WASD)
         moves = [
@@ -75,12 +78,13 @@ class InputManager:
         ]
 
         for key, action in moves:
-            print(f"测试：{action}移动 (3秒)...")
-            pydirectinput.keyDown(key)
-            time.sleep(3)
-            pydirectinput.keyUp(key)
-            time.sleep(0.5) # 缓冲
+            timeline.call(t, lambda action=action: print(f"测试：{action}移动 (3秒)..."))
+            timeline.hold(t, key, 3)
+            t += 3 + 0.5 # 缓冲
 
+        summary = self.scheduler.run(timeline)
+        print(f"时间线误差: 平均 {summary['mean_abs'] * 1000:.2f} ms, "
+              f"最大 {summary['max_abs'] * 1000:.2f} ms ({summary['events']} 个事件)")
         print(">>> 自检完成 <<<")
 
     def random_sleep(self, base_time, variance=0.1):
@@ -91,12 +95,20 @@ class InputManager:
         if actual_time < 0: actual_time = 0
         time.sleep(actual_time)
 
-    def move_mouse_smooth(self, x_offset, y_offset):
+    def move_mouse_smooth(self, x_offset, y_offset, wait=True):
         """
         平滑移动鼠标，避免抖动
+        
+        Args:
+            x_offset: 水平移动量
+            y_offset: 垂直移动量
+            wait: 是否等待移动完成
+            
+        Returns:
+            dict: wait 为 True 时返回每步派发误差的汇总，否则返回执行报告
         """
-        # 简单的分步移动
-        steps = 5
-        for _ in range(steps):
-            pydirectinput.moveRel(int(x_offset/steps), int(y_offset/steps), relative=True)
-            time.sleep(0.005)
+        # 简单的分步移动：5 步，每步间隔 5ms
+        timeline = InputTimeline().mouse_path(0.0, x_offset, y_offset, steps=5, interval=0.005)
+        if wait:
+            return self.scheduler.run(timeline)
+        return self.scheduler.submit(timeline)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序输入时间线调度模块
+按时间线在单个线程中派发键鼠事件，使用"休眠 + 自旋"混合等待绕开系统定时器粒度
+"""
+
+import queue
+import threading
+import time
+
+
+class InputTimeline:
+    """
+    输入事件时间线
+    每个事件为 (相对开始的时间(秒), 指令, 参数)，指令与 InputBackend 的方法同名，
+    另有 "call" 指令用于在指定时间执行回调 (例如打印进度)
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def add(self, at, command, *args):
+        self.events.append((at, command, args))
+        return self
+
+    def move(self, at, dx, dy):
+        return self.add(at, "move_rel", dx, dy)
+
+    def key_down(self, at, key):
+        return self.add(at, "key_down", key)
+
+    def key_up(self, at, key):
+        return self.add(at, "key_up", key)
+
+    def press(self, at, key):
+        return self.add(at, "press", key)
+
+    def hold(self, at, key, duration):
+        """在 at 时刻按下 key，持续 duration 秒后松开"""
+        self.key_down(at, key)
+        return self.key_up(at + duration, key)
+
+    def call(self, at, func):
+        return self.add(at, "call", func)
+
+    def mouse_path(self, at, dx, dy, steps, interval):
+        """
+        把一次鼠标移动拆成 steps 步，每步间隔 interval 秒
+        按累计值取整，保证各步之和严格等于 (dx, dy)
+        """
+        sent_x = sent_y = 0
+        for i in range(1, steps + 1):
+            target_x = round(dx * i / steps)
+            target_y = round(dy * i / steps)
+            self.move(at + (i - 1) * interval, target_x - sent_x, target_y - sent_y)
+            sent_x, sent_y = target_x, target_y
+        return self
+
+    @property
+    def duration(self):
+        return max((at for at, _, _ in self.events), default=0.0)
+
+    def sorted_events(self):
+        # 同一时刻的事件保持添加顺序
+        return sorted(self.events, key=lambda e: e[0])
+
+
+def timing_summary(errors):
+    """
+    汇总每个事件的派发误差
+
+    Args:
+        errors: 每个事件的误差 (秒，实际时间 - 计划时间)
+
+    Returns:
+        dict: 事件数、平均/最大绝对误差、p95 绝对误差
+    """
+    if not errors:
+        return {"events": 0, "mean_abs": 0.0, "max_abs": 0.0, "p95_abs": 0.0}
+    abs_errors = sorted(abs(e) for e in errors)
+    return {
+        "events": len(errors),
+        "mean_abs": sum(abs_errors) / len(abs_errors),
+        "max_abs": abs_errors[-1],
+        "p95_abs": abs_errors[min(len(abs_errors) - 1, int(len(abs_errors) * 0.95))],
+    }
+
+
+class TimelineScheduler:
+    """
+    时间线调度器
+    所有时间线在同一个派发线程中按顺序执行；每个事件先 time.sleep 到截止时间前
+    spin_margin 秒，再忙等到截止时间，误差不受系统定时器粒度 (Windows 上常为 15.6ms) 影响。
+    忙等时每轮 time.sleep(0) 让出 GIL，不会让导航线程和界面线程停顿整个余量
+    """
+
+    def __init__(self, backend, spin_margin=None, max_spin_margin=0.02):
+        """
+        Args:
+            backend: InputBackend 实例
+            spin_margin: 自旋等待的时间余量 (秒)，为 None 时自动标定 time.sleep 的超时量
+            max_spin_margin: 自动标定的余量上限，避免占用过多 CPU
+        """
+        self.backend = backend
+        self.spin_margin = spin_margin if spin_margin is not None else self.calibrate(max_spin_margin)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="TimelineScheduler", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def calibrate(max_margin=0.02, samples=5):
+        """测量 time.sleep(1ms) 实际多睡的时间，作为自旋余量"""
+        worst = 0.0
+        for _ in range(samples):
+            start = time.perf_counter()
+            time.sleep(0.001)
+            worst = max(worst, time.perf_counter() - start - 0.001)
+        return min(max(worst * 1.5, 0.0005), max_margin)
+
+    def _wait_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_margin:
+            time.sleep(remaining - self.spin_margin)
+        while time.perf_counter() < deadline:
+            time.sleep(0)  # 让出 GIL 和时间片，只多出微秒级的唤醒延迟
+
+    def submit(self, timeline):
+        """
+        提交一条时间线，立即返回
+
+        Returns:
+            dict: 执行报告，完成后 report["done"] 事件被置位。只统计输入事件 ("call" 回调不计)：
+                  report["errors"] 为每个事件派发完成 (后端调用返回) 时的误差 (秒)，report["summary"] 为其汇总；
+                  report["wake_errors"] 为调度线程醒来、开始派发时的误差，report["wake_summary"] 为其汇总，
+                  二者之差即后端调用本身的耗时
+        """
+        report = {"done": threading.Event(), "errors": [], "summary": None,
+                  "wake_errors": [], "wake_summary": None}
+        self._queue.put((timeline, report))
+        return report
+
+    def run(self, timeline, timeout=None):
+        """
+        提交时间线并等待执行完成
+
+        Returns:
+            dict: 派发完成时的误差汇总
+
+        Raises:
+            TimeoutError: timeout 秒内未执行完 (时间线仍会在派发线程中继续执行)
+        """
+        report = self.submit(timeline)
+        if not report["done"].wait(timeout):
+            raise TimeoutError(f"时间线未在 {timeout}s 内执行完成")
+        return report["summary"]
+
+    def _run(self):
+        while True:
+            timeline, report = self._queue.get()
+            start = time.perf_counter()
+            for at, command, args in timeline.sorted_events():
+                deadline = start + at
+                self._wait_until(deadline)
+                woke = time.perf_counter()
+                try:
+                    if command == "call":
+                        args[0]()
+                    else:
+                        getattr(self.backend, command)(*args)
+                except Exception as e:
+                    print(f"时间线事件执行失败 {command}: {e}")
+                if command != "call":
+                    # 误差记到后端调用返回为止，包含派发本身的耗时 (如 pydirectinput 的 PAUSE)
+                    report["errors"].append(time.perf_counter() - deadline)
+                    report["wake_errors"].append(woke - deadline)
+            report["wake_summary"] = timing_summary(report["wake_errors"])
+            report["summary"] = timing_summary(report["errors"])
+            report["done"].set()
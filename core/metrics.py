@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序性能度量模块
+实现分阶段计时 (span)、HDR 风格对数直方图和定时导出 (JSONL / Prometheus)
+"""
+
+import json
+import os
+import threading
+import time
+
+
+# 每个 2 的幂区间内的线性子桶位数：7 位 -> 相对误差约 1/64 (~1.6%)
+SUB_BUCKET_BITS = 7
+# 直方图以微秒为单位记录，超过上限的值会被截断到上限 (60 秒)
+MAX_TRACKABLE_US = 60 * 1000 * 1000
+
+# 导航主循环中的标准阶段名称
+STAGES = ("capture", "resize", "preprocess", "detect", "match",
+          "score", "control", "callback", "frame")
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数分桶直方图
+    记录只需要一次整数运算和一次数组自增，适合在热路径上常开
+    """
+
+    def __init__(self, max_us=MAX_TRACKABLE_US):
+        self.max_us = max_us
+        self.half = 1 << (SUB_BUCKET_BITS - 1)
+        self.counts = [0] * (self._index(max_us) + 1)
+        self.total_count = 0
+        self.total_sum = 0.0
+        self.max_value = 0.0
+
+    def _index(self, us):
+        """将微秒值映射到桶索引"""
+        shift = us.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            return us
+        return shift * self.half + (us >> shift)
+
+    def _value_at(self, index):
+        """返回桶索引对应区间的中点 (微秒)"""
+        if index < (self.half << 1):
+            return float(index)
+        shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+        sub = index - shift * self.half
+        return float((sub << shift) + ((1 << shift) >> 1))
+
+    def record(self, seconds):
+        """记录一次耗时 (秒)"""
+        us = int(seconds * 1000000)
+        if us < 0:
+            us = 0
+        elif us > self.max_us:
+            us = self.max_us
+        self.counts[self._index(us)] += 1
+        self.total_count += 1
+        self.total_sum += seconds
+        if seconds > self.max_value:
+            self.max_value = seconds
+
+    def percentile(self, p):
+        """
+        计算百分位数
+
+        Args:
+            p: 百分位 (0-100)
+
+        Returns:
+            float: 对应的耗时 (秒)，无数据时返回 0.0
+        """
+        if self.total_count == 0:
+            return 0.0
+        target = max(1, int(round(self.total_count * p / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    return min(self._value_at(index) / 1000000.0, self.max_value)
+        return self.max_value
+
+    def summary(self):
+        """返回该直方图的统计摘要"""
+        count = self.total_count
+        return {
+            "count": count,
+            "mean": self.total_sum / count if count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max_value,
+        }
+
+
+class _Span:
+    """计时上下文，退出时把耗时写入所属的度量器"""
+    __slots__ = ("monitor", "name", "start")
+
+    def __init__(self, monitor, name):
+        self.monitor = monitor
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.monitor.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    """关闭度量时使用的空上下文"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class PerfMonitor:
+    """
+    分阶段性能度量器
+    每个阶段维护一个区间直方图 (导出后清零，用于计算 p50/p95/p99)
+    和一个累计计数/累计耗时 (用于 Prometheus 的 _sum/_count)
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._window = {}   # 阶段名 -> 当前统计区间的直方图
+        self._totals = {}   # 阶段名 -> [累计次数, 累计耗时]
+        self.started_at = time.time()
+
+    def span(self, name):
+        """
+        创建一个阶段计时上下文
+
+        用法:
+            with perf.span("capture"):
+                frame = vision.capture_screen()
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        """直接记录某阶段的一次耗时 (秒)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self._window.get(name)
+            if hist is None:
+                hist = self._window[name] = LatencyHistogram()
+                self._totals[name] = [0, 0.0]
+            hist.record(seconds)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def totals(self):
+        """
+        获取各阶段的累计次数和累计耗时 (只复制计数，开销很小，适合 UI 高频读取)
+
+        Returns:
+            dict: 阶段名 -> (累计次数, 累计耗时秒)
+        """
+        with self._lock:
+            return {name: (v[0], v[1]) for name, v in self._totals.items()}
+
+    def snapshot(self, reset=False):
+        """
+        获取各阶段的统计摘要
+
+        Args:
+            reset: 为 True 时清空区间直方图，开始新的统计区间
+
+        Returns:
+            dict: 阶段名 -> {count, mean, p50, p95, p99, max, total_count, total_sum}
+        """
+        with self._lock:
+            window = self._window
+            totals = {name: list(v) for name, v in self._totals.items()}
+            if reset:
+                self._window = {name: LatencyHistogram() for name in window}
+        result = {}
+        for name, hist in window.items():
+            stats = hist.summary()
+            stats["total_count"], stats["total_sum"] = totals[name]
+            result[name] = stats
+        return result
+
+
+def format_prometheus(snapshot, prefix="autosky"):
+    """
+    将度量快照转换为 Prometheus 文本格式 (summary 类型)
+
+    Args:
+        snapshot: PerfMonitor.snapshot() 的返回值
+        prefix: 指标名前缀
+
+    Returns:
+        str: Prometheus 文本格式内容
+    """
+    metric = f"{prefix}_stage_latency_seconds"
+    lines = [
+        f"# HELP {metric} Per-stage latency of the navigation loop.",
+        f"# TYPE {metric} summary",
+    ]
+    for name in sorted(snapshot):
+        stats = snapshot[name]
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+            lines.append(f'{metric}{{stage="{name}",quantile="{quantile}"}} {stats[key]:.6f}')
+        lines.append(f'{metric}_sum{{stage="{name}"}} {stats["total_sum"]:.6f}')
+        lines.append(f'{metric}_count{{stage="{name}"}} {stats["total_count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    定时导出线程
+    每隔 interval 秒把区间统计追加到 JSONL 文件，并原子地重写 Prometheus 文本文件
+    """
+
+    def __init__(self, monitor, jsonl_path=None, prom_path=None, interval=10.0):
+        self.monitor = monitor
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动导出线程"""
+        for path in (self.jsonl_path, self.prom_path):
+            folder = os.path.dirname(path) if path else ""
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="MetricsExporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止导出线程，并在退出前导出最后一个区间"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.export()
+        self.export()
+
+    def export(self):
+        """立即导出一次"""
+        snapshot = self.monitor.snapshot(reset=True)
+        if not snapshot:
+            return
+        try:
+            if self.jsonl_path:
+                record = {
+                    "ts": time.time(),
+                    "interval": self.interval,
+                    "stages": {name: {k: stats[k] for k in ("count", "mean", "p50", "p95", "p99", "max")}
+                               for name, stats in snapshot.items() if stats["count"]},
+                }
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self.prom_path:
+                tmp_path = self.prom_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(format_prometheus(snapshot))
+                os.replace(tmp_path, self.prom_path)
+        except OSError as e:
+            print(f"性能指标导出失败: {e}")
@@ -10,24 +10,34 @@ import numpy as np
 import os
 import json
 import time
+from core.metrics import PerfMonitor
+from core.features import create_orb, edge_map, feature_path, load_features, match_similarity, select_good_matches
+from core.ui_mask import fit_mask, load_ui_mask
 
 
 class SkyNavigator:
-    def __init__(self, dataset_path, waypoints_file, use_edge_feature=True, use_clahe=False):
+    def __init__(self, dataset_path, waypoints_file, use_edge_feature=True, use_clahe=False, perf=None):
         self.dataset_path = dataset_path
+        self.waypoints_file = waypoints_file
         self.waypoints = self._load_json(waypoints_file)
         self.current_idx = 0
         self.use_edge_feature = use_edge_feature # 新增：是否启用边缘特征
         self.use_clahe = use_clahe  # 新增：是否使用CLAHE增强对比度
+        # 性能度量器：未传入时使用关闭状态的度量器，不产生开销
+        self.perf = perf if perf is not None else PerfMonitor(enabled=False)
         
         # 调整 ORB 参数：因为边缘图特征点较少，需要降低阈值灵敏度
         # 修复：将 nfeatures 从 1000 增加到 1500
         # 使用 FAST_SCORE，对边缘图更敏感
-        self.orb = cv2.ORB_create(nfeatures=1500, scoreType=cv2.ORB_FAST_SCORE)
+        self.orb = create_orb()
         
         # 初始化匹配器 (使用汉明距离，适合二进制描述符)
         self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
         
+        # 数据集中学习得到的 UI 遮罩 (learn_ui_mask.py)：HUD 和主角区域不检测特征点；没有时不使用遮罩
+        self.ui_mask = load_ui_mask(dataset_path)
+        self._fitted_masks = {}
+        
         # 缓存当前目标的数据，避免每帧重复读取硬盘
         self.target_img = None
         self.target_kp = None
@@ -65,7 +75,7 @@ class SkyNavigator:
             # 2. Canny 边缘检测
             # 修复：将阈值从 50, 150 降低到 20, 60
             # 这样即使是云彩淡淡的轮廓也能被提取出来
-            edges = cv2.Canny(gray, 20, 60)
+            edges = edge_map(gray)
             return edges
         elif self.use_clahe:
             # 备用方案：使用 CLAHE 增强对比度
@@ -76,6 +86,22 @@ class SkyNavigator:
         else:
             return gray
 
+    def _detect_mask(self, img):
+        """与图像分辨率相符的检测遮罩 (按分辨率缓存)，没有 UI 遮罩时为 None"""
+        if self.ui_mask is None or img is None:
+            return None
+        shape = img.shape[:2]
+        if shape not in self._fitted_masks:
+            self._fitted_masks[shape] = fit_mask(self.ui_mask, shape[1], shape[0])
+        return self._fitted_masks[shape]
+
+    @property
+    def feature_mode(self):
+        """当前的预处理方式，用于核对持久化特征 (edge / clahe / gray)"""
+        if self.use_edge_feature:
+            return "edge"
+        return "clahe" if self.use_clahe else "gray"
+
     def load_waypoint(self, index):
         """加载指定索引的路点作为当前目标"""
         if index >= len(self.waypoints):
@@ -90,13 +116,22 @@ class SkyNavigator:
             print(f"错误：找不到图片 {img_path}")
             return False
 
+        # 优先使用提取关键帧时保存的特征 (参数一致且图片未被替换)，省去读图和特征提取
+        cached = load_features(feature_path(self.dataset_path, wp['img_name']), self.feature_mode, img_path,
+                               self.ui_mask)
+        if cached is not None:
+            self.target_img = None
+            self.target_kp, self.target_des = cached
+            print(f"切换目标 -> ID: {wp['id']} Action: {wp['action']} {wp.get('description', '')}")
+            return True
+
         # 读取并预处理目标图片
         raw_img = cv2.imread(img_path)
         # 注意：这里要对目标图做同样的预处理（转边缘）
         processed_img = self._preprocess(raw_img)
         self.target_img = processed_img
         # 提取目标的特征点和描述符
-        self.target_kp, self.target_des = self.orb.detectAndCompute(processed_img, None)
+        self.target_kp, self.target_des = self.orb.detectAndCompute(processed_img, self._detect_mask(processed_img))
         
         print(f"切换目标 -> ID: {wp['id']} Action: {wp['action']} {wp.get('description', '')}")
         return True
@@ -117,46 +152,45 @@ class SkyNavigator:
         if self.target_des is None:
             return 0, 0
 
+        perf = self.perf
+
         # 1. 预处理屏幕画面 (转边缘)
-        processed_screen = self._preprocess(screen_frame)
+        with perf.span("preprocess"):
+            processed_screen = self._preprocess(screen_frame)
         
         # 2. 提取屏幕特征
-        screen_kp, screen_des = self.orb.detectAndCompute(processed_screen, None)
+        with perf.span("detect"):
+            screen_kp, screen_des = self.orb.detectAndCompute(processed_screen, self._detect_mask(processed_screen))
         
         if screen_des is None or len(screen_des) < 5:
             # 画面太黑或无纹理（如纯色云层），无法匹配
             self.consecutive_misses += 1
             return 0, 0.0
 
-        # 3. 特征匹配
-        matches = self.matcher.match(self.target_des, screen_des)
-        
-        # 4. 筛选优质匹配点 (排序)
-        matches = sorted(matches, key=lambda x: x.distance)
-        
-        # 取前 15% 且距离小于 60 的点（边缘匹配容错率要低一点）
-        good_matches = [m for m in matches[:int(len(matches)*0.15)] if m.distance < 60]
+        with perf.span("match"):
+            # 3. 特征匹配，4. 筛选优质匹配点：按距离排序后取前 15% 且距离小于 60 的点
+            good_matches = select_good_matches(self.matcher, self.target_des, screen_des)
         
         if len(good_matches) < 4:
             self.consecutive_misses += 1
             return 0, 0.0
 
-        # 5. 计算平均位置偏差
-        # queryIdx -> target image (目标图)
-        # trainIdx -> screen image (当前屏幕)
-        
-        src_pts = np.float32([self.target_kp[m.queryIdx].pt for m in good_matches])
-        dst_pts = np.float32([screen_kp[m.trainIdx].pt for m in good_matches])
-        
-        # 计算重心 (Centroid) 的差异
-        center_src = np.mean(src_pts, axis=0)
-        center_dst = np.mean(dst_pts, axis=0)
-        
-        offset_x = center_dst[0] - center_src[0]
-        
-        # 6. 重新计算分数逻辑，适应边缘特征
-        avg_dist = np.mean([m.distance for m in good_matches])
-        similarity = max(0, 1 - (avg_dist / 80.0)) # 调整分母以适应边缘特征
+        with perf.span("score"):
+            # 5. 计算平均位置偏差
+            # queryIdx -> target image (目标图)
+            # trainIdx -> screen image (当前屏幕)
+            
+            src_pts = np.float32([self.target_kp[m.queryIdx].pt for m in good_matches])
+            dst_pts = np.float32([screen_kp[m.trainIdx].pt for m in good_matches])
+            
+            # 计算重心 (Centroid) 的差异
+            center_src = np.mean(src_pts, axis=0)
+            center_dst = np.mean(dst_pts, axis=0)
+            
+            offset_x = center_dst[0] - center_src[0]
+            
+            # 6. 重新计算分数逻辑，适应边缘特征
+            similarity = match_similarity(good_matches)
         
         # 更新连续丢失目标的帧数
         if similarity < 0.2: # 假设 0.2 是极低分
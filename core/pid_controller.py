@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序视角 PID 控制器
+按真实帧间隔积分/微分，带抗积分饱和、微分滤波和按匹配度的增益调度
+"""
+
+import time
+
+
+class PIDController:
+    """
+    视角对准用的 PID 控制器
+    输入为画面水平偏差 (像素)，输出为本帧的鼠标相对移动量
+    """
+
+    def __init__(self, kp=0.6, ki=0.6, kd=0.02, output_limit=50, integral_limit=40.0,
+                 integral_zone=60, deadzone=15, derivative_tau=0.05, max_dt=0.5, ref_dt=0.1,
+                 schedule_low=0.3, schedule_high=0.7, min_gain_scale=0.4):
+        """
+        Args:
+            kp: 比例增益，按 ref_dt 帧间隔标定 (每像素偏差对应的鼠标移动量)
+            ki: 积分增益 (每 像素·秒)
+            kd: 微分增益 (秒)
+            output_limit: 单次最大移动量，防止甩飞
+            integral_limit: 积分项输出的上限 (抗积分饱和)
+            integral_zone: 只有偏差小于该值时才积分，大角度转向时由比例项主导，避免积分过冲
+            deadzone: 死区，偏差小于该值时不移动，防止抖动
+            derivative_tau: 微分低通滤波时间常数 (秒)
+            max_dt: 帧间隔上限，超过视为新一轮对准，清空积分和微分状态
+            ref_dt: kp 标定时的帧间隔；实际帧间隔不同时按指数换算，使收敛速度 (秒) 与帧率无关
+            schedule_low / schedule_high: 增益调度的匹配度区间
+            min_gain_scale: 匹配度不高于 schedule_low 时的增益缩放
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_limit = output_limit
+        self.integral_limit = integral_limit
+        self.integral_zone = integral_zone
+        self.deadzone = deadzone
+        self.derivative_tau = derivative_tau
+        self.max_dt = max_dt
+        self.ref_dt = ref_dt
+        self.schedule_low = schedule_low
+        self.schedule_high = schedule_high
+        self.min_gain_scale = min_gain_scale
+        self.reset()
+
+    def reset(self):
+        """清空积分、微分和计时状态"""
+        self.integral = 0.0
+        self.prev_error = None
+        self.d_filtered = 0.0
+        self.last_time = None
+
+    def gain_scale(self, similarity):
+        """
+        按匹配度计算增益缩放：匹配度低时偏差测量不可靠，降低增益
+
+        Args:
+            similarity: 匹配相似度 (0.0 - 1.0)，None 表示不调度
+        """
+        if similarity is None:
+            return 1.0
+        if similarity >= self.schedule_high:
+            return 1.0
+        if similarity <= self.schedule_low:
+            return self.min_gain_scale
+        ratio = (similarity - self.schedule_low) / (self.schedule_high - self.schedule_low)
+        return self.min_gain_scale + (1.0 - self.min_gain_scale) * ratio
+
+    def proportional(self, error, similarity=None):
+        """
+        单次比例修正，不读写积分、微分和计时状态
+        用于静止时的逐步对正：每次移动后等画面稳定再测量，间隔远大于 max_dt，积分和微分都没有意义；
+        画面稳定后每步消除 kp 比例的偏差，增益调度、死区和限幅与 update 相同
+
+        Returns:
+            int: 鼠标相对移动量
+        """
+        if (similarity is not None and similarity <= 0) or abs(error) < self.deadzone:
+            return 0
+        output = self.gain_scale(similarity) * self.kp * error
+        return int(max(min(output, self.output_limit), -self.output_limit))
+
+    def update(self, error, similarity=None, dt=None, now=None):
+        """
+        计算本帧的输出
+
+        Args:
+            error: 水平偏差 (像素)
+            similarity: 匹配相似度，用于增益调度
+            dt: 距上次更新的时间 (秒)，不传时按 now / perf_counter 计算
+            now: 当前时间戳 (秒)，便于离线仿真
+
+        Returns:
+            int: 鼠标相对移动量
+        """
+        if similarity is not None and similarity <= 0:
+            # calculate_offset 匹配失败时返回 (0, 0.0)，这不是"已对准"，保持状态等待下一次有效测量
+            return 0
+
+        if dt is None:
+            now = time.perf_counter() if now is None else now
+            dt = None if self.last_time is None else now - self.last_time
+            self.last_time = now
+        if dt is None or dt <= 0 or dt > self.max_dt:
+            # 第一次调用或长时间未调用：当作新的一轮对准
+            self.integral = 0.0
+            self.prev_error = None
+            self.d_filtered = 0.0
+            dt = None
+
+        if abs(error) < self.deadzone:
+            # 死区内不移动，也不累积积分，避免对准后缓慢漂移
+            self.prev_error = error
+            return 0
+
+        scale = self.gain_scale(similarity)
+        kp = self.kp
+        if dt is not None and 0 < kp < 1:
+            # 每帧消除 kp 比例的偏差，换算到实际帧间隔：1 - (1 - kp) ^ (dt / ref_dt)
+            kp = 1.0 - (1.0 - kp) ** (dt / self.ref_dt)
+        p_term = kp * error
+
+        d_term = 0.0
+        if dt is not None and self.prev_error is not None:
+            raw_d = (error - self.prev_error) / dt
+            alpha = self.derivative_tau / (self.derivative_tau + dt)
+            self.d_filtered = alpha * self.d_filtered + (1.0 - alpha) * raw_d
+            d_term = self.kd * self.d_filtered
+        self.prev_error = error
+
+        i_term = self.ki * self.integral
+        output = scale * (p_term + i_term + d_term)
+
+        # 抗积分饱和：偏差进入积分区间、且输出未饱和 (或积分方向能让输出退出饱和) 时才积分
+        if dt is not None and abs(error) < self.integral_zone:
+            saturated = abs(output) >= self.output_limit
+            if not saturated or (error * output) < 0:
+                self.integral += error * dt
+                if self.ki > 0:
+                    limit = self.integral_limit / self.ki
+                    self.integral = max(min(self.integral, limit), -limit)
+
+        output = max(min(output, self.output_limit), -self.output_limit)
+        return int(output)
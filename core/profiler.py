@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序采样分析模块
+运行时按需对导航线程做统计采样，输出火焰图可用的折叠栈 (collapsed stack) 文件
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    统计采样器
+    在独立线程中定时读取目标线程的调用栈 (sys._current_frames)，
+    不修改目标线程的执行，关闭时没有任何开销
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        """
+        Args:
+            interval: 采样间隔 (秒)
+            max_depth: 单个调用栈记录的最大深度
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_ident, duration, output_path, on_finish=None):
+        """
+        开始采样
+
+        Args:
+            thread_ident: 目标线程的 ident
+            duration: 采样时长 (秒)
+            output_path: 折叠栈文件输出路径
+            on_finish: 采样结束后的回调，参数为输出路径
+        """
+        if self.running:
+            return False
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(thread_ident, duration, output_path, on_finish),
+            name="SamplingProfiler", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """提前结束采样 (已采集的样本仍会写出)"""
+        self._stop_event.set()
+
+    def _run(self, thread_ident, duration, output_path, on_finish):
+        deadline = time.perf_counter() + duration
+        while not self._stop_event.is_set() and time.perf_counter() < deadline:
+            frame = sys._current_frames().get(thread_ident)
+            if frame is None:
+                # 目标线程已退出
+                break
+            self.samples[self._collapse(frame)] += 1
+            self.sample_count += 1
+            del frame
+            self._stop_event.wait(self.interval)
+        self.write(output_path)
+        if on_finish is not None:
+            on_finish(output_path)
+
+    def _collapse(self, frame):
+        """把调用栈转换为 root;...;leaf 形式的折叠栈字符串"""
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f"{code.co_name}@{os.path.basename(code.co_filename)}:{frame.f_lineno}")
+            frame = frame.f_back
+        stack.reverse()
+        return ";".join(stack)
+
+    def write(self, output_path):
+        """写出折叠栈文件，每行格式为 "栈 次数"，可直接交给 flamegraph.pl / speedscope"""
+        folder = os.path.dirname(output_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilerHook:
+    """
+    导航线程的采样开关
+    - GUI 热键调用 toggle() 开始/停止采样
+    - 在工作目录创建标志文件也会触发一次采样 (文件内容可写采样秒数)
+    导航线程每帧调用 poll()，未开启时只有一次时间比较
+    """
+
+    def __init__(self, duration=10.0, output_dir="logs/profiles", flag_file="profile.flag",
+                 poll_interval=1.0, interval=0.005):
+        self.duration = duration
+        self.output_dir = output_dir
+        self.flag_file = flag_file
+        self.poll_interval = poll_interval
+        self.profiler = SamplingProfiler(interval=interval)
+        self.thread_ident = None
+        self.last_output = None
+        self._next_poll = 0.0
+
+    def attach(self, thread_ident=None):
+        """绑定被采样的线程，默认为当前线程 (在导航线程中调用)"""
+        self.thread_ident = thread_ident if thread_ident is not None else threading.get_ident()
+
+    def detach(self):
+        """导航线程退出时解除绑定，并结束进行中的采样"""
+        self.profiler.stop()
+        self.thread_ident = None
+
+    @property
+    def running(self):
+        return self.profiler.running
+
+    def start(self, duration=None):
+        """开始一次采样"""
+        if self.thread_ident is None:
+            print("性能采样：导航线程未运行")
+            return False
+        duration = duration or self.duration
+        output_path = os.path.join(self.output_dir, time.strftime("profile_%Y%m%d_%H%M%S.collapsed"))
+        started = self.profiler.start(self.thread_ident, duration, output_path, self._on_finish)
+        if started:
+            print(f"性能采样开始 ({duration:g} 秒)...")
+        return started
+
+    def toggle(self):
+        """开始或提前结束采样 (供 GUI 热键调用)"""
+        if self.running:
+            self.profiler.stop()
+        else:
+            self.start()
+
+    def poll(self):
+        """检查标志文件，由导航线程每帧调用"""
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        if not os.path.exists(self.flag_file):
+            return
+        duration = None
+        try:
+            with open(self.flag_file, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            os.remove(self.flag_file)
+            if content:
+                duration = float(content)
+        except (OSError, ValueError) as e:
+            print(f"读取采样标志文件失败: {e}")
+        if not self.running:
+            self.start(duration)
+
+    def _on_finish(self, output_path):
+        self.last_output = output_path
+        print(f"性能采样结束，共 {self.profiler.sample_count} 个样本，已保存: {output_path}")
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序运行录制模块
+把截图帧、导航输出和输入指令写入只追加的分段录制文件，并支持离线回放
+"""
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# 分段文件头和记录头格式：类型(1B) + 序号(4B) + 时间戳(8B) + 负载长度(4B)
+FILE_MAGIC = b"SKYRUN01"
+RECORD_HEADER = struct.Struct("<BIdI")
+
+# 记录类型
+KIND_META = 0    # 元信息 (JSON)：数据集、路点文件、帧尺寸等，每个分段开头都会写一次
+KIND_FRAME = 1   # 截图帧 (JPEG/PNG 编码)
+KIND_NAV = 2     # 导航输出 (JSON)：路点索引、偏移、匹配分、是否到达、耗时
+KIND_INPUT = 3   # 输入指令 (JSON)：指令名和参数
+
+_STOP = object()
+
+
+class RunRecorder:
+    """
+    运行录制器
+    热路径上只做入队，编码和写盘都在后台线程完成；
+    录制目录由若干分段文件组成，总大小超过上限时删除最旧的分段
+    """
+
+    def __init__(self, run_dir, meta=None, max_bytes=200 * 1024 * 1024,
+                 segment_bytes=16 * 1024 * 1024, frame_scale=1.0, jpeg_quality=95,
+                 max_pending_frames=8):
+        """
+        Args:
+            run_dir: 录制目录
+            meta: 写入每个分段开头的元信息字典
+            max_bytes: 录制目录的磁盘占用上限
+            segment_bytes: 单个分段文件的大小上限
+            frame_scale: 帧缩放比例 (<1 时降采样存储)
+            jpeg_quality: JPEG 压缩质量，0 表示使用无损 PNG (边缘特征对压缩敏感，低于 95 时匹配分偏差明显)
+            max_pending_frames: 待写入帧的上限，超过时丢弃新帧，避免拖慢主循环
+        """
+        self.run_dir = run_dir
+        self.meta = dict(meta or {})
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.frame_scale = frame_scale
+        self.jpeg_quality = jpeg_quality
+
+        self.frame_seq = 0
+        # 最近一帧截图的序号：之后发出的输入指令由这一帧的导航结果产生 (第一帧之前的指令记为 0)
+        self.current_frame = 0
+        self.dropped_frames = 0
+        self._frame_slots = threading.BoundedSemaphore(max_pending_frames)
+        self._queue = queue.Queue()
+        self._segments = []   # 仍在磁盘上的分段 [(路径, 大小)]
+        self._segment_index = 0
+        self._file = None
+        self._thread = None
+
+    def start(self):
+        """创建录制目录并启动写入线程"""
+        if not os.path.exists(self.run_dir):
+            os.makedirs(self.run_dir)
+        self._thread = threading.Thread(target=self._run, name="RunRecorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """写完队列中剩余的记录并关闭文件"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        print(f"录制完成: {self.run_dir} (帧: {self.frame_seq - self.dropped_frames}, 丢弃: {self.dropped_frames})")
+
+    # === 热路径接口 ===
+
+    def record_frame(self, frame):
+        """
+        记录一帧截图 (被丢弃的帧也占用序号，这一帧产生的输入指令仍按它的序号记录)
+
+        Returns:
+            int: 帧序号，被丢弃时返回 -1
+        """
+        seq = self.frame_seq
+        self.frame_seq += 1
+        self.current_frame = seq
+        if not self._frame_slots.acquire(blocking=False):
+            self.dropped_frames += 1
+            return -1
+        self._queue.put((KIND_FRAME, seq, time.time(), frame))
+        return seq
+
+    def record_nav(self, frame_seq, **fields):
+        """记录一帧的导航输出 (frame_seq 为对应的帧序号)"""
+        self._queue.put((KIND_NAV, frame_seq, time.time(), fields))
+
+    def record_input(self, command, *args):
+        """记录一条输入指令 (按产生它的那一帧的序号记录)"""
+        self._queue.put((KIND_INPUT, self.current_frame, time.time(), {"cmd": command, "args": list(args)}))
+
+    # === 写入线程 ===
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            kind, seq, ts, data = item
+            try:
+                if kind == KIND_FRAME:
+                    self._frame_slots.release()
+                    payload = self._encode_frame(data)
+                else:
+                    payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self._write(kind, seq, ts, payload)
+            except (OSError, cv2.error) as e:
+                print(f"录制写入失败: {e}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _encode_frame(self, frame):
+        if self.frame_scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.frame_scale, fy=self.frame_scale,
+                               interpolation=cv2.INTER_AREA)
+        if self.jpeg_quality:
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        else:
+            ok, buf = cv2.imencode(".png", frame)
+        if not ok:
+            raise cv2.error("帧编码失败")
+        return buf.tobytes()
+
+    def _write(self, kind, seq, ts, payload):
+        if self._file is None or self._segments[-1][1] >= self.segment_bytes:
+            self._open_segment()
+        self._file.write(RECORD_HEADER.pack(kind, seq, ts, len(payload)))
+        self._file.write(payload)
+        path, size = self._segments[-1]
+        self._segments[-1] = (path, size + RECORD_HEADER.size + len(payload))
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        index = self._segment_index
+        self._segment_index += 1
+        self._enforce_budget()
+        path = os.path.join(self.run_dir, f"seg_{index:05d}.skyrun")
+        self._file = open(path, "ab", buffering=1024 * 1024)
+        self._file.write(FILE_MAGIC)
+        self._segments.append((path, len(FILE_MAGIC)))
+        # 每个分段都带元信息，删除旧分段后仍能独立回放
+        meta = dict(self.meta, segment=index)
+        payload = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        self._write(KIND_META, 0, time.time(), payload)
+
+    def _enforce_budget(self):
+        """删除最旧的分段，为即将写入的新分段腾出空间"""
+        total = sum(size for _, size in self._segments)
+        while self._segments and total + self.segment_bytes > self.max_bytes:
+            path, size = self._segments.pop(0)
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"删除旧录制分段失败: {e}")
+            total -= size
+
+
+def read_run(run_dir):
+    """
+    按顺序读取录制目录中的全部记录
+
+    Yields:
+        tuple: (kind, seq, ts, data)；帧记录的 data 为解码后的图像，其余为字典
+    """
+    segments = sorted(f for f in os.listdir(run_dir) if f.endswith(".skyrun"))
+    for name in segments:
+        with open(os.path.join(run_dir, name), "rb") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                print(f"跳过无效的录制分段: {name}")
+                continue
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                kind, seq, ts, length = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    # 进程崩溃时最后一条记录可能不完整
+                    break
+                if kind == KIND_FRAME:
+                    data = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+                else:
+                    data = json.loads(payload.decode("utf-8"))
+                yield kind, seq, ts, data
+
+
+def replay_run(run_dir, nav, perf=None):
+    """
+    把录制的帧按原顺序送入 SkyNavigator，复现导航决策并与录制结果对比
+    走与 main_loop 相同的调用路径：calculate_offset -> check_arrival -> next_waypoint
+
+    Args:
+        run_dir: 录制目录
+        nav: SkyNavigator 实例 (应加载与录制时相同的路线)
+        perf: 可选的 PerfMonitor，用于统计回放时各阶段耗时
+
+    Returns:
+        dict: 回放报告 (帧数、决策差异、匹配分偏差、每帧决策明细)
+    """
+    frames = {}
+    decisions = []
+    mismatches = 0
+    score_deltas = []
+    started = False
+    frame_size = None
+
+    for kind, seq, ts, data in read_run(run_dir):
+        if kind == KIND_META:
+            if data.get("width") and data.get("height"):
+                frame_size = (data["width"], data["height"])
+            continue
+        if kind == KIND_FRAME:
+            frames[seq] = data
+            continue
+        if kind != KIND_NAV or seq not in frames:
+            continue
+
+        frame = frames.pop(seq)
+        if not started:
+            started = True
+            if data.get("idx", nav.current_idx) != nav.current_idx:
+                nav.load_waypoint(data["idx"])
+        if frame_size and (frame.shape[1], frame.shape[0]) != frame_size:
+            # 降采样录制的帧还原到处理分辨率
+            frame = cv2.resize(frame, frame_size)
+
+        idx = nav.current_idx
+        start = time.perf_counter()
+        offset_x, similarity = nav.calculate_offset(frame)
+        arrived = False
+        if data.get("phase", "navigate") == "navigate":
+            arrived = nav.check_arrival(similarity)
+        latency = time.perf_counter() - start
+        if perf is not None:
+            perf.record("replay", latency)
+
+        recorded_arrived = bool(data.get("arrived", False))
+        same = idx == data.get("idx") and arrived == recorded_arrived
+        if not same:
+            mismatches += 1
+        score_deltas.append(abs(float(similarity) - float(data.get("score", 0.0))))
+        decisions.append({
+            "frame": seq,
+            "idx": idx,
+            "offset": float(offset_x),
+            "score": float(similarity),
+            "arrived": arrived,
+            "latency": latency,
+            "recorded_idx": data.get("idx"),
+            "recorded_score": data.get("score"),
+            "recorded_arrived": recorded_arrived,
+        })
+
+        if arrived:
+            nav.next_waypoint()
+        if data.get("idx") is not None:
+            # 无论哪一方提前或推迟切换，都跟随录制时的下一个路点，保证后续帧仍可逐帧对比
+            expected = data["idx"] + int(recorded_arrived)
+            if nav.current_idx != expected:
+                nav.load_waypoint(expected)
+
+    latencies = sorted(d["latency"] for d in decisions)
+    count = len(decisions)
+    return {
+        "run_dir": run_dir,
+        "frames": count,
+        "mismatches": mismatches,
+        "score_delta_mean": float(np.mean(score_deltas)) if score_deltas else 0.0,
+        "score_delta_max": float(np.max(score_deltas)) if score_deltas else 0.0,
+        "latency_p50": latencies[count // 2] if count else 0.0,
+        "latency_p95": latencies[min(count - 1, int(count * 0.95))] if count else 0.0,
+        "decisions": decisions,
+    }
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序遥测通道
+导航线程到 UI 线程的数据通道：连续指标只保留最新值，离散事件进入有界日志
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class TelemetryChannel:
+    """
+    最新值遥测通道
+    - publish(): 每个指标一个槽位，UI 读取前被覆盖的旧值计为"合并"
+    - emit(): 离散事件 (路点切换、停止等) 写入有界日志，溢出时丢弃最旧的事件并计数
+    - poll(): UI 每次刷新调用一次，取走自上次以来变化的指标和全部新事件
+    - reset(): 新一轮运行开始时调用，递增 run_id；事件可带 run=<产生它的那一轮的 run_id>，
+      poll() 丢弃上一轮迟到的事件 (例如上一轮收尾完成后才发出的 stop)，不带 run 的事件不过滤
+    """
+
+    def __init__(self, max_events=64):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._dirty = set()
+        self._events = deque()
+        self.max_events = max_events
+        self.run_id = 0
+        self.stats = {"published": 0, "coalesced": 0, "events": 0, "dropped": 0, "stale": 0}
+
+    def publish(self, **metrics):
+        """更新一个或多个指标的最新值"""
+        with self._lock:
+            for name, value in metrics.items():
+                if name in self._dirty:
+                    self.stats["coalesced"] += 1
+                self._values[name] = value
+                self._dirty.add(name)
+            self.stats["published"] += len(metrics)
+
+    def emit(self, event_type, **payload):
+        """记录一个离散事件"""
+        payload["type"] = event_type
+        payload.setdefault("ts", time.time())
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                self._events.popleft()
+                self.stats["dropped"] += 1
+            self._events.append(payload)
+            self.stats["events"] += 1
+
+    def poll(self):
+        """
+        取走自上次调用以来变化的指标和新事件
+
+        Returns:
+            tuple: (变化的指标字典, 事件列表)
+        """
+        with self._lock:
+            changed = {name: self._values[name] for name in self._dirty}
+            self._dirty.clear()
+            events = [e for e in self._events if e.get("run", self.run_id) == self.run_id]
+            self.stats["stale"] += len(self._events) - len(events)
+            self._events.clear()
+        return changed, events
+
+    def latest(self, name, default=None):
+        """读取某个指标的最新值 (不影响变化标记)"""
+        with self._lock:
+            return self._values.get(name, default)
+
+    def reset(self):
+        """
+        清空指标和事件并开始新一轮运行 (统计计数保留)
+
+        Returns:
+            int: 新一轮的 run_id，产生事件的一方应在事件中带上它
+        """
+        with self._lock:
+            self._values.clear()
+            self._dirty.clear()
+            self._events.clear()
+            self.run_id += 1
+            return self.run_id
+
+
+def make_status_callback(telemetry):
+    """
+    创建 main_loop 使用的状态回调，把匹配分/阈值发布为指标，路点变化发布为事件
+
+    Args:
+        telemetry: 具有 publish/emit 方法的遥测通道
+
+    Returns:
+        callable: status_callback(img_path, score, threshold)
+    """
+    last_img = [None]
+
+    def status_callback(current_img_path, score, threshold):
+        telemetry.publish(score=score, thresh=threshold)
+        # 路点切换是离散事件，不能被后续帧覆盖
+        if current_img_path != last_img[0]:
+            last_img[0] = current_img_path
+            telemetry.emit("waypoint", img=current_img_path)
+
+    return status_callback
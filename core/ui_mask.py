@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序静态 UI 遮罩模块
+从一段录像中统计每个像素的时间方差和边缘持续率：画面随镜头变化，而 HUD 按钮、水印、主角
+几乎不动，它们要么亮度几乎不变，要么边缘一直出现在同一位置。据此学习出与录像分辨率和 UI 布局
+相符的遮罩，随数据集保存为 ui_mask.png，关键帧提取和运行时匹配都会使用
+"""
+
+import os
+import zlib
+
+import cv2
+import numpy as np
+
+
+UI_MASK_FILE = "ui_mask.png"
+UI_MASK_PREVIEW_FILE = "ui_mask_preview.jpg"
+# 数据集目录中不是路点的图片，列举路点图片时需要排除
+UI_MASK_FILES = (UI_MASK_FILE, UI_MASK_PREVIEW_FILE)
+
+
+class UIMaskLearner:
+    """
+    按帧累积的逐像素统计量 (整帧向量化，每帧只做几次数组运算)：
+    灰度的 Welford 在线均值/方差，以及 Canny 边缘出现的帧数
+    """
+
+    def __init__(self, width, height, canny_low=50, canny_high=150):
+        """
+        Args:
+            width, height: 输入帧的分辨率 (学到的遮罩与之相同)
+            canny_low, canny_high: 统计边缘持续率用的 Canny 阈值
+        """
+        self.size = (width, height)
+        self.canny_low = canny_low
+        self.canny_high = canny_high
+        self.count = 0
+        self._mean = np.zeros((height, width), dtype=np.float64)
+        self._m2 = np.zeros((height, width), dtype=np.float64)
+        self._edges = np.zeros((height, width), dtype=np.uint32)  # 累加 0/255 的边缘图，用时再除以 255
+        self._delta = np.empty((height, width), dtype=np.float64)
+
+    def update(self, gray):
+        """加入一帧灰度图"""
+        self.count += 1
+        x = gray.astype(np.float64)
+        np.subtract(x, self._mean, out=self._delta)
+        self._mean += self._delta / self.count
+        x -= self._mean
+        x *= self._delta
+        self._m2 += x
+        self._edges += cv2.Canny(gray, self.canny_low, self.canny_high)
+
+    @property
+    def mean(self):
+        """逐像素灰度均值"""
+        return self._mean.astype(np.float32)
+
+    @property
+    def std(self):
+        """逐像素灰度标准差"""
+        if self.count < 2:
+            return np.zeros_like(self._mean, dtype=np.float32)
+        return np.sqrt(self._m2 / (self.count - 1)).astype(np.float32)
+
+    @property
+    def edge_persistence(self):
+        """逐像素边缘持续率：出现边缘的帧数占比 (0-1)"""
+        if self.count == 0:
+            return np.zeros_like(self._mean, dtype=np.float32)
+        return (self._edges / (255.0 * self.count)).astype(np.float32)
+
+    def mask(self, std_threshold=6.0, edge_persistence=0.3, density=3.0, density_window=0.05, close=0.02,
+             margin=0.01, min_area=0.0005):
+        """
+        由统计量导出遮罩
+
+        Args:
+            std_threshold: 灰度标准差低于该值的像素视为静止 (UI 底板、黑边)
+            edge_persistence: 边缘持续率不低于该值的像素视为静止 (UI 轮廓、文字)
+            density: 邻域平均边缘持续率达到全帧中位数的该倍数时视为静止 (主角会在屏幕中央小幅晃动，
+                逐像素的持续率不高，但那一片的边缘始终比场景密集)；0 为不使用
+            density_window: 统计邻域平均的窗口尺寸占帧宽的比例
+            close: 闭运算核尺寸占帧宽的比例，把文字、图标的笔画连成整块
+            margin: 向外扩张的宽度占帧宽的比例 (特征描述子会用到关键点周围的像素)
+            min_area: 小于该面积比例的静止区域视为噪声丢弃
+
+        Returns:
+            numpy.ndarray: 与 get_sky_mask 相同约定的遮罩，255 为可用区域，0 为遮挡
+        """
+        width, height = self.size
+        persistence = self.edge_persistence
+        static = (self.std < std_threshold) | (persistence >= edge_persistence)
+        if density > 0:
+            w = max(1, int(round(width * density_window))) | 1
+            local = cv2.blur(persistence, (w, w))
+            static |= local >= density * max(float(np.median(local)), 1e-3)
+        static = static.astype(np.uint8)
+
+        k = max(1, int(round(width * close))) | 1
+        static = cv2.morphologyEx(static, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k)))
+
+        # 去掉零散的噪点区域 (某段时间恰好没动的天空、地面)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(static, connectivity=8)
+        keep = stats[:, cv2.CC_STAT_AREA] >= min_area * width * height
+        keep[0] = False
+        static = keep[labels].astype(np.uint8)
+
+        m = max(1, int(round(width * margin))) * 2 + 1
+        static = cv2.dilate(static, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (m, m)))
+        return np.where(static > 0, 0, 255).astype(np.uint8)
+
+
+def ui_mask_path(dataset_path):
+    """数据集目录下的遮罩文件路径"""
+    return os.path.join(dataset_path, UI_MASK_FILE)
+
+
+def save_ui_mask(dataset_path, mask):
+    """把遮罩保存到数据集目录 (PNG 无损，分辨率即学习时的处理分辨率)"""
+    os.makedirs(dataset_path, exist_ok=True)
+    path = ui_mask_path(dataset_path)
+    cv2.imwrite(path, mask)
+    return path
+
+
+def fit_mask(mask, width, height):
+    """把遮罩缩放到指定分辨率 (最近邻，保持二值)"""
+    if mask.shape[:2] == (height, width):
+        return mask
+    return cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def load_ui_mask(path, size=None):
+    """
+    加载遮罩
+
+    Args:
+        path: 数据集目录或遮罩文件路径
+        size: 可选的 (宽, 高)，与遮罩分辨率不同时缩放
+
+    Returns:
+        numpy.ndarray: 遮罩 (255 可用，0 遮挡)，文件不存在时返回 None
+    """
+    if os.path.isdir(path):
+        path = ui_mask_path(path)
+    if not os.path.exists(path):
+        return None
+    mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        print(f"警告：遮罩文件读取失败 -> {path}")
+        return None
+    mask = np.where(mask > 127, 255, 0).astype(np.uint8)
+    return fit_mask(mask, *size) if size is not None else mask
+
+
+def mask_signature(mask):
+    """遮罩内容的 32 位校验值，用于核对断点和持久化特征是否基于同一遮罩"""
+    if mask is None:
+        return 0
+    return zlib.crc32(np.ascontiguousarray(mask).tobytes()) & 0x7fffffff
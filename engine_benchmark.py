@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序导航引擎运行方式基准测试
+用数据集图片代替截屏运行导航循环，界面进程中模拟 Tk/热键钩子的 Python 负载，
+对比线程模式和子进程模式下的帧间隔抖动和单帧处理耗时
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import cv2
+
+from core.engine_process import EngineProcess
+from core.metrics import PerfMonitor
+from core.navigator import SkyNavigator
+from core.telemetry import TelemetryChannel, make_status_callback
+
+
+DATASET_WIDTH = 640
+DATASET_HEIGHT = 360
+
+
+def synthetic_loop(stop_event, status_callback=None, perf=None, profiler=None, telemetry=None,
+                   frame_sink=None, dataset="dataset/isle_dawn", period=0.05, frame_count=60,
+                   result_path=None):
+    """
+    与 main_loop 签名兼容的导航循环：截屏换成循环读取数据集图片，按固定周期运行
+
+    Args:
+        period: 目标帧间隔 (秒)
+        frame_count: 预加载的数据集图片数量
+        result_path: 结束时把每帧的开始时间和处理耗时写入该 JSON 文件
+    """
+    nav = SkyNavigator(dataset, os.path.join(dataset, "waypoints.json"), use_edge_feature=True, perf=perf)
+    names = sorted(f for f in os.listdir(dataset) if f.endswith('.jpg'))[:frame_count]
+    frames = [cv2.imread(os.path.join(dataset, name)) for name in names]
+    starts = []
+    process_times = []
+
+    next_deadline = time.perf_counter()
+    i = 0
+    while not stop_event.is_set():
+        frame_start = time.perf_counter()
+        starts.append(frame_start)
+
+        frame = frames[i % len(frames)].copy()
+        resized = cv2.resize(frame, (DATASET_WIDTH, DATASET_HEIGHT))
+        if frame_sink is not None:
+            frame_sink(resized)
+        offset_x, similarity = nav.calculate_offset(resized)
+        if telemetry is not None:
+            telemetry.publish(frame_ts=time.time(), misses=nav.consecutive_misses, blind=nav.is_blind())
+        if status_callback:
+            wp = nav.waypoints[nav.current_idx]
+            status_callback(os.path.join(nav.dataset_path, wp['img_name']), similarity, 0.6)
+        process_times.append(time.perf_counter() - frame_start)
+        if perf is not None:
+            perf.record("frame", time.perf_counter() - frame_start)
+
+        i += 1
+        next_deadline += period
+        remaining = next_deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        else:
+            next_deadline = time.perf_counter()
+
+    if result_path:
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump({"starts": starts, "process": process_times}, f)
+
+
+def ui_load(stop_event, busy_ms, idle_ms):
+    """模拟界面进程的 Python 负载 (Tk 重绘、热键钩子回调等)：忙 busy_ms 毫秒，歇 idle_ms 毫秒"""
+    while not stop_event.is_set():
+        end = time.perf_counter() + busy_ms / 1000.0
+        total = 0
+        while time.perf_counter() < end:
+            total += sum(range(200))
+        time.sleep(idle_ms / 1000.0)
+
+
+def summarize(result, period):
+    """
+    汇总帧间隔抖动
+
+    Returns:
+        dict: 帧数、间隔均值/标准差、与目标周期的偏差 p99/最大值、超时帧比例、处理耗时 p50/p99
+    """
+    starts = result["starts"][5:]  # 去掉预热帧
+    process = sorted(result["process"][5:])
+    intervals = [b - a for a, b in zip(starts, starts[1:])]
+    if len(intervals) < 2:
+        return None
+    deviations = sorted(abs(x - period) for x in intervals)
+    return {
+        "frames": len(starts),
+        "interval_mean": statistics.mean(intervals),
+        "interval_std": statistics.stdev(intervals),
+        "dev_p99": deviations[min(len(deviations) - 1, int(len(deviations) * 0.99))],
+        "dev_max": deviations[-1],
+        "late": sum(1 for x in intervals if x > period * 1.5) / len(intervals),
+        "process_p50": process[len(process) // 2],
+        "process_p99": process[min(len(process) - 1, int(len(process) * 0.99))],
+    }
+
+
+def run_mode(mode, duration, period, busy_ms, idle_ms, dataset):
+    """在指定模式下运行一次，返回汇总结果"""
+    telemetry = TelemetryChannel()
+    load_stop = threading.Event()
+    load_thread = threading.Thread(target=ui_load, args=(load_stop, busy_ms, idle_ms), daemon=True)
+    fd, result_path = tempfile.mkstemp(suffix=".json", prefix=f"engine_{mode}_")
+    os.close(fd)
+    kwargs = {"dataset": dataset, "period": period, "result_path": result_path}
+
+    try:
+        if mode == "thread":
+            stop_event = threading.Event()
+            engine = threading.Thread(
+                target=synthetic_loop,
+                args=(stop_event, make_status_callback(telemetry)),
+                kwargs=dict(kwargs, perf=PerfMonitor(), telemetry=telemetry),
+                daemon=True
+            )
+            engine.start()
+            load_thread.start()
+            end = time.time() + duration
+            while time.time() < end:
+                telemetry.poll()
+                time.sleep(0.1)
+            stop_event.set()
+            engine.join()
+        else:
+            engine = EngineProcess(telemetry, target=synthetic_loop, target_kwargs=kwargs).start()
+            load_thread.start()
+            end = time.time() + duration
+            while time.time() < end and engine.poll():
+                telemetry.poll()
+                time.sleep(0.1)
+            engine.stop()
+            if engine.stats["telemetry_dropped"]:
+                print(f"共享内存遥测丢失 {engine.stats['telemetry_dropped']} 条")
+
+        load_stop.set()
+        load_thread.join()
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return summarize(json.load(f), period)
+    finally:
+        os.remove(result_path)
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序导航引擎运行方式基准测试")
+    parser.add_argument('--duration', type=float, default=15.0, help='每种模式的运行时长 (秒)')
+    parser.add_argument('--period', type=float, default=0.05, help='导航循环的目标帧间隔 (秒)')
+    parser.add_argument('--busy', type=float, default=8.0, help='模拟界面负载每次占用的时间 (毫秒)')
+    parser.add_argument('--idle', type=float, default=8.0, help='模拟界面负载每次的空闲时间 (毫秒)')
+    parser.add_argument('--dataset', default="dataset/isle_dawn", help='数据集目录')
+    parser.add_argument('--modes', default="thread,process", help='要测试的模式，逗号分隔')
+
+    args = parser.parse_args()
+    print("=== 导航引擎运行方式基准 ===")
+    print(f"CPU 核数: {os.cpu_count()}, 目标帧间隔: {args.period * 1000:.0f}ms, "
+          f"界面负载: 忙 {args.busy:.0f}ms / 闲 {args.idle:.0f}ms")
+    print()
+    print(f"{'模式':<10}{'帧数':>6}{'间隔均值':>10}{'间隔标准差':>11}{'偏差P99':>10}{'偏差最大':>10}"
+          f"{'超时帧':>8}{'处理P50':>10}{'处理P99':>10}")
+    for mode in args.modes.split(","):
+        row = run_mode(mode, args.duration, args.period, args.busy, args.idle, args.dataset)
+        if row is None:
+            print(f"{mode:<10}数据不足")
+            continue
+        print(f"{mode:<10}{row['frames']:>6}{row['interval_mean'] * 1000:>9.1f}ms"
+              f"{row['interval_std'] * 1000:>10.2f}ms{row['dev_p99'] * 1000:>8.2f}ms"
+              f"{row['dev_max'] * 1000:>8.2f}ms{row['late']:>8.1%}"
+              f"{row['process_p50'] * 1000:>8.2f}ms{row['process_p99'] * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,28 @@
 # -*- coding: utf-8 -*-
 """
 关键帧过滤脚本
-每隔5张图片保留1张，减少关键帧数量
+按匹配度精简路点：并行计算相邻若干张图片之间的匹配分数，求出相邻路点都能匹配上的最少路点子集，
+结果写成路点文件而不删除图片，换一个阈值重新求解几乎是瞬时的
+也保留原来的每隔 step 张保留 1 张 (会删除图片)
 """
 
 import os
+import json
+import time
 import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from utils.frame_similarity import SIMILARITY_BACKENDS, create_similarity
+from utils.generate_waypoints import build_waypoints
+from core.ui_mask import load_ui_mask, mask_signature
+from video_processor import dataset_mask
+
+
+PAIR_SCORE_FILE = "pair_scores.npz"
 
 
 def filter_keyframes(input_dir, step=5):
@@ -50,30 +67,243 @@ def filter_keyframes(input_dir, step=5):
     return len(kept_files), len(deleted_files)
 
 
+def _score_chunk(input_dir, files, start, stop, window, similarity):
+    """
+    子进程：计算 [start, stop) 中每张图片与其后 window 张图片的匹配分数
+
+    Returns:
+        list: [(i, j, 分数), ...]
+    """
+    backend = create_similarity(similarity)
+    mask = None
+    signatures = {}
+    for k in range(start, min(stop + window, len(files))):
+        gray = cv2.imread(os.path.join(input_dir, files[k]), cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            # 与提取关键帧时一致：遮挡 UI 和主角后再比较 (有学习得到的 UI 遮罩时使用该遮罩)
+            mask = dataset_mask(input_dir, gray.shape[1], gray.shape[0])
+            if hasattr(backend, "set_mask"):
+                backend.set_mask(mask)
+        signatures[k] = backend.prepare(cv2.bitwise_and(gray, gray, mask=mask))
+
+    scores = []
+    for i in range(start, stop):
+        for j in range(i + 1, min(i + window + 1, len(files))):
+            scores.append((i, j, backend.compare(signatures[i], signatures[j])))
+    return scores
+
+
+def compute_pair_scores(input_dir, files, window=20, workers=None, similarity="nav_orb"):
+    """
+    并行计算每张图片与其后 window 张图片的匹配分数
+    按连续区间分块，每块只需多读 window 张图片
+
+    Returns:
+        dict: {(i, j): 分数}
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk_count = min(len(files), workers * 4)
+    bounds = [len(files) * k // chunk_count for k in range(chunk_count + 1)]
+    scores = {}
+    # 与视频分段提取一致使用 spawn 进程池
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = [pool.submit(_score_chunk, input_dir, files, bounds[k], bounds[k + 1], window, similarity)
+                   for k in range(chunk_count) if bounds[k] < bounds[k + 1]]
+        for done, future in enumerate(futures, 1):
+            for i, j, score in future.result():
+                scores[(i, j)] = score
+            print(f"匹配分数计算进度: {done}/{len(futures)}")
+    return scores
+
+
+def load_pair_scores(input_dir, files, window, similarity):
+    """
+    读取缓存的匹配分数，图片列表、后端、UI 遮罩一致且缓存窗口不小于 window 时才可用
+
+    Returns:
+        dict: {(i, j): 分数}，不可用时返回 None
+    """
+    path = os.path.join(input_dir, PAIR_SCORE_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        # 旧缓存没有遮罩字段，当时只能使用固定矩形遮罩 (签名为 0)
+        cached_mask = int(data["mask"]) if "mask" in data.files else 0
+        if (list(data["files"]) != list(files) or str(data["similarity"]) != similarity
+                or int(data["window"]) < window or cached_mask != mask_signature(load_ui_mask(input_dir))):
+            return None
+        pairs = data["pairs"]
+        values = data["scores"]
+    return {(int(i), int(j)): float(s) for (i, j), s in zip(pairs, values) if j - i <= window}
+
+
+def save_pair_scores(input_dir, files, window, similarity, scores):
+    """把匹配分数缓存到数据集目录，之后换阈值不用重新计算"""
+    pairs = np.array(sorted(scores), dtype=np.int32).reshape(-1, 2)
+    values = np.array([scores[tuple(p)] for p in pairs], dtype=np.float32)
+    np.savez(os.path.join(input_dir, PAIR_SCORE_FILE), files=np.array(files), window=window,
+             similarity=similarity, mask=mask_signature(load_ui_mask(input_dir)), pairs=pairs, scores=values)
+
+
+def min_hop_path(count, scores, min_score, pinned=()):
+    """
+    求从第一张到最后一张、相邻路点分数都不低于 min_score 的最少路点序列
+
+    边只从前往后连，按序号顺序做动态规划即为有向无环图上的最短路 (等价于 BFS)；
+    相邻图片之间总是允许直连作为兜底，但记为弱连接，优先级：弱连接最少 > 路点最少 > 最弱一段的分数最高
+
+    Args:
+        count: 图片数量
+        scores: {(i, j): 分数}
+        min_score: 可匹配的最低分数
+        pinned: 必须保留的序号 (特殊动作路点)，路径不能跨过它们
+
+    Returns:
+        tuple: (保留的序号列表, 弱连接列表 [(i, j, 分数), ...])
+    """
+    pinned = sorted(set(pinned) | {0, count - 1})
+    next_pinned = [0] * count
+    k = 0
+    for i in range(count):
+        while pinned[k] <= i and k < len(pinned) - 1:
+            k += 1
+        next_pinned[i] = pinned[k]
+
+    # best[j] = (弱连接数, 路点数, -最弱分数)，越小越好
+    best = [None] * count
+    parent = [None] * count
+    best[0] = (0, 1, -1.0)
+    for i in range(count):
+        if best[i] is None:
+            continue
+        weak, hops, neg_bottleneck = best[i]
+        for j in range(i + 1, next_pinned[i] + 1):
+            score = scores.get((i, j))
+            strong = score is not None and score >= min_score
+            if not strong and j != i + 1:
+                continue
+            link = score if score is not None else 0.0
+            key = (weak + (0 if strong else 1), hops + 1, max(neg_bottleneck, -link))
+            if best[j] is None or key < best[j]:
+                best[j] = key
+                parent[j] = i
+
+    path = [count - 1]
+    while path[-1] != 0:
+        path.append(parent[path[-1]])
+    path.reverse()
+    weak_links = [(i, j, scores.get((i, j), 0.0)) for i, j in zip(path, path[1:])
+                  if scores.get((i, j), 0.0) < min_score]
+    return path, weak_links
+
+
+def decimate_keyframes(input_dir, min_score=0.02, window=20, workers=None, output=None,
+                       similarity="nav_orb", waypoints_file=None):
+    """
+    按匹配度精简路点，只写出路点文件，不删除图片
+
+    Args:
+        input_dir: 关键帧目录
+        min_score: 相邻路点的最低匹配分数 (nav_orb 为几何一致的特征重叠率)
+        window: 每张图片最多向后比较的张数，也是单次最多能跳过的张数
+        workers: 计算匹配分数的进程数，为 None 时使用 CPU 核数
+        output: 输出路点文件，默认 <input_dir>/waypoints_min<min_score>.json
+        similarity: 相似度后端名称
+        waypoints_file: 可选的原路点文件，保留图片沿用其中的动作等设置，非 walk 的路点必定保留
+
+    Returns:
+        tuple: (保留数量, 总数量)
+    """
+    files = sorted(f for f in os.listdir(input_dir) if f.startswith('frame_') and f.endswith('.jpg'))
+    if len(files) < 2:
+        print(f"关键帧数量不足: {len(files)}")
+        return len(files), len(files)
+    print(f"找到 {len(files)} 张关键帧图片，比较窗口 {window}，相似度后端 {similarity}")
+
+    start = time.perf_counter()
+    scores = load_pair_scores(input_dir, files, window, similarity)
+    if scores is None:
+        scores = compute_pair_scores(input_dir, files, window, workers, similarity)
+        save_pair_scores(input_dir, files, window, similarity, scores)
+        print(f"计算 {len(scores)} 对匹配分数，耗时 {time.perf_counter() - start:.2f}s")
+    else:
+        print(f"使用缓存的匹配分数 ({len(scores)} 对)")
+
+    # 原路点文件中的特殊动作路点 (起飞、跳跃等) 必须保留
+    source = {}
+    if waypoints_file and os.path.exists(waypoints_file):
+        with open(waypoints_file, 'r', encoding='utf-8') as f:
+            source = {wp['img_name']: wp for wp in json.load(f)}
+    pinned = [i for i, name in enumerate(files) if source.get(name, {}).get('action', 'walk') != 'walk']
+
+    solve_start = time.perf_counter()
+    path, weak_links = min_hop_path(len(files), scores, min_score, pinned)
+    solve_ms = (time.perf_counter() - solve_start) * 1000
+
+    waypoints = build_waypoints([files[i] for i in path])
+    for k, i in enumerate(path):
+        if files[i] in source:
+            waypoints[k] = dict(source[files[i]], id=k)
+        if k > 0:
+            waypoints[k]["link_score"] = round(scores.get((path[k - 1], i), 0.0), 4)
+
+    output = output or os.path.join(input_dir, f"waypoints_min{min_score:g}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(waypoints, f, indent=2, ensure_ascii=False)
+
+    links = [scores.get((i, j), 0.0) for i, j in zip(path, path[1:])]
+    print(f"保留 {len(path)}/{len(files)} 张 ({len(path) / len(files):.1%})，必须保留 {len(pinned)} 张，"
+          f"求解耗时 {solve_ms:.1f}ms")
+    print(f"相邻路点匹配分数: 最低 {min(links):.3f}，中位数 {float(np.median(links)):.3f}")
+    if weak_links:
+        print(f"警告：{len(weak_links)} 处相邻图片之间达不到 {min_score}，"
+              f"可能需要补录: {[(files[i], files[j], round(s, 3)) for i, j, s in weak_links[:5]]}")
+    print(f"路点文件已写出: {output}")
+    return len(path), len(files)
+
+
 def main():
     """
     主函数
     """
     parser = argparse.ArgumentParser(description="关键帧过滤脚本")
     parser.add_argument('--input', '-i', required=True, help='输入关键帧目录')
-    parser.add_argument('--step', '-s', type=int, default=5, help='保留间隔，每隔step张保留1张')
-    
+    parser.add_argument('--step', '-s', type=int, default=None,
+                        help='按固定间隔过滤：每隔step张保留1张 (会删除其余图片)')
+    parser.add_argument('--min_score', '-m', type=float, action='append',
+                        help='相邻路点的最低匹配分数，可重复指定以一次生成多种密度')
+    parser.add_argument('--window', type=int, default=20, help='每张图片最多向后比较的张数')
+    parser.add_argument('--workers', '-j', type=int, default=0, help='计算匹配分数的进程数 (0 为 CPU 核数)')
+    parser.add_argument('--similarity', choices=sorted(SIMILARITY_BACKENDS), default="nav_orb",
+                        help='匹配分数使用的相似度后端')
+    parser.add_argument('--waypoints', help='原路点文件，默认使用目录下的 waypoints.json')
+    parser.add_argument('--output', '-o', help='输出路点文件 (只指定一个阈值时有效)')
+
     args = parser.parse_args()
-    
+
     # 检查输入目录是否存在
     if not os.path.exists(args.input):
         print(f"输入目录不存在: {args.input}")
         return
-    
-    # 执行过滤
-    kept, deleted = filter_keyframes(args.input, args.step)
-    
-    print(f"\n过滤结果:")
-    print(f"总图片数: {kept + deleted}")
-    print(f"保留图片数: {kept}")
-    print(f"删除图片数: {deleted}")
-    print(f"保留比例: {kept / (kept + deleted):.2%}")
+
+    if args.step is not None:
+        # 执行过滤
+        kept, deleted = filter_keyframes(args.input, args.step)
+
+        print(f"\n过滤结果:")
+        print(f"总图片数: {kept + deleted}")
+        print(f"保留图片数: {kept}")
+        print(f"删除图片数: {deleted}")
+        print(f"保留比例: {kept / (kept + deleted):.2%}")
+        return
+
+    waypoints_file = args.waypoints or os.path.join(args.input, "waypoints.json")
+    thresholds = args.min_score or [0.02]
+    for min_score in thresholds:
+        decimate_keyframes(args.input, min_score, args.window, args.workers or None,
+                           args.output if len(thresholds) == 1 else None,
+                           args.similarity, waypoints_file)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
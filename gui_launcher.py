@@ -5,27 +5,57 @@
 实现紧急停止功能和状态显示
 """
 
+import argparse
 import tkinter as tk
 from tkinter import ttk
-import threading
 import time
 import keyboard  # 需要 pip install keyboard 用于全局热键
-import queue
-import os
 from PIL import Image, ImageTk
-from main import main_loop
+from main import create_engine
+from core.telemetry import TelemetryChannel, make_status_callback
+from core.engine_process import EngineProcess
+from core.profiler import ProfilerHook
+from core.metrics import PerfMonitor
+from utils.thumbnail_cache import ThumbnailCache
+from utils.perf_panel import PerfPanel
 
 
 class AdvancedGUI:
-    def __init__(self, root):
+    def __init__(self, root, engine_mode="thread"):
+        """
+        Args:
+            root: Tk 根窗口
+            engine_mode: "thread" 在本进程的线程中运行导航，"process" 在独立子进程中运行
+        """
         self.root = root
+        self.engine_mode = engine_mode
+        self.engine = None
         self.root.title("AutoSky Pro Dashboard")
-        self.root.geometry("800x600")
+        self.root.geometry("800x980" if engine_mode == "process" else "800x780")
         self.root.attributes('-topmost', True) # 窗口置顶
         
-        # 数据通信队列 (Logic Thread -> UI Thread)
-        self.data_queue = queue.Queue()
-        self.stop_event = threading.Event()
+        # 遥测通道 (Logic Thread -> UI Thread)：指标只保留最新值，UI 每次刷新只渲染一次
+        self.telemetry = TelemetryChannel()
+        
+        # 导航线程的性能计时，GUI 与导出线程共用
+        self.perf = PerfMonitor()
+        
+        # 导航线程的按需采样开关 (F11 或创建 profile.flag 文件触发)
+        self.profiler = ProfilerHook()
+        
+        # 常驻导航引擎 (线程模式)：启动时即在后台加载路线和特征，F9/F10 只恢复/暂停导航
+        self.nav_engine = None
+        if self.engine_mode == "thread":
+            self.nav_engine = create_engine(
+                perf=self.perf,
+                status_callback=make_status_callback(self.telemetry),
+                profiler=self.profiler,
+                telemetry=self.telemetry
+            ).start()
+        
+        # 路点缩略图在后台解码并预加载，UI 线程只创建 PhotoImage
+        self.thumbs = ThumbnailCache(size=(480, 270))
+        self.pending_img = None
         
         # === 布局 ===
         # 左侧：控制区
@@ -37,6 +67,8 @@ class AdvancedGUI:
         self.btn_start.pack(fill=tk.X, pady=5)
         self.btn_stop = ttk.Button(left_panel, text="停止 (F10)", command=self.stop, state=tk.DISABLED)
         self.btn_stop.pack(fill=tk.X, pady=5)
+        self.btn_profile = ttk.Button(left_panel, text="性能采样 (F11)", command=self.toggle_profile)
+        self.btn_profile.pack(fill=tk.X, pady=5)
         
         # 实时数据区
         self.lbl_status = ttk.Label(left_panel, text="状态: 就绪", foreground="gray")
@@ -52,6 +84,10 @@ class AdvancedGUI:
         self.score_bar = ttk.Progressbar(left_panel, length=150, mode='determinate', maximum=1.0)
         self.score_bar.pack(pady=5)
         
+        # 遥测通道统计：被合并的旧值 / 溢出丢弃的事件
+        self.var_telemetry = tk.StringVar(value="遥测: 合并 0 / 丢弃 0")
+        ttk.Label(left_panel, textvariable=self.var_telemetry, foreground="gray").pack(pady=5)
+        
         # 右侧：视觉区
         right_panel = ttk.Frame(root, padding="10")
         right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
@@ -62,113 +98,163 @@ class AdvancedGUI:
         self.img_label = ttk.Label(right_panel, text="等待加载...")
         self.img_label.pack(pady=10, expand=True)
         
+        # 子进程模式：显示子进程经共享内存发布的最新画面
+        self.live_label = None
+        self.live_ts = None
+        if self.engine_mode == "process":
+            ttk.Label(right_panel, text="实时画面", font=12).pack()
+            self.live_label = ttk.Label(right_panel, text="未运行")
+            self.live_label.pack(pady=5)
+        
+        # 性能面板：在 UI 线程中定时读取计数，不给导航线程增加工作
+        ttk.Label(right_panel, text="性能", font=12).pack()
+        self.perf_panel = PerfPanel(right_panel, self.perf, self.telemetry).pack(pady=5)
+        self.perf_panel.start()
+        
         # 定时刷新 UI
-        self.root.after(100, self.update_ui_from_queue)
+        self.root.after(100, self.update_ui_from_telemetry)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # 注册全局热键
         keyboard.add_hotkey('f9', self.start)
         keyboard.add_hotkey('f10', self.stop)
+        keyboard.add_hotkey('f11', self.toggle_profile)
 
     def update_image(self, img_path):
-        """更新 UI 显示的目标图片"""
-        if not os.path.exists(img_path):
+        """更新 UI 显示的目标图片 (缩略图未就绪时在后续刷新中显示)"""
+        pil_img = self.thumbs.get(img_path)
+        if pil_img is None:
+            self.pending_img = img_path
             return
-            
-        # 使用 Pillow 加载并调整大小
-        pil_img = Image.open(img_path)
-        # 保持比例缩放以适应 UI
-        pil_img.thumbnail((480, 270))
+        self.pending_img = None
+        self.show_thumbnail(pil_img)
+
+    def show_thumbnail(self, pil_img):
+        """把已缩放好的缩略图交给 Tk 显示"""
         tk_img = ImageTk.PhotoImage(pil_img)
         
         self.img_label.configure(image=tk_img, text="")
         self.img_label.image = tk_img # 保持引用防止被垃圾回收
 
+    def show_live_frame(self):
+        """显示子进程最新发布的画面 (同一帧不重复渲染)"""
+        latest = self.engine.latest_frame()
+        if latest is None or latest[0] == self.live_ts:
+            return
+        self.live_ts, frame = latest
+        pil_img = Image.fromarray(frame[:, :, ::-1]).resize((320, 180), Image.BILINEAR)
+        tk_img = ImageTk.PhotoImage(pil_img)
+        self.live_label.configure(image=tk_img, text="")
+        self.live_label.image = tk_img
+
     def start(self):
         if self.btn_start['state'] == tk.DISABLED:
             return
         
-        self.stop_event.clear()
+        if self.engine is not None:
+            # 上一个子进程还在退出：先等它结束并回收共享内存，它发出的停止事件随后被 reset 清掉
+            self.engine.stop()
+            self.engine = None
+        # 开始新一轮：之后收到的上一轮事件 (run_id 不同，如迟到的停止事件) 会被遥测通道丢弃
+        self.telemetry.reset()
         self.btn_start.config(state=tk.DISABLED)
         self.btn_stop.config(state=tk.NORMAL)
         self.lbl_status.config(text="运行中...", foreground="green")
         
-        # 启动逻辑线程
-        t = threading.Thread(target=self.run_logic_thread)
-        t.daemon = True
-        t.start()
+        if self.engine_mode == "process":
+            # 子进程引擎：画面和指标经共享内存回传，由 UI 刷新时 poll() 转发到遥测通道
+            self.engine = EngineProcess(self.telemetry).start()
+            self.live_ts = None
+            self.perf_panel.set_source(self.engine.perf)
+            return
+        
+        # 恢复常驻引擎的导航循环
+        self.perf_panel.set_source(self.perf)
+        self.nav_engine.resume()
 
     def stop(self):
         if self.btn_stop['state'] == tk.DISABLED:
             return
         
         self.lbl_status.config(text="状态: 正在停止...", foreground="orange")
-        self.stop_event.set() # 发送停止信号
+        # 发送停止信号
+        if self.nav_engine is not None:
+            self.nav_engine.pause()
+        if self.engine is not None:
+            self.engine.request_stop()
         
         # 等待线程结束（非阻塞方式）
         self.root.after(100, self.check_thread_stop)
 
+    def toggle_profile(self):
+        """开始/提前结束导航线程的性能采样"""
+        if self.engine is not None:
+            self.engine.toggle_profile()
+        else:
+            self.profiler.toggle()
+
     def check_thread_stop(self):
-        # 检查线程是否停止 - 这里简化处理，直接重置UI状态
+        # 子进程模式：等 poll() 确认子进程退出后再允许重新启动
+        if self.engine is not None:
+            self.root.after(100, self.check_thread_stop)
+            return
         self.btn_start.config(state=tk.NORMAL)
         self.btn_stop.config(state=tk.DISABLED)
         self.lbl_status.config(text="已停止", foreground="black")
 
-    def run_logic_thread(self):
-        """
-        这里运行原来的 main_loop
-        """
-        # 模拟传入回调函数给 main_loop
-        # 这里的 callback 是用来实时汇报数据的
-        def status_callback(current_img_path, score, threshold):
-            self.data_queue.put({
-                "type": "update",
-                "img": current_img_path,
-                "score": score,
-                "thresh": threshold
-            })
-            
-        try:
-            # 调用修改后的 main_loop
-            main_loop(self.stop_event, status_callback)
-            
-        except Exception as e:
-            print(f"Error: {e}")
-        finally:
-            self.data_queue.put({"type": "stop"})
+    def on_close(self):
+        """关闭窗口：停止导航并松开所有按键"""
+        if self.nav_engine is not None:
+            self.nav_engine.shutdown()
+        if self.engine is not None:
+            self.engine.stop()
+        self.thumbs.close()
+        self.root.destroy()
 
-    def update_ui_from_queue(self):
-        """在主线程中轮询队列，更新UI"""
-        try:
-            while True:
-                data = self.data_queue.get_nowait()
-                
-                if data["type"] == "update":
-                    # 更新分数显示
-                    score = data["score"]
-                    thresh = data["thresh"]
-                    
-                    self.var_score.set(f"匹配分: {score:.2f}")
-                    self.var_thresh.set(f"阈值: {thresh:.2f}")
-                    self.score_bar['value'] = score
-                    
-                    # 动态改变颜色：低于阈值显示红色警告（需要ttk style支持，这里简化处理）
-                    
-                    # 更新图片 (仅当路径变化时才重新加载，防止闪烁)
-                    if not hasattr(self, 'last_img') or self.last_img != data["img"]:
-                        self.update_image(data["img"])
-                        self.last_img = data["img"]
-                        
-                elif data["type"] == "stop":
-                    self.stop()
-                    
-        except queue.Empty:
-            pass
+    def update_ui_from_telemetry(self):
+        """在主线程中定时读取遥测通道，每次刷新只渲染一次最新状态"""
+        if self.engine is not None:
+            self.show_live_frame()
+        if self.engine is not None and not self.engine.poll():
+            # 子进程已退出 (正常停止或崩溃)，停止事件已由 poll() 发布
+            self.engine = None
+        metrics, events = self.telemetry.poll()
+        
+        if "score" in metrics:
+            score = metrics["score"]
+            self.var_score.set(f"匹配分: {score:.2f}")
+            self.score_bar['value'] = score
+        if "thresh" in metrics:
+            self.var_thresh.set(f"阈值: {metrics['thresh']:.2f}")
+        if "first_action" in metrics:
+            self.lbl_status.config(text=f"运行中... 首次动作 {metrics['first_action'] * 1000:.0f}ms")
+        
+        # 同一次刷新内多次切换路点时只显示最后一个，停止事件在最后处理
+        waypoints = [e["img"] for e in events if e["type"] == "waypoint"]
+        if waypoints:
+            self.update_image(waypoints[-1])
+        if any(e["type"] == "stop" for e in events):
+            self.stop()
+        
+        stats = self.telemetry.stats
+        self.var_telemetry.set(f"遥测: 合并 {stats['coalesced']} / 丢弃 {stats['dropped']}")
+        
+        # 显示后台刚解码完成的缩略图
+        if self.pending_img is not None:
+            pil_img = self.thumbs.peek(self.pending_img)
+            if pil_img is not None:
+                self.pending_img = None
+                self.show_thumbnail(pil_img)
         
         # 继续轮询
-        self.root.after(100, self.update_ui_from_queue)
+        self.root.after(100, self.update_ui_from_telemetry)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="光遇辅助程序UI控制器")
+    parser.add_argument('--process', action='store_true', help='在独立子进程中运行导航引擎')
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = AdvancedGUI(root)
+    app = AdvancedGUI(root, engine_mode="process" if args.process else "thread")
     root.mainloop()
\ No newline at end of file
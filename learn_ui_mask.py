@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序 UI 遮罩学习工具
+流式解码一段录像，统计逐像素的时间方差和边缘持续率，学习出静止的 HUD/主角区域，
+保存为数据集目录下的 ui_mask.png；之后 video_processor 提取关键帧、SkyNavigator 运行时匹配
+都会自动使用该遮罩代替 get_sky_mask 的固定矩形
+用法: python learn_ui_mask.py -i route.mp4 -o dataset/isle_dawn
+"""
+
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from core.ui_mask import UI_MASK_PREVIEW_FILE, UIMaskLearner, save_ui_mask
+from video_processor import get_sky_mask, open_video, read_frames, resize_frames
+
+
+def learn_ui_mask(video_path, target_size=(640, 360), stride=2, max_frames=0, **mask_kwargs):
+    """
+    从录像学习静态 UI 遮罩
+
+    Args:
+        video_path: 录像路径 (应包含镜头转动、场景变化，静止不动的画面学不出区别)
+        target_size: 处理分辨率 (宽, 高)，需与关键帧提取一致
+        stride: 采样间隔，相邻帧几乎相同，隔帧统计结果基本不变
+        max_frames: 最多统计的采样帧数 (0 为整段录像)
+        mask_kwargs: 传给 UIMaskLearner.mask 的阈值参数
+
+    Returns:
+        tuple: (遮罩, UIMaskLearner)，视频打不开时返回 (None, None)
+    """
+    cap, info = open_video(video_path)
+    if cap is None:
+        return None, None
+    width, height = tuple(target_size) if target_size is not None else (info["width"], info["height"])
+    learner = UIMaskLearner(width, height)
+
+    start = time.perf_counter()
+    try:
+        for _, frame in resize_frames(read_frames(cap, info["frames"], stride=stride), (width, height)):
+            learner.update(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            if max_frames and learner.count >= max_frames:
+                break
+    finally:
+        cap.release()
+    elapsed = time.perf_counter() - start
+    if learner.count < 2:
+        print("错误：采样帧数不足，无法统计")
+        return None, learner
+    print(f"统计 {learner.count} 帧 ({width}x{height})，耗时 {elapsed:.2f}s "
+          f"({elapsed / learner.count * 1000:.2f}ms/帧)")
+    return learner.mask(**mask_kwargs), learner
+
+
+def write_preview(path, learner, mask):
+    """写出预览图：上方为平均画面 (遮挡区域标红)，下方并排为标准差和边缘持续率热图"""
+    mean = cv2.cvtColor(np.clip(learner.mean, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    mean[mask == 0] = mean[mask == 0] // 2 + np.array([0, 0, 127], dtype=np.uint8)
+    std = cv2.applyColorMap(np.clip(learner.std * 4, 0, 255).astype(np.uint8), cv2.COLORMAP_JET)
+    edges = cv2.applyColorMap((learner.edge_persistence * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    heatmaps = cv2.resize(np.hstack([std, edges]), (mean.shape[1], mean.shape[0] // 2),
+                          interpolation=cv2.INTER_AREA)
+    cv2.imwrite(path, np.vstack([mean, heatmaps]))
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序 UI 遮罩学习工具")
+    parser.add_argument('--input', '-i', required=True, help='输入录像路径')
+    parser.add_argument('--output', '-o', required=True, help='数据集目录 (遮罩保存为其中的 ui_mask.png)')
+    parser.add_argument('--width', '-w', type=int, default=640, help='处理宽度 (与关键帧提取一致)')
+    parser.add_argument('--height', '-H', type=int, default=360, help='处理高度 (与关键帧提取一致)')
+    parser.add_argument('--stride', type=int, default=2, help='采样间隔')
+    parser.add_argument('--max_frames', type=int, default=0, help='最多统计的采样帧数 (0 为整段)')
+    parser.add_argument('--std', type=float, default=6.0, help='灰度标准差低于该值视为静止')
+    parser.add_argument('--edge', type=float, default=0.3, help='边缘持续率不低于该值视为静止 (0-1)')
+    parser.add_argument('--density', type=float, default=3.0,
+                        help='邻域边缘密度达到全帧中位数的该倍数视为静止 (主角区域，0 为不使用)')
+    parser.add_argument('--margin', type=float, default=0.01, help='遮挡区域向外扩张的宽度 (占帧宽比例)')
+    parser.add_argument('--preview', action='store_true', help='同时写出 ui_mask_preview.jpg 便于人工检查')
+
+    args = parser.parse_args()
+    mask, learner = learn_ui_mask(args.input, (args.width, args.height), args.stride, args.max_frames,
+                                  std_threshold=args.std, edge_persistence=args.edge, density=args.density,
+                                  margin=args.margin)
+    if mask is None:
+        return
+
+    covered = float((mask == 0).mean())
+    fixed = get_sky_mask(args.width, args.height)
+    print(f"遮挡面积 {covered:.1%} (固定矩形遮罩为 {float((fixed == 0).mean()):.1%})")
+    if covered > 0.5:
+        print("警告：遮挡面积超过一半，录像中的镜头可能变化太少，请换一段录像或调低 --std、调高 --edge / --density")
+    path = save_ui_mask(args.output, mask)
+    print(f"遮罩已保存: {path}")
+    if args.preview:
+        preview = os.path.join(args.output, UI_MASK_PREVIEW_FILE)
+        write_preview(preview, learner, mask)
+        print(f"预览图已保存: {preview}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,9 @@ from core.navigator import SkyNavigator
 from core.input_controller import InputController
 from core.vision import VisionSystem
 from core.input_emul import InputManager
+from core.metrics import PerfMonitor, MetricsExporter
+from core.recorder import RunRecorder
+from core.engine import NavigationEngine
 
 
 # === 关键：检查管理员权限 ===
@@ -31,6 +34,59 @@ def is_admin():
 DATASET_WIDTH = 640
 DATASET_HEIGHT = 360
 
+# 性能指标导出目录和导出间隔 (秒)
+PERF_LOG_DIR = "logs"
+PERF_EXPORT_INTERVAL = 10.0
+
+# 运行录制目录和磁盘占用上限，录制文件可用 replay_run.py 离线回放
+RUN_RECORD_DIR = "logs/runs"
+RUN_RECORD_MAX_BYTES = 200 * 1024 * 1024
+
+
+def start_perf_exporter(perf, log_dir=PERF_LOG_DIR, interval=PERF_EXPORT_INTERVAL):
+    """
+    启动性能指标定时导出线程
+    
+    Args:
+        perf: PerfMonitor 实例
+        log_dir: 导出目录，生成 perf_metrics.jsonl 和 perf_metrics.prom
+        interval: 导出间隔 (秒)
+        
+    Returns:
+        MetricsExporter: 已启动的导出器
+    """
+    exporter = MetricsExporter(
+        perf,
+        jsonl_path=os.path.join(log_dir, "perf_metrics.jsonl"),
+        prom_path=os.path.join(log_dir, "perf_metrics.prom"),
+        interval=interval
+    )
+    return exporter.start()
+
+
+def start_run_recorder(nav, record_dir=RUN_RECORD_DIR):
+    """
+    为本次运行创建录制器，录制目录按启动时间命名
+    
+    Args:
+        nav: SkyNavigator 实例，用于写入路线元信息
+        record_dir: 录制根目录
+        
+    Returns:
+        RunRecorder: 已启动的录制器
+    """
+    run_dir = os.path.join(record_dir, time.strftime("run_%Y%m%d_%H%M%S"))
+    meta = {
+        "dataset": nav.dataset_path,
+        "waypoints": nav.waypoints_file,
+        "start_idx": nav.current_idx,
+        "width": DATASET_WIDTH,
+        "height": DATASET_HEIGHT,
+        "started_at": time.time()
+    }
+    print(f"运行录制: {run_dir}")
+    return RunRecorder(run_dir, meta=meta, max_bytes=RUN_RECORD_MAX_BYTES).start()
+
 
 def main():
     """
@@ -62,14 +118,17 @@ def main():
     time.sleep(1)
     
     # 3. 初始化导航器 - 启用边缘特征
+    perf = PerfMonitor()
+    exporter = start_perf_exporter(perf)
     nav = SkyNavigator(
         "dataset/isle_dawn", 
         "dataset/isle_dawn/waypoints.json", 
-        use_edge_feature=True
+        use_edge_feature=True,
+        perf=perf
     )
     
     # 初始化输入控制器
-    ctrl = InputController()
+    ctrl = InputController(perf=perf)
     
     # 创建OpenCV窗口
     cv2.namedWindow("Sky Auto Navigator", cv2.WINDOW_NORMAL)
@@ -98,10 +157,12 @@ def main():
             start_time = time.time()
             
             # 使用新的VisionSystem进行区域截屏
-            screen = vision.capture_screen()
+            with perf.span("capture"):
+                screen = vision.capture_screen()
             
             # 缩放为标准处理分辨率
-            resized_screen = cv2.resize(screen, (DATASET_WIDTH, DATASET_HEIGHT))
+            with perf.span("resize"):
+                resized_screen = cv2.resize(screen, (DATASET_WIDTH, DATASET_HEIGHT))
             
             capture_time = time.time() - start_time
             
@@ -189,7 +250,7 @@ def main():
                     ctrl.move_left()
                 else:
                     print("停止左移")
-                    ctrl.stop_moving()
+                    ctrl.stop_left()
             elif key == ord('d'):
                 # 开始/停止右移
                 is_moving_right = not is_moving_right
@@ -198,7 +259,7 @@ def main():
                     ctrl.move_right()
                 else:
                     print("停止右移")
-                    ctrl.stop_moving()
+                    ctrl.stop_right()
             elif key == ord('s'):
                 # 停止所有移动
                 is_moving = False
@@ -215,7 +276,8 @@ def main():
             # 8. 自动视角调整
             # 只有在非盲飞模式下才调整视角
             if not nav.is_blind():
-                ctrl.align_camera(offset_x)
+                with perf.span("control"):
+                    ctrl.align_camera(offset_x, similarity)
             
             # 9. 检查是否到达目标
             if nav.check_arrival(similarity):
@@ -240,6 +302,8 @@ def main():
                 # 切换下一个目标
                 nav.next_waypoint()
             
+            perf.record("frame", time.time() - start_time)
+            
             # 10. 限制帧率
             time.sleep(0.1)
     
@@ -250,174 +314,75 @@ def main():
     finally:
         # 清理资源
         cv2.destroyAllWindows()
-        ctrl.stop_all_movement()
+        ctrl.close()
+        exporter.stop()
         print("=== 测试完成 ===")
 
 
-def main_loop(stop_event, status_callback=None):
+def create_engine(perf=None, status_callback=None, record_dir=RUN_RECORD_DIR, profiler=None,
+                  telemetry=None, frame_sink=None):
+    """
+    按主程序的默认配置创建导航引擎
+    
+    Args:
+        perf: PerfMonitor 实例，未传入时自动创建；加载时启动定时导出到 logs/
+        status_callback: 状态回调函数，用于实时汇报状态
+        record_dir: 运行录制根目录，为 None 时不录制
+        profiler: 可选的 ProfilerHook，用于按需采样导航线程
+        telemetry: 可选的 TelemetryChannel，每帧发布帧时间戳、连续丢失次数和盲飞状态
+        frame_sink: 可选的回调，每帧接收缩放后的画面 (例如写入共享内存供界面进程读取)
+        
+    Returns:
+        NavigationEngine: 尚未加载的引擎
+    """
+    recorder_factory = None
+    if record_dir is not None:
+        recorder_factory = lambda nav: start_run_recorder(nav, record_dir)
+    return NavigationEngine(
+        "dataset/isle_dawn",
+        "dataset/isle_dawn/waypoints.json",
+        width=DATASET_WIDTH,
+        height=DATASET_HEIGHT,
+        perf=perf,
+        status_callback=status_callback,
+        telemetry=telemetry,
+        frame_sink=frame_sink,
+        profiler=profiler,
+        recorder_factory=recorder_factory,
+        exporter_factory=start_perf_exporter
+    )
+
+
+def main_loop(stop_event, status_callback=None, perf=None, record_dir=RUN_RECORD_DIR, profiler=None,
+              telemetry=None, frame_sink=None):
     """
-    主循环函数，接受停止事件和状态回调
+    主循环函数，接受停止事件和状态回调 (每次调用都重新加载全部模块；
+    需要反复启停时使用 create_engine() 创建常驻引擎)
     
     Args:
         stop_event: 用于停止循环的事件对象
         status_callback: 状态回调函数，用于实时汇报状态
+        perf: PerfMonitor 实例，未传入时自动创建并定时导出到 logs/
+        record_dir: 运行录制根目录，为 None 时不录制
+        profiler: 可选的 ProfilerHook，用于按需采样本线程
+        telemetry: 可选的 TelemetryChannel，每帧发布帧时间戳、连续丢失次数和盲飞状态
+        frame_sink: 可选的回调，每帧接收缩放后的画面 (例如写入共享内存供界面进程读取)
     """
     print("导航线程启动")
+    requested_at = time.perf_counter()
+    
+    if profiler is not None:
+        profiler.attach()
+    engine = create_engine(perf, status_callback, record_dir, profiler, telemetry, frame_sink)
     
     try:
-        # 1. 实例化模块
-        vision = VisionSystem(window_title="Sky")
-        input_mgr = InputManager(window_title="Sky")
-        
-        # 初始化导航器和输入控制器
-        nav = SkyNavigator(
-            "dataset/isle_dawn", 
-            "dataset/isle_dawn/waypoints.json", 
-            use_edge_feature=True
-        )
-        ctrl = InputController()
-        
-        # 初始状态
-        is_moving = False
-        
-        # 初始校准：发送第一张路点图给 UI
-        if status_callback:
-            first_wp = nav.waypoints[0]
-            first_img_path = os.path.join(nav.dataset_path, first_wp['img_name'])
-            status_callback(first_img_path, 0.0, 0.0)
-        
-        print("开始初始校准...")
-        # 运行初始校准
-        calibrated = _initial_calibration(nav, ctrl, vision, stop_event, status_callback)
-        
-        if not calibrated:
-            print("校准失败，停止运行")
-            return
-        
-        print("校准成功，开始导航")
-        
-        while not stop_event.is_set():
-            # 1. 屏幕截图 & 缩放 - 使用区域截屏
-            frame = vision.capture_screen()
-            resized_frame = cv2.resize(frame, (DATASET_WIDTH, DATASET_HEIGHT))
-            
-            # === 调试代码 Start ===
-            # 调用预处理，看看机器看到的是什么
-            debug_edge = nav._preprocess(resized_frame)
-            if debug_edge is not None:
-                cv2.imshow("DEBUG: What Bot Sees", debug_edge)
-                cv2.waitKey(1)
-            # === 调试代码 End ===
-            
-            # 2. 计算偏移量
-            offset_x, similarity = nav.calculate_offset(resized_frame)
-            current_thresh = nav.waypoints[nav.current_idx].get('match_threshold', 0.6)
-            
-            # 3. 汇报状态给 UI
-            if status_callback:
-                # 获取当前目标图片的绝对路径
-                wp = nav.waypoints[nav.current_idx]
-                img_path = os.path.join(nav.dataset_path, wp['img_name'])
-                
-                status_callback(img_path, similarity, current_thresh)
-            
-            # 4. 检查是否到达目标
-            if nav.check_arrival(similarity):
-                print(f"到达目标 ID: {nav.current_idx}")
-                # 执行路点定义的特殊动作
-                current_action = nav.get_current_action()
-                action = current_action.get('action', 'walk')
-                
-                if action == 'fly_start':
-                    print("执行起飞动作")
-                    ctrl.jump()
-                    time.sleep(0.5)
-                    ctrl.fly_toggle()
-                    time.sleep(1) # 等待起飞动画
-                elif action == 'interact':
-                    print("执行交互动作")
-                    ctrl.interact()
-                    time.sleep(1) # 等待交互完成
-                elif action == 'jump':
-                    print("执行跳跃动作")
-                    ctrl.jump()
-                    time.sleep(0.5)
-                
-                # 切换下一个目标
-                nav.next_waypoint()
-                continue
-            
-            # 5. 自动视角调整
-            # 只有在非盲飞模式下才调整视角
-            if not nav.is_blind():
-                ctrl.align_camera(offset_x)
-            
-            # 6. 保持前进
-            if not is_moving:
-                is_moving = True
-                ctrl.move_forward()
-            
-            # 7. 限制帧率
-            time.sleep(0.1)
-            
+        engine.run(stop_event, requested_at=requested_at)
     except Exception as e:
         print(f"运行出错: {e}")
     finally:
         # 确保异常退出时UI状态重置
         print("清理资源...")
-        cv2.destroyAllWindows()
-        ctrl.stop_all_movement()
-
-
-def _initial_calibration(nav, ctrl, vision, stop_event, status_callback=None):
-    """
-    初始校准：寻找匹配的环境
-    
-    Args:
-        nav: SkyNavigator 实例
-        ctrl: InputController 实例
-        vision: VisionSystem 实例
-        stop_event: 停止事件
-        status_callback: 状态回调
-        
-    Returns:
-        bool: 校准成功返回 True，否则返回 False
-    """
-    search_attempts = 0
-    
-    while not stop_event.is_set():
-        # 1. 看一眼 - 使用区域截屏
-        frame = vision.capture_screen()
-        resized_frame = cv2.resize(frame, (DATASET_WIDTH, DATASET_HEIGHT))
-        
-        offset, score = nav.calculate_offset(resized_frame)
-        
-        # 2. 汇报状态
-        if status_callback:
-            wp = nav.waypoints[nav.current_idx]
-            img_path = os.path.join(nav.dataset_path, wp['img_name'])
-            status_callback(img_path, score, 0.6)  # 校准阈值固定为0.6
-        
-        # 3. 判断
-        if score > 0.6: # 找到了高置信度的匹配
-            print(f"校准成功！当前匹配分: {score:.2f}")
-            # 进行微调，把视角对正
-            if abs(offset) > 10:
-                ctrl.align_camera(offset)
-                time.sleep(0.5)
-                continue
-            return True # 进入正式导航
-            
-        # 4. 没找到，尝试原地旋转寻找
-        print(f"未找到目标 (Score: {score:.2f})，正在搜索环境...")
-        # 向右转一点
-        ctrl.align_camera(30)
-        time.sleep(0.5) # 等画面稳定
-        
-        search_attempts += 1
-        if search_attempts > 12: # 转了一圈也没找到
-            print("校准失败：请手动移动角色到近似起始位置")
-            return False
+        engine.close()
 
 
 if __name__ == "__main__":
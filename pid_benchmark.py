@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序视角控制基准测试
+在合成的偏差序列上离线仿真视角对准，对比旧的 P 控制器和新的 PID 控制器
+需要多少帧/多少时间才能对准
+"""
+
+import argparse
+import random
+import statistics
+
+from core.pid_controller import PIDController
+
+
+class LegacyPController:
+    """旧版 InputController.align_camera 的 P 控制器 (kp=0.5, ±50 限幅, 15 死区)"""
+
+    def __init__(self, kp=0.5, output_limit=50, deadzone=15):
+        self.kp = kp
+        self.output_limit = output_limit
+        self.deadzone = deadzone
+
+    def reset(self):
+        pass
+
+    def update(self, error, similarity=None, dt=None, now=None):
+        if abs(error) < self.deadzone:
+            return 0
+        move_x = int(error * self.kp)
+        return max(min(move_x, self.output_limit), -self.output_limit)
+
+
+def simulate(controller, initial_offset, loop_hz, seed, px_per_unit=1.0, camera_tau=0.08,
+             process_latency=0.02, noise_px=3.0, miss_rate=0.1, drift_px_s=15.0,
+             deadzone=15, settle_frames=3, max_frames=300):
+    """
+    仿真一次对准过程
+
+    模型：鼠标移动经过 process_latency 后生效，游戏视角以一阶惯性 (camera_tau) 跟随；
+    目标随角色前进以 drift_px_s 缓慢漂移；测量带高斯噪声，并以 miss_rate 概率丢失
+    (此时 calculate_offset 返回 0 偏差和 0 匹配分)
+
+    Returns:
+        dict: frames (对准所需帧数，未对准为 None)、seconds、overshoot、travel
+    """
+    rng = random.Random(seed)
+    controller.reset()
+    step = 0.001
+    frame_dt = 1.0 / loop_hz
+
+    offset = float(initial_offset)  # 目标相对画面中心的真实偏差 (像素)
+    pending = []                    # [(生效时间, 像素量)]
+    lagging = 0.0                   # 已生效但视角尚未跟上的旋转量
+    t = 0.0
+    settled = 0
+    overshoot = 0.0
+    travel = 0
+    sign = 1 if initial_offset >= 0 else -1
+
+    for frame in range(1, max_frames + 1):
+        # 帧间隔带 ±20% 抖动
+        next_capture = t + frame_dt * rng.uniform(0.8, 1.2)
+        while t < next_capture:
+            t += step
+            while pending and pending[0][0] <= t:
+                lagging += pending.pop(0)[1]
+            moved = lagging * (step / camera_tau) if camera_tau > 0 else lagging
+            lagging -= moved
+            offset -= moved
+            offset += drift_px_s * step
+        overshoot = max(overshoot, -sign * offset)
+
+        if abs(offset) < deadzone:
+            settled += 1
+            if settled >= settle_frames:
+                return {"frames": frame, "seconds": t, "overshoot": overshoot, "travel": travel}
+        else:
+            settled = 0
+
+        if rng.random() < miss_rate:
+            measured, similarity = 0.0, 0.0
+        else:
+            measured = offset + rng.gauss(0, noise_px)
+            similarity = min(1.0, max(0.0, rng.gauss(0.6, 0.12)))
+        move = controller.update(measured, similarity=similarity, now=t)
+        if move:
+            travel += abs(move)
+            pending.append((t + process_latency, move * px_per_unit))
+
+    return {"frames": None, "seconds": t, "overshoot": overshoot, "travel": travel}
+
+
+def run_benchmark(loop_rates, offsets, seeds, gains):
+    """
+    对每个控制器 × 帧率 × 视角灵敏度 跑全部合成序列
+
+    Returns:
+        list: 每个组合的汇总结果
+    """
+    controllers = {
+        "P (旧)": LegacyPController,
+        "PID": PIDController,
+    }
+    rows = []
+    for name, factory in controllers.items():
+        for hz in loop_rates:
+            for gain in gains:
+                results = [simulate(factory(), off, hz, seed, px_per_unit=gain)
+                           for off in offsets for seed in range(seeds)]
+                done = [r for r in results if r["frames"] is not None]
+                rows.append({
+                    "controller": name,
+                    "hz": hz,
+                    "gain": gain,
+                    "aligned": len(done) / len(results),
+                    "frames_median": statistics.median(r["frames"] for r in done) if done else None,
+                    "frames_p90": sorted(r["frames"] for r in done)[int(len(done) * 0.9) - 1] if done else None,
+                    "seconds_median": statistics.median(r["seconds"] for r in done) if done else None,
+                    "overshoot_median": statistics.median(r["overshoot"] for r in results),
+                    "travel_median": statistics.median(r["travel"] for r in results),
+                })
+    return rows
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序视角控制基准测试")
+    parser.add_argument('--rates', default="5,10,30", help='仿真的主循环帧率 (Hz)，逗号分隔')
+    parser.add_argument('--gains', default="0.7,1.0,1.5", help='鼠标单位到画面像素的比例，逗号分隔')
+    parser.add_argument('--seeds', type=int, default=20, help='每个初始偏差的随机种子数')
+
+    args = parser.parse_args()
+    loop_rates = [float(x) for x in args.rates.split(",")]
+    gains = [float(x) for x in args.gains.split(",")]
+    offsets = [-300, -180, -80, 60, 150, 260]
+
+    print("=== 视角对准收敛基准 ===")
+    print(f"初始偏差: {offsets}, 每组 {args.seeds} 个随机种子")
+    print()
+    print(f"{'控制器':<8}{'帧率':>6}{'灵敏度':>8}{'对准率':>8}{'帧数中位':>10}{'帧数P90':>9}"
+          f"{'耗时中位':>10}{'过冲中位':>10}{'鼠标行程':>10}")
+    for row in run_benchmark(loop_rates, offsets, args.seeds, gains):
+        frames = f"{row['frames_median']:.0f}" if row['frames_median'] is not None else "-"
+        frames_p90 = f"{row['frames_p90']:.0f}" if row['frames_p90'] is not None else "-"
+        seconds = f"{row['seconds_median']:.2f}s" if row['seconds_median'] is not None else "-"
+        print(f"{row['controller']:<8}{row['hz']:>6.0f}{row['gain']:>8.1f}{row['aligned']:>8.0%}"
+              f"{frames:>10}{frames_p90:>9}{seconds:>10}{row['overshoot_median']:>10.1f}"
+              f"{row['travel_median']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序运行回放脚本
+把 main_loop 录制的运行文件重新送入 SkyNavigator，复现延迟和导航决策，
+并可与其他版本的回放报告逐帧对比
+"""
+
+import argparse
+import json
+import os
+
+from core.navigator import SkyNavigator
+from core.recorder import KIND_META, read_run, replay_run
+
+
+def load_run_meta(run_dir):
+    """读取录制目录中第一条元信息记录"""
+    for kind, _, _, data in read_run(run_dir):
+        if kind == KIND_META:
+            return data
+    return {}
+
+
+def compare_reports(current, baseline):
+    """
+    逐帧对比两份回放报告
+
+    Args:
+        current: 本次回放报告
+        baseline: 基准回放报告
+
+    Returns:
+        dict: 决策差异帧数、匹配分最大偏差、延迟变化
+    """
+    base_by_frame = {d["frame"]: d for d in baseline["decisions"]}
+    changed = []
+    max_score_delta = 0.0
+    for d in current["decisions"]:
+        b = base_by_frame.get(d["frame"])
+        if b is None:
+            continue
+        max_score_delta = max(max_score_delta, abs(d["score"] - b["score"]))
+        if d["idx"] != b["idx"] or d["arrived"] != b["arrived"]:
+            changed.append(d["frame"])
+    return {
+        "changed_frames": changed,
+        "max_score_delta": max_score_delta,
+        "latency_p50_change": current["latency_p50"] - baseline["latency_p50"],
+        "latency_p95_change": current["latency_p95"] - baseline["latency_p95"],
+    }
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序运行回放脚本")
+    parser.add_argument('--run', '-r', required=True, help='录制目录 (logs/runs/run_xxx)')
+    parser.add_argument('--dataset', '-d', help='数据集目录，默认使用录制时的路线')
+    parser.add_argument('--waypoints', '-w', help='路点配置文件，默认使用录制时的路线')
+    parser.add_argument('--output', '-o', help='回放报告输出路径 (JSON)')
+    parser.add_argument('--compare', '-c', help='与之对比的基准回放报告 (JSON)')
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.run):
+        print(f"录制目录不存在: {args.run}")
+        return
+
+    meta = load_run_meta(args.run)
+    dataset = args.dataset or meta.get("dataset", "dataset/isle_dawn")
+    waypoints = args.waypoints or meta.get("waypoints", os.path.join(dataset, "waypoints.json"))
+
+    nav = SkyNavigator(dataset, waypoints, use_edge_feature=True)
+    nav.load_waypoint(meta.get("start_idx", 0))
+
+    print(f"正在回放: {args.run}")
+    report = replay_run(args.run, nav)
+
+    print("\n=== 回放结果 ===")
+    print(f"回放帧数: {report['frames']}")
+    print(f"与录制决策不一致: {report['mismatches']} 帧")
+    print(f"匹配分偏差: 平均 {report['score_delta_mean']:.4f}, 最大 {report['score_delta_max']:.4f}")
+    print(f"单帧导航耗时: p50 {report['latency_p50'] * 1000:.2f} ms, p95 {report['latency_p95'] * 1000:.2f} ms")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        diff = compare_reports(report, baseline)
+        report["comparison"] = dict(diff, baseline=args.compare)
+        print("\n=== 与基准报告对比 ===")
+        print(f"决策变化帧数: {len(diff['changed_frames'])}")
+        print(f"匹配分最大偏差: {diff['max_score_delta']:.4f}")
+        print(f"p50 耗时变化: {diff['latency_p50_change'] * 1000:+.2f} ms")
+        print(f"p95 耗时变化: {diff['latency_p95_change'] * 1000:+.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"回放报告已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序关键帧相似度后端对比
+对同一段录像只解码一次，分别用各相似度后端选择关键帧，
+与 scikit-image 全分辨率 SSIM 的选择结果对比数量、位置和耗时
+"""
+
+import argparse
+import time
+
+from utils.frame_similarity import create_similarity
+from video_processor import open_video, read_frames, resize_frames, mask_frames, get_sky_mask
+
+
+# 参与对比的后端配置：(显示名称, 后端名称, 构造参数)
+CANDIDATES = [
+    ("fast_ssim@1.0", "fast_ssim", {"scale": 1.0}),
+    ("fast_ssim@0.5", "fast_ssim", {"scale": 0.5}),
+    ("fast_ssim@0.25", "fast_ssim", {"scale": 0.25}),
+    ("thumb", "thumb", {}),
+    ("orb", "orb", {}),
+]
+
+
+def load_masked_frames(video_path, target_size, max_frames=None):
+    """解码并缓存遮罩后的灰度帧"""
+    cap, info = open_video(video_path)
+    if cap is None:
+        return []
+    mask = get_sky_mask(*target_size)
+    grays = []
+    for _, _, gray in mask_frames(resize_frames(read_frames(cap), target_size), mask):
+        grays.append(gray)
+        if max_frames and len(grays) >= max_frames:
+            break
+    cap.release()
+    return grays
+
+
+def select(signatures, backend, threshold):
+    """在预先计算好的签名序列上运行关键帧选择，返回关键帧序号列表"""
+    keyframes = [0]
+    ref = signatures[0]
+    for index in range(1, len(signatures)):
+        if backend.compare(ref, signatures[index]) < (1 - threshold):
+            keyframes.append(index)
+            ref = signatures[index]
+    return keyframes
+
+
+def match_keyframes(reference, candidate, tolerance):
+    """
+    按帧序号容差贪心配对两组关键帧
+
+    Returns:
+        dict: 配对数、精确率、召回率、配对的平均序号偏差
+    """
+    unmatched = sorted(candidate)
+    matched_offsets = []
+    for index in reference:
+        best = None
+        for other in unmatched:
+            if abs(other - index) <= tolerance and (best is None or abs(other - index) < abs(best - index)):
+                best = other
+        if best is not None:
+            unmatched.remove(best)
+            matched_offsets.append(abs(best - index))
+    matched = len(matched_offsets)
+    return {
+        "matched": matched,
+        "precision": matched / len(candidate) if candidate else 0.0,
+        "recall": matched / len(reference) if reference else 0.0,
+        "offset": sum(matched_offsets) / matched if matched else 0.0,
+    }
+
+
+def calibrate_threshold(signatures, backend, target_count, iterations=12):
+    """二分查找使关键帧数量最接近 target_count 的阈值 (阈值越大，关键帧越少)"""
+    low, high = 0.0, 1.0
+    best = None
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        count = len(select(signatures, backend, mid))
+        if best is None or abs(count - target_count) < best[0]:
+            best = (abs(count - target_count), mid)
+        if count > target_count:
+            low = mid
+        else:
+            high = mid
+    return best[1]
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序关键帧相似度后端对比")
+    parser.add_argument('--input', '-i', required=True, help='输入视频文件路径')
+    parser.add_argument('--threshold', '-t', type=float, default=0.3, help='关键帧提取阈值 (0-1)')
+    parser.add_argument('--tolerance', type=int, default=3, help='关键帧位置配对容差 (帧)')
+    parser.add_argument('--max_frames', type=int, default=0, help='最多使用的帧数 (0 表示全部)')
+    parser.add_argument('--width', '-w', type=int, default=640, help='处理宽度')
+    parser.add_argument('--height', '-H', type=int, default=360, help='处理高度')
+
+    args = parser.parse_args()
+    grays = load_masked_frames(args.input, (args.width, args.height), args.max_frames or None)
+    if len(grays) < 2:
+        print("帧数不足，无法对比")
+        return
+    print(f"=== 相似度后端对比: {args.input} ({len(grays)} 帧, 阈值 {args.threshold}) ===")
+
+    baseline = create_similarity("ssim")
+    start = time.perf_counter()
+    base_sigs = [baseline.prepare(g) for g in grays]
+    reference = select(base_sigs, baseline, args.threshold)
+    # 基准耗时按逐帧比较计算 (与提取时每帧一次 compare 一致)
+    for i in range(1, len(base_sigs)):
+        baseline.compare(base_sigs[0], base_sigs[i])
+    base_ms = (time.perf_counter() - start) / len(grays) * 1000
+    print(f"基准 skimage SSIM: {len(reference)} 个关键帧，{base_ms:.2f} ms/帧")
+    print()
+    print(f"{'后端':<16}{'ms/帧':>8}{'加速':>8}{'同阈值数量':>10}{'精确率':>8}{'召回率':>8}"
+          f"{'等量阈值':>10}{'数量':>6}{'精确率':>8}{'召回率':>8}{'偏差':>6}")
+
+    for label, name, kwargs in CANDIDATES:
+        backend = create_similarity(name, **kwargs)
+        start = time.perf_counter()
+        sigs = [backend.prepare(g) for g in grays]
+        for i in range(1, len(sigs)):
+            backend.compare(sigs[0], sigs[i])
+        ms = (time.perf_counter() - start) / len(grays) * 1000
+
+        same = select(sigs, backend, args.threshold)
+        same_match = match_keyframes(reference, same, args.tolerance)
+        calibrated = calibrate_threshold(sigs, backend, len(reference))
+        cal = select(sigs, backend, calibrated)
+        cal_match = match_keyframes(reference, cal, args.tolerance)
+        print(f"{label:<16}{ms:>8.2f}{base_ms / ms:>7.1f}x{len(same):>10}{same_match['precision']:>8.0%}"
+              f"{same_match['recall']:>8.0%}{calibrated:>10.3f}{len(cal):>6}{cal_match['precision']:>8.0%}"
+              f"{cal_match['recall']:>8.0%}{cal_match['offset']:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
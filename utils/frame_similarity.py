@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序帧相似度后端
+关键帧提取使用的可替换相似度度量：skimage SSIM、降采样盒式滤波 SSIM、缩略图差异、ORB 特征重叠、
+导航同款特征重叠
+每个后端先把帧转换成签名 (prepare)，再比较两个签名 (compare)，参考帧的签名只需计算一次
+"""
+
+import cv2
+import numpy as np
+
+from core.features import create_orb, edge_map, MATCH_MAX_DISTANCE
+
+
+class SkimageSSIM:
+    """skimage.metrics.structural_similarity，全分辨率 (原始实现，作为精度基准)"""
+
+    name = "ssim"
+
+    def __init__(self):
+        # scikit-image 为可选依赖，只有选择该后端时才需要
+        from skimage.metrics import structural_similarity
+        self._ssim = structural_similarity
+
+    def prepare(self, gray):
+        return gray
+
+    def compare(self, ref, cur):
+        return float(self._ssim(ref, cur))
+
+
+class FastSSIM:
+    """
+    OpenCV 实现的 SSIM：先按 scale 降采样，再用 7x7 盒式滤波计算局部统计量
+    (与 skimage 默认参数一致：均匀窗口、样本协方差、K1=0.01、K2=0.03、data_range=255)
+    参考帧的均值和方差在 prepare 中预先算好，compare 只需计算协方差项；
+    scale=1.0 时与 skimage 结果一致，降采样更快但分数整体偏低，需要相应调整阈值
+    """
+
+    name = "fast_ssim"
+
+    def __init__(self, scale=1.0, win_size=7):
+        self.scale = scale
+        self.win_size = win_size
+        self._ksize = (win_size, win_size)
+        self._cov_norm = win_size * win_size / (win_size * win_size - 1.0)
+        self._c1 = (0.01 * 255) ** 2
+        self._c2 = (0.03 * 255) ** 2
+        self._pad = (win_size - 1) // 2
+
+    def _blur(self, img):
+        return cv2.boxFilter(img, cv2.CV_32F, self._ksize, normalize=True, borderType=cv2.BORDER_REFLECT)
+
+    def prepare(self, gray):
+        if self.scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        img = gray.astype(np.float32)
+        mu = self._blur(img)
+        var = self._cov_norm * (self._blur(img * img) - mu * mu)
+        return img, mu, var
+
+    def compare(self, ref, cur):
+        x, mu_x, var_x = ref
+        y, mu_y, var_y = cur
+        cov = self._cov_norm * (self._blur(x * y) - mu_x * mu_y)
+        num = (2 * mu_x * mu_y + self._c1) * (2 * cov + self._c2)
+        den = (mu_x * mu_x + mu_y * mu_y + self._c1) * (var_x + var_y + self._c2)
+        ssim_map = num / den
+        p = self._pad
+        return float(ssim_map[p:-p, p:-p].mean())
+
+
+class ThumbDiff:
+    """缩略图平均绝对差：1 - mean(|a - b|) / 255，最快，但对结构变化不如 SSIM 敏感"""
+
+    name = "thumb"
+
+    def __init__(self, size=(64, 36)):
+        self.size = tuple(size)
+
+    def prepare(self, gray):
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    def compare(self, ref, cur):
+        return 1.0 - float(cv2.absdiff(ref, cur).mean()) / 255.0
+
+
+class OrbOverlap:
+    """ORB 特征重叠率：交叉验证的优质匹配数 / 两帧中较少的特征点数"""
+
+    name = "orb"
+
+    def __init__(self, nfeatures=500, max_distance=50):
+        self.nfeatures = nfeatures
+        self.max_distance = max_distance
+        self.orb = cv2.ORB_create(nfeatures=nfeatures)
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+
+    def __getstate__(self):
+        # cv2 对象不能序列化，传给子进程时只带参数，到子进程里重建
+        return {"nfeatures": self.nfeatures, "max_distance": self.max_distance}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def prepare(self, gray):
+        _, des = self.orb.detectAndCompute(gray, None)
+        return des
+
+    def compare(self, ref, cur):
+        if ref is None or cur is None or len(ref) == 0 or len(cur) == 0:
+            return 0.0
+        matches = self.matcher.match(ref, cur)
+        good = sum(1 for m in matches if m.distance < self.max_distance)
+        return good / min(len(ref), len(cur))
+
+
+class NavFeatureOverlap:
+    """
+    导航同款特征的重叠率：Canny 边缘图 + ORB(1500, FAST_SCORE)，与 SkyNavigator 完全一致
+    分数为参考帧特征点中几何一致的匹配比例：交叉验证且距离小于 60 的匹配，
+    再用 RANSAC 相似变换剔除误匹配 (边缘图上无关画面也有约 10% 的特征能配上，只看匹配数区分不开)
+    select_last_match 为 True：重叠率跌破目标时保存仍达标的上一帧，保证相邻关键帧都能匹配上
+    """
+
+    name = "nav_orb"
+    select_last_match = True
+
+    def __init__(self, border=16, reproj_threshold=4.0):
+        self.border = border
+        self.reproj_threshold = reproj_threshold
+        self.orb = create_orb()
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        self._detect_mask = None
+
+    def __getstate__(self):
+        return {"border": self.border, "reproj_threshold": self.reproj_threshold,
+                "detect_mask": self._detect_mask}
+
+    def __setstate__(self, state):
+        self.__init__(state["border"], state["reproj_threshold"])
+        self._detect_mask = state["detect_mask"]
+
+    def set_mask(self, mask):
+        """设置 UI 遮罩：遮罩边缘会在边缘图中形成假轮廓，检测区域再向内收缩 border 像素"""
+        kernel = np.ones((2 * self.border + 1, 2 * self.border + 1), dtype=np.uint8)
+        self._detect_mask = cv2.erode(mask, kernel)
+
+    def prepare(self, gray):
+        mask = self._detect_mask
+        if mask is not None and mask.shape != gray.shape:
+            mask = None
+        keypoints, des = self.orb.detectAndCompute(edge_map(gray), mask)
+        return np.float32([kp.pt for kp in keypoints]).reshape(-1, 2), des
+
+    def compare(self, ref, cur):
+        ref_pts, ref_des = ref
+        cur_pts, cur_des = cur
+        if ref_des is None or cur_des is None or len(ref_des) == 0 or len(cur_des) == 0:
+            return 0.0
+        matches = [m for m in self.matcher.match(ref_des, cur_des) if m.distance < MATCH_MAX_DISTANCE]
+        if len(matches) < 4:
+            return 0.0
+        src = ref_pts[[m.queryIdx for m in matches]]
+        dst = cur_pts[[m.trainIdx for m in matches]]
+        _, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC,
+                                                 ransacReprojThreshold=self.reproj_threshold)
+        if inliers is None:
+            return 0.0
+        return float(inliers.sum()) / len(ref_des)
+
+
+# 名称 -> 后端类
+SIMILARITY_BACKENDS = {
+    SkimageSSIM.name: SkimageSSIM,
+    FastSSIM.name: FastSSIM,
+    ThumbDiff.name: ThumbDiff,
+    OrbOverlap.name: OrbOverlap,
+    NavFeatureOverlap.name: NavFeatureOverlap,
+}
+
+DEFAULT_SIMILARITY = FastSSIM.name
+
+
+def create_similarity(name=DEFAULT_SIMILARITY, **kwargs):
+    """
+    按名称创建相似度后端
+
+    Args:
+        name: ssim / fast_ssim / thumb / orb / nav_orb
+        kwargs: 传给后端构造函数的参数
+    """
+    if name not in SIMILARITY_BACKENDS:
+        raise ValueError(f"未知的相似度后端: {name}，可选: {', '.join(SIMILARITY_BACKENDS)}")
+    return SIMILARITY_BACKENDS[name](**kwargs)
@@ -3,25 +3,26 @@
 """
 光遇辅助程序路点配置生成脚本
 根据图片文件夹自动生成路点配置文件
+用法: python -m utils.generate_waypoints --input dataset/isle_dawn
 """
 
 import os
 import json
 import argparse
 
+from core.ui_mask import UI_MASK_FILES
 
-def generate_json(dataset_folder, output_file):
+
+def build_waypoints(files):
     """
-    生成路点配置文件
+    按图片文件名列表生成默认路点
     
     Args:
-        dataset_folder: 图片数据集文件夹路径
-        output_file: 输出JSON文件路径
+        files: 按路线顺序排列的图片文件名
+        
+    Returns:
+        list: 路点字典列表
     """
-    # 获取所有图片文件
-    files = sorted([f for f in os.listdir(dataset_folder) 
-                  if f.endswith('.jpg') or f.endswith('.png')])
-    
     waypoints = []
     for i, filename in enumerate(files):
         # 默认动作都是 "walk" (行走/滑行)
@@ -39,6 +40,38 @@ def generate_json(dataset_folder, output_file):
             wp["description"] = "Start Point"
             
         waypoints.append(wp)
+    return waypoints
+
+
+def generate_json(dataset_folder, output_file, dedup_radius=None, calibrate=False, calibrate_window=2, workers=None):
+    """
+    生成路点配置文件
+    
+    Args:
+        dataset_folder: 图片数据集文件夹路径
+        output_file: 输出JSON文件路径
+        dedup_radius: 可选，感知哈希与上一个路点的汉明距离不超过该值时视为重复 (悬停、加载画面) 并跳过
+        calibrate: 为每个路点校准 match_threshold (自身扰动分数与邻居分数之间)，代替固定的 0.6
+        calibrate_window: 校准时前后各取几个路点作为邻居
+        workers: 校准 / 去重的进程数，为 None 时使用 CPU 核数
+    """
+    # 获取所有图片文件
+    files = sorted([f for f in os.listdir(dataset_folder) 
+                  if (f.endswith('.jpg') or f.endswith('.png')) and f not in UI_MASK_FILES])
+    
+    if dedup_radius is not None:
+        # 按需导入：去重和校准会加载 video_processor 等较重的模块
+        from utils.phash_index import hash_files, dedup_sequence
+        hashes = hash_files([os.path.join(dataset_folder, f) for f in files], workers)
+        kept = dedup_sequence(hashes, dedup_radius)
+        print(f"感知哈希去重：{len(files)} 张中跳过 {len(files) - len(kept)} 张近似重复")
+        files = [files[i] for i in kept]
+    
+    waypoints = build_waypoints(files)
+    
+    if calibrate:
+        from utils.match_calibration import apply_calibration, calibrate_waypoints
+        apply_calibration(waypoints, calibrate_waypoints(dataset_folder, files, calibrate_window, workers))
 
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(waypoints, f, indent=2, ensure_ascii=False)
@@ -53,6 +86,14 @@ if __name__ == "__main__":
                       help='图片数据集文件夹路径')
     parser.add_argument('--output', '-o', 
                       help='输出JSON文件路径，默认在数据集文件夹下生成waypoints.json')
+    parser.add_argument('--dedup', type=int, default=None,
+                      help='按感知哈希跳过与上一个路点近似重复的图片 (汉明距离阈值，如 4)')
+    parser.add_argument('--calibrate', action='store_true',
+                      help='为每个路点自动校准到达阈值 (match_threshold)，分数分布保存到 match_calibration.json')
+    parser.add_argument('--calibrate_window', type=int, default=2,
+                      help='校准时前后各取几个路点作为邻居')
+    parser.add_argument('--workers', '-j', type=int, default=0,
+                      help='校准 / 去重的进程数 (0 为 CPU 核数)')
     
     args = parser.parse_args()
     
@@ -68,4 +109,4 @@ if __name__ == "__main__":
         output_path = os.path.join(args.input, "waypoints.json")
     
     # 执行生成
-    generate_json(args.input, output_path)
\ No newline at end of file
+    generate_json(args.input, output_path, args.dedup, args.calibrate, args.calibrate_window, args.workers or None)
\ No newline at end of file
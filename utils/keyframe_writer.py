@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序关键帧写出线程池
+JPEG 编码和磁盘写入交给后台线程 (cv2.imencode 和文件写入都会释放 GIL)，解码循环不再被写盘卡住；
+在途任务数有上限，写得慢时 submit 阻塞形成背压，避免内存无限堆积；
+可在同一次写出中生成缩略图 (thumbs/，供 ThumbnailCache 使用) 和导航特征 (features/)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from core.features import compute_features, feature_path, save_features
+from utils.thumbnail_cache import THUMB_DIR_NAME
+
+
+class KeyframeWriter:
+    """
+    有界的关键帧写出线程池
+    文件名由调用方在 submit 时决定，写完成的先后顺序不影响命名
+    """
+
+    def __init__(self, workers=2, max_pending=8, thumbs=False, features=False, thumb_size=(480, 270),
+                 feature_mask=None):
+        """
+        Args:
+            workers: 写出线程数
+            max_pending: 在途 (已提交未写完) 的关键帧上限，超过时 submit 阻塞
+            thumbs: 同时写出缩略图到 thumbs/ 子目录
+            features: 同时计算导航特征写到 features/ 子目录
+            thumb_size: 缩略图最大尺寸 (宽, 高)，与 ThumbnailCache 默认一致
+            feature_mask: 计算特征时使用的 UI 遮罩 (数据集的 ui_mask.png)，与运行时检测范围一致
+        """
+        self.thumbs = thumbs
+        self.features = features
+        self.thumb_size = thumb_size
+        self.feature_mask = feature_mask
+        self.stats = {"written": 0, "existing": 0, "encode": 0.0, "io": 0.0, "thumbs": 0.0, "features": 0.0,
+                      "wait": 0.0}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="KeyframeWriter")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._error = None
+        self._submitted = 0
+        self._finished = set()  # 已完成但前面还有未完成任务的序号
+        self.completed = 0      # 从第一个任务起连续完成的任务数 (断点续传只能信任这部分)
+
+    def submit(self, path, frame):
+        """
+        提交一个关键帧，在途任务已满时阻塞等待 (背压)
+
+        Args:
+            path: 输出 JPEG 路径
+            frame: BGR 图像 (提交后调用方不应再修改)
+        """
+        self._raise_error()
+        start = time.perf_counter()
+        self._slots.acquire()
+        self._add("wait", time.perf_counter() - start)
+        future = self._pool.submit(self._write, path, frame)
+        self._track(future)
+
+    def submit_existing(self, path):
+        """已经写好的关键帧 (如分段提取的临时文件改名而来)，只补做缩略图和特征"""
+        self._add("existing", 1)
+        self._raise_error()
+        start = time.perf_counter()
+        self._slots.acquire()
+        self._add("wait", time.perf_counter() - start)
+        future = self._pool.submit(self._extras_from_file, path)
+        self._track(future)
+
+    def close(self):
+        """等待全部写完；有写出失败时抛出第一个错误"""
+        self._pool.shutdown(wait=True)
+        self._raise_error()
+
+    def summary(self):
+        """耗时汇总字符串 (各线程累计秒数)"""
+        s = self.stats
+        text = f"写出 {s['written']} 个关键帧：编码 {s['encode']:.2f}s，IO {s['io']:.2f}s"
+        if s["existing"]:
+            text += f" (另有 {s['existing']} 个已写好的关键帧)"
+        if self.thumbs:
+            text += f"，缩略图 {s['thumbs']:.2f}s"
+        if self.features:
+            text += f"，特征 {s['features']:.2f}s"
+        return text + f"，背压等待 {s['wait']:.2f}s"
+
+    def _write(self, path, frame):
+        t0 = time.perf_counter()
+        ok, buf = cv2.imencode(os.path.splitext(path)[1] or ".jpg", frame)
+        if not ok:
+            raise IOError(f"关键帧编码失败: {path}")
+        t1 = time.perf_counter()
+        with open(path, 'wb') as f:
+            f.write(buf.tobytes())
+        t2 = time.perf_counter()
+        self._add("encode", t1 - t0)
+        self._add("io", t2 - t1)
+        self._add("written", 1)
+        if self.thumbs:
+            self._write_thumb(path, frame)
+        if self.features:
+            # 用编码后的 JPEG 解码结果计算，与运行时读图得到的特征完全一致
+            self._write_features(path, cv2.imdecode(buf, cv2.IMREAD_COLOR))
+
+    def _extras_from_file(self, path):
+        if not (self.thumbs or self.features):
+            return
+        frame = cv2.imread(path)
+        if frame is None:
+            raise IOError(f"读取关键帧失败: {path}")
+        if self.thumbs:
+            self._write_thumb(path, frame)
+        if self.features:
+            self._write_features(path, frame)
+
+    def _write_thumb(self, path, frame):
+        start = time.perf_counter()
+        height, width = frame.shape[:2]
+        scale = min(self.thumb_size[0] / width, self.thumb_size[1] / height, 1.0)
+        thumb = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        thumb_dir = os.path.join(os.path.dirname(path), THUMB_DIR_NAME)
+        os.makedirs(thumb_dir, exist_ok=True)
+        cv2.imwrite(os.path.join(thumb_dir, os.path.basename(path)), thumb)
+        self._add("thumbs", time.perf_counter() - start)
+
+    def _write_features(self, path, frame):
+        start = time.perf_counter()
+        keypoints, descriptors = compute_features(frame, mask=self.feature_mask)
+        save_features(feature_path(os.path.dirname(path), os.path.basename(path)), keypoints, descriptors,
+                      mask=self.feature_mask)
+        self._add("features", time.perf_counter() - start)
+
+    def _add(self, key, value):
+        with self._lock:
+            self.stats[key] += value
+
+    def _track(self, future):
+        with self._lock:
+            ticket = self._submitted
+            self._submitted += 1
+        future.add_done_callback(lambda f: self._done(f, ticket))
+
+    def _done(self, future, ticket):
+        self._slots.release()
+        error = future.exception()
+        with self._lock:
+            if error is not None:
+                if self._error is None:
+                    self._error = error
+                return
+            self._finished.add(ticket)
+            while self.completed in self._finished:
+                self._finished.remove(self.completed)
+                self.completed += 1
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
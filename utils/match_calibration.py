@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序路点匹配阈值校准
+对每个路点，用导航同款的特征和匹配度计算两组分数：
+  自身分数 —— 路点图片经过光照、模糊、噪声、小幅平移缩放等扰动后与原图的匹配度 (模拟到达该路点时的画面)
+  邻居分数 —— 路线上前后相邻路点的图片与它的匹配度 (模拟还没到或已经走过时的画面)
+取能把两组分开的值作为该路点的 match_threshold，分数分布保存到数据集的 match_calibration.json
+用法: python -m utils.match_calibration --input dataset/isle_dawn
+"""
+
+import os
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from core.features import compute_features, create_orb, navigation_score
+from core.ui_mask import load_ui_mask
+
+
+CALIBRATION_FILE = "match_calibration.json"
+
+
+def _shift(img, dx):
+    width = img.shape[1]
+    m = np.float32([[1, 0, dx * width], [0, 1, 0]])
+    return cv2.warpAffine(img, m, (width, img.shape[0]), borderMode=cv2.BORDER_REFLECT)
+
+
+def _zoom(img, scale, angle=0.0):
+    height, width = img.shape[:2]
+    m = cv2.getRotationMatrix2D((width / 2, height / 2), angle, scale)
+    return cv2.warpAffine(img, m, (width, height), borderMode=cv2.BORDER_REFLECT)
+
+
+def _noise(img, sigma):
+    rng = np.random.default_rng(0)  # 固定种子，校准结果可复现
+    return np.clip(img + rng.normal(0, sigma, img.shape), 0, 255).astype(np.uint8)
+
+
+def _jpeg(img, quality):
+    _, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+# 名称 -> 扰动：到达路点时画面与录像时的常见差异 (时段光照、运动模糊、画质、站位和朝向的小偏差)
+AUGMENTATIONS = {
+    "brighter": lambda img: cv2.convertScaleAbs(img, alpha=1.0, beta=25),
+    "darker": lambda img: cv2.convertScaleAbs(img, alpha=1.0, beta=-25),
+    "contrast": lambda img: cv2.convertScaleAbs(img, alpha=1.25, beta=-30),
+    "blur": lambda img: cv2.GaussianBlur(img, (5, 5), 0),
+    "noise": lambda img: _noise(img, 6),
+    "jpeg": lambda img: _jpeg(img, 40),
+    "shift_left": lambda img: _shift(img, -0.03),
+    "shift_right": lambda img: _shift(img, 0.03),
+    "zoom_in": lambda img: _zoom(img, 1.05),
+    "zoom_out": lambda img: _zoom(img, 0.95),
+    "rotate": lambda img: _zoom(img, 1.0, 2.0),
+}
+
+
+def derive_threshold(self_scores, neighbor_scores, quantile=0.1):
+    """
+    由两组分数求到达阈值 (到达判定为 分数 > 阈值)
+
+    两组可分开时 (自身分数的 quantile 分位数高于邻居最高分) 取二者中点，两边留出同样的余量；
+    不可分时取两类误判率之和最小的阈值 (邻居分数 > 阈值算提前切换，自身分数 <= 阈值算到达未触发；
+    按比例计，两组样本数不同也不会偏向一方)，相同时取较高的阈值，宁可多等几帧也不提前切换
+
+    Returns:
+        tuple: (阈值, 是否可分)
+    """
+    positives = np.asarray(self_scores, dtype=np.float64)
+    negatives = np.asarray(neighbor_scores, dtype=np.float64)
+    low = float(np.quantile(positives, quantile))
+    if len(negatives) == 0:
+        return max(0.0, low - 0.02), True
+    high = float(negatives.max())
+    if low > high:
+        return (low + high) / 2, True
+    candidates = np.unique(np.concatenate([positives, negatives]))
+    errors = [(negatives > t).mean() + (positives <= t).mean() for t in candidates]
+    best = min(errors)
+    return float(max(t for t, e in zip(candidates, errors) if e == best)), False
+
+
+def _calibrate_chunk(dataset_folder, files, start, stop, window):
+    """
+    子进程：计算 [start, stop) 中每个路点的自身分数和邻居分数
+
+    Returns:
+        list: [(序号, {扰动名: 分数}, {邻居序号: 分数}), ...]
+    """
+    orb = create_orb()
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    mask = load_ui_mask(dataset_folder)  # 与 SkyNavigator 一致：有学习得到的 UI 遮罩时只在可用区域检测
+    images = {}
+    descriptors = {}
+    for k in range(max(0, start - window), min(stop + window, len(files))):
+        images[k] = cv2.imread(os.path.join(dataset_folder, files[k]))
+        if images[k] is not None:
+            descriptors[k] = compute_features(images[k], orb, mask=mask)[1]
+
+    results = []
+    for i in range(start, stop):
+        if images[i] is None:
+            results.append((i, {}, {}))
+            continue
+        target = descriptors[i]
+        self_scores = {}
+        for name, augment in AUGMENTATIONS.items():
+            _, des = compute_features(augment(images[i]), orb, mask=mask)
+            self_scores[name] = navigation_score(matcher, target, des)
+        neighbor_scores = {j: navigation_score(matcher, target, descriptors[j])
+                           for j in range(i - window, i + window + 1)
+                           if j != i and j in descriptors}
+        results.append((i, self_scores, neighbor_scores))
+    return results
+
+
+def calibrate_waypoints(dataset_folder, files, window=2, workers=None, quantile=0.1):
+    """
+    并行校准每个路点的到达阈值，分数分布写到 <数据集>/match_calibration.json
+
+    Args:
+        dataset_folder: 数据集目录
+        files: 按路线顺序排列的路点图片文件名
+        window: 前后各取几个路点作为邻居
+        workers: 进程数，为 None 时使用 CPU 核数
+        quantile: 自身分数取该分位数作为"到达时的最低分数"，排除个别过强的扰动
+
+    Returns:
+        list: 与 files 对应的 {"threshold", "separable", "self", "neighbors"}，读图失败的为 None
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk_count = max(1, min(len(files), workers * 4))
+    bounds = [len(files) * k // chunk_count for k in range(chunk_count + 1)]
+    start_time = time.perf_counter()
+    raw = {}
+    if workers == 1:
+        # 单进程 (如在批量处理的子进程中) 直接计算，不再嵌套进程池
+        chunks = [_calibrate_chunk(dataset_folder, files, 0, len(files), window)]
+    else:
+        # 与关键帧分段提取一致使用 spawn 进程池
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = [pool.submit(_calibrate_chunk, dataset_folder, files, bounds[k], bounds[k + 1], window)
+                       for k in range(chunk_count) if bounds[k] < bounds[k + 1]]
+            chunks = []
+            for done, future in enumerate(futures, 1):
+                chunks.append(future.result())
+                print(f"阈值校准进度: {done}/{len(futures)}")
+    for chunk in chunks:
+        for i, self_scores, neighbor_scores in chunk:
+            raw[i] = (self_scores, neighbor_scores)
+
+    results = []
+    for i, name in enumerate(files):
+        self_scores, neighbor_scores = raw.get(i, ({}, {}))
+        if not self_scores:
+            results.append(None)
+            continue
+        threshold, separable = derive_threshold(list(self_scores.values()), list(neighbor_scores.values()),
+                                                quantile)
+        results.append({"threshold": threshold, "separable": separable, "self": self_scores,
+                        "neighbors": {files[j]: score for j, score in sorted(neighbor_scores.items())}})
+
+    with open(os.path.join(dataset_folder, CALIBRATION_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"window": window, "quantile": quantile, "augmentations": list(AUGMENTATIONS),
+                   "waypoints": {name: result for name, result in zip(files, results)}}, f, indent=2)
+
+    valid = [r for r in results if r is not None]
+    if valid:
+        thresholds = np.array([r["threshold"] for r in valid])
+        print(f"校准 {len(valid)} 个路点，耗时 {time.perf_counter() - start_time:.1f}s：阈值 "
+              f"{thresholds.min():.3f} - {thresholds.max():.3f} (中位数 {np.median(thresholds):.3f})，"
+              f"{sum(not r['separable'] for r in valid)} 个路点与邻居分不开")
+    return results
+
+
+def apply_calibration(waypoints, results):
+    """把校准结果写入路点：match_threshold 和分数摘要 (完整分布见 match_calibration.json)"""
+    for wp, result in zip(waypoints, results):
+        if result is None:
+            continue
+        self_scores = list(result["self"].values())
+        neighbor_scores = list(result["neighbors"].values())
+        wp["match_threshold"] = round(result["threshold"], 3)
+        wp["calibration"] = {
+            "self_min": round(min(self_scores), 3),
+            "self_median": round(float(np.median(self_scores)), 3),
+            "neighbor_max": round(max(neighbor_scores), 3) if neighbor_scores else None,
+            "separable": result["separable"],
+        }
+
+
+def main():
+    """
+    主函数：按 waypoints.json 的路点顺序校准并写回阈值
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序路点匹配阈值校准")
+    parser.add_argument('--input', '-i', required=True, help='数据集目录')
+    parser.add_argument('--waypoints', default=None, help='路点文件，默认为数据集目录下的 waypoints.json')
+    parser.add_argument('--window', type=int, default=2, help='前后各取几个路点作为邻居')
+    parser.add_argument('--workers', '-j', type=int, default=0, help='进程数 (0 为 CPU 核数)')
+
+    args = parser.parse_args()
+    waypoints_file = args.waypoints or os.path.join(args.input, "waypoints.json")
+    if not os.path.exists(waypoints_file):
+        print(f"错误：未找到路点文件 -> {waypoints_file}")
+        return
+    with open(waypoints_file, 'r', encoding='utf-8') as f:
+        waypoints = json.load(f)
+
+    results = calibrate_waypoints(args.input, [wp["img_name"] for wp in waypoints], args.window,
+                                  args.workers or None)
+    apply_calibration(waypoints, results)
+    with open(waypoints_file, 'w', encoding='utf-8') as f:
+        json.dump(waypoints, f, indent=2, ensure_ascii=False)
+    print(f"已写回路点阈值: {waypoints_file}")
+
+
+if __name__ == "__main__":
+    main()
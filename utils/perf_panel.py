@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序性能面板
+在 Tk 线程中定时读取 PerfMonitor 的累计计数和遥测通道的最新值，
+把 FPS、各阶段耗时曲线、帧龄、丢失/盲飞状态和 CPU/内存绘制在同一个 Canvas 上
+"""
+
+import time
+import tkinter as tk
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖，缺失时不显示 CPU/内存
+    psutil = None
+
+from core.metrics import STAGES
+
+
+class RingBuffer:
+    """固定长度的环形缓冲区，写入不分配内存"""
+
+    def __init__(self, size):
+        self.values = [0.0] * size
+        self.size = size
+        self.pos = 0
+        self.count = 0
+
+    def append(self, value):
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def ordered(self):
+        """按时间顺序返回已写入的值"""
+        if self.count < self.size:
+            return self.values[:self.count]
+        return self.values[self.pos:] + self.values[:self.pos]
+
+    @property
+    def last(self):
+        return self.values[self.pos - 1] if self.count else 0.0
+
+
+class PerfPanel:
+    """
+    性能面板
+    所有读取都在 Tk 线程的定时回调中完成，导航线程只需照常记录 span
+    """
+
+    ROW_HEIGHT = 18
+    HEADER_HEIGHT = 44
+    LABEL_WIDTH = 70
+    VALUE_WIDTH = 70
+
+    def __init__(self, parent, perf, telemetry=None, width=460, interval_ms=500, history=120,
+                 stages=STAGES):
+        """
+        Args:
+            parent: Tk 父容器
+            perf: PerfMonitor 实例，或任何提供 totals() 的对象
+            telemetry: 可选的 TelemetryChannel，读取 frame_ts / misses / blind
+            width: 画布宽度 (像素)
+            interval_ms: 刷新间隔 (毫秒)
+            history: 每条曲线保留的采样点数
+            stages: 显示的阶段名称
+        """
+        self.parent = parent
+        self.perf = perf
+        self.telemetry = telemetry
+        self.interval_ms = interval_ms
+        self.stages = stages
+        self.width = width
+        self.height = self.HEADER_HEIGHT + self.ROW_HEIGHT * len(stages) + 4
+
+        self.history = {name: RingBuffer(history) for name in stages}
+        self.fps = RingBuffer(history)
+        self._last_totals = {}
+        self._last_time = None
+        self._after_id = None
+        self._process = psutil.Process() if psutil is not None else None
+        if self._process is not None:
+            self._process.cpu_percent(None)  # 第一次调用只建立基准
+
+        self.canvas = tk.Canvas(parent, width=width, height=self.height,
+                                background="#1e1e1e", highlightthickness=0)
+        self._build()
+
+    def _build(self):
+        """创建画布元素，之后每次刷新只修改坐标和文字，不重建"""
+        c = self.canvas
+        self._header = c.create_text(6, 4, anchor=tk.NW, fill="#e0e0e0", font=("Consolas", 10), text="")
+        self._system = c.create_text(6, 22, anchor=tk.NW, fill="#a0a0a0", font=("Consolas", 9), text="")
+        self._lines = {}
+        self._values = {}
+        spark_left = self.LABEL_WIDTH
+        spark_right = self.width - self.VALUE_WIDTH
+        for i, name in enumerate(self.stages):
+            top = self.HEADER_HEIGHT + i * self.ROW_HEIGHT
+            c.create_text(6, top + self.ROW_HEIGHT // 2, anchor=tk.W, fill="#a0a0a0",
+                          font=("Consolas", 9), text=name)
+            c.create_line(spark_left, top + self.ROW_HEIGHT - 2, spark_right, top + self.ROW_HEIGHT - 2,
+                          fill="#333333")
+            self._lines[name] = c.create_line(spark_left, top, spark_left, top, fill="#4fc3f7")
+            self._values[name] = c.create_text(self.width - 6, top + self.ROW_HEIGHT // 2, anchor=tk.E,
+                                               fill="#e0e0e0", font=("Consolas", 9), text="-")
+
+    def set_source(self, perf):
+        """切换计时来源 (例如改为读取子进程引擎)，重新建立增量基准"""
+        self.perf = perf
+        self._last_totals = {}
+        self._last_time = None
+
+    def pack(self, **kwargs):
+        self.canvas.pack(**kwargs)
+        return self
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.parent.after(self.interval_ms, self._tick)
+        return self
+
+    def stop(self):
+        if self._after_id is not None:
+            self.parent.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        self._after_id = None
+        try:
+            self.sample()
+            self.render()
+        except tk.TclError:
+            return  # 窗口已销毁
+        self._after_id = self.parent.after(self.interval_ms, self._tick)
+
+    def sample(self):
+        """读取累计计数，按两次采样之间的增量计算本区间的平均耗时和帧率"""
+        now = time.perf_counter()
+        totals = self.perf.totals()
+        elapsed = now - self._last_time if self._last_time is not None else 0.0
+        for name in self.stages:
+            count, total = totals.get(name, (0, 0.0))
+            # 第一次采样只建立基准；之后新出现的阶段从 0 开始计增量
+            baseline = (count, total) if self._last_time is None else (0, 0.0)
+            last_count, last_total = self._last_totals.get(name, baseline)
+            delta = count - last_count
+            history = self.history[name]
+            # 本区间没有新样本时沿用上一个值，曲线保持水平
+            history.append((total - last_total) / delta * 1000.0 if delta > 0 else history.last)
+        if elapsed > 0:
+            frames = totals.get("frame", (0, 0.0))[0] - self._last_totals.get("frame", (0, 0.0))[0]
+            self.fps.append(max(frames, 0) / elapsed)
+        self._last_totals = totals
+        self._last_time = now
+
+    def render(self):
+        c = self.canvas
+        spark_left = self.LABEL_WIDTH
+        spark_width = self.width - self.VALUE_WIDTH - spark_left
+        for i, name in enumerate(self.stages):
+            values = self.history[name].ordered()
+            top = self.HEADER_HEIGHT + i * self.ROW_HEIGHT
+            bottom = top + self.ROW_HEIGHT - 2
+            peak = max(values) if values else 0.0
+            if len(values) < 2 or peak <= 0:
+                c.coords(self._lines[name], spark_left, bottom, spark_left, bottom)
+                c.itemconfigure(self._values[name], text="-")
+                continue
+            step = spark_width / (self.history[name].size - 1)
+            scale = (self.ROW_HEIGHT - 4) / peak
+            points = []
+            for j, value in enumerate(values):
+                points.append(spark_left + j * step)
+                points.append(bottom - value * scale)
+            c.coords(self._lines[name], *points)
+            c.itemconfigure(self._values[name], text=f"{self.history[name].last:6.1f}ms")
+
+        header = f"FPS {self.fps.last:5.1f}"
+        if self.telemetry is not None:
+            frame_ts = self.telemetry.latest("frame_ts")
+            age = f"{(time.time() - frame_ts) * 1000:.0f}ms" if frame_ts else "-"
+            misses = self.telemetry.latest("misses", 0)
+            blind = "盲飞" if self.telemetry.latest("blind", False) else "正常"
+            header += f"  帧龄 {age}  连续丢失 {misses}  {blind}"
+        c.itemconfigure(self._header, text=header)
+
+        if self._process is not None:
+            rss_mb = self._process.memory_info().rss / (1024 * 1024)
+            system = f"CPU {self._process.cpu_percent(None):5.1f}%  RSS {rss_mb:.0f}MB"
+        else:
+            system = "CPU/RSS 不可用 (未安装 psutil)"
+        c.itemconfigure(self._system, text=system)
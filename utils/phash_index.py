@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序关键帧感知哈希索引
+对数据集中的所有关键帧并行计算 64 位 DCT 感知哈希，存入 BK 树 (按汉明距离组织的度量树)，
+支持查询某张图的近似重复、对整个语料聚类，并为路点生成提供去重
+用法: python -m utils.phash_index --root dataset --cluster
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from core.ui_mask import UI_MASK_FILES, load_ui_mask, mask_signature
+from utils.thumbnail_cache import THUMB_DIR_NAME
+from video_processor import dataset_mask
+
+
+INDEX_FILE = "phash_index.json"
+IMAGE_EXTS = ('.jpg', '.png')
+# extract_keyframes_sweep 按阈值写出的试验数据集 (t0.6/ 等)，是同一录像的重复关键帧
+SWEEP_DIR_RE = re.compile(r"^t\d[\d.e+-]*$")
+
+
+def _skip_dir(name):
+    """不属于路点语料的子目录：缩略图、隐藏目录和阈值扫描输出"""
+    return name == THUMB_DIR_NAME or name.startswith(".") or SWEEP_DIR_RE.match(name) is not None
+
+
+def _is_keyframe(name):
+    """是否为关键帧图片 (排除遮罩文件和分段提取留下的 .segment_* 临时图片)"""
+    return name.lower().endswith(IMAGE_EXTS) and name not in UI_MASK_FILES and not name.startswith(".")
+
+
+def hamming(a, b):
+    """两个 64 位哈希的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+def phash(gray):
+    """
+    64 位 DCT 感知哈希：缩到 32x32 做 DCT，取左上 8x8 低频系数与其中位数 (不含直流分量) 比较
+
+    Args:
+        gray: 灰度图 (可已应用遮罩)
+
+    Returns:
+        int: 64 位哈希
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+@lru_cache(maxsize=64)
+def _folder_mask(folder, width, height):
+    """每个目录、分辨率只读一次遮罩文件"""
+    return dataset_mask(folder, width, height)
+
+
+def phash_file(path):
+    """读取图片，遮挡 UI 和主角后计算感知哈希 (与关键帧提取使用同一遮罩：所在目录的 ui_mask.png 或固定矩形)"""
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    mask = _folder_mask(os.path.dirname(os.path.abspath(path)), gray.shape[1], gray.shape[0])
+    return phash(cv2.bitwise_and(gray, gray, mask=mask))
+
+
+def _hash_chunk(paths):
+    return [phash_file(path) for path in paths]
+
+
+def hash_files(paths, workers=None):
+    """
+    并行计算一批图片的感知哈希
+
+    Returns:
+        list: 与 paths 对应的哈希，读图失败的为 None
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < 64:
+        return _hash_chunk(paths)
+    chunk = max(16, len(paths) // (workers * 4))
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        return [h for result in pool.map(_hash_chunk, chunks) for h in result]
+
+
+class BKTree:
+    """
+    汉明距离上的 BK 树：每个子节点按与父节点的距离挂接，
+    查询半径 r 时由三角不等式只需进入距离在 [d - r, d + r] 内的子树
+    """
+
+    def __init__(self):
+        self.root = None  # [哈希, [条目...], {距离: 子节点}]
+        self.size = 0
+        self.last_visited = 0  # 最近一次查询访问的节点数
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)  # 完全相同的哈希共用节点
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value, radius):
+        """
+        Returns:
+            list: [(距离, 条目), ...]，按距离升序
+        """
+        results = []
+        visited = 0
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            visited += 1
+            d = hamming(value, node[0])
+            if d <= radius:
+                results.extend((d, item) for item in node[1])
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        self.last_visited = visited
+        results.sort(key=lambda x: x[0])
+        return results
+
+
+class PhashIndex:
+    """
+    数据集根目录下所有关键帧的感知哈希索引
+    哈希按 (相对路径 -> 修改时间, 哈希, 遮罩校验值) 缓存在 <root>/phash_index.json，
+    只为新增、改动或所在目录的 UI 遮罩有变化的图片重新计算
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hashes = {}  # 相对路径 -> 哈希
+        self.tree = BKTree()
+
+    @classmethod
+    def build(cls, root, workers=None, save=True):
+        """
+        扫描 root 下的全部关键帧并建立索引 (跳过缩略图、临时文件和阈值扫描输出，
+        features/ 等子目录中的非图片文件忽略)
+
+        Args:
+            root: 数据集根目录，可包含多条路线的子目录
+            workers: 计算哈希的进程数
+            save: 是否写回缓存文件
+        """
+        index = cls(root)
+        cache_path = os.path.join(root, INDEX_FILE)
+        cached = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f).get("entries", {})
+
+        files = []
+        masks = {}  # 相对路径 -> 所在目录 UI 遮罩的校验值 (没有遮罩为 0)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not _skip_dir(d)]
+            signature = mask_signature(load_ui_mask(dirpath))
+            for name in filenames:
+                if _is_keyframe(name):
+                    rel = os.path.relpath(os.path.join(dirpath, name), root)
+                    files.append(rel)
+                    masks[rel] = signature
+        files.sort()
+
+        mtimes = {rel: os.path.getmtime(os.path.join(root, rel)) for rel in files}
+        stale = [rel for rel in files
+                 if rel not in cached or cached[rel][0] != mtimes[rel] or cached[rel][2:] != [masks[rel]]]
+        start = time.perf_counter()
+        fresh = dict(zip(stale, hash_files([os.path.join(root, rel) for rel in stale], workers)))
+        if stale:
+            print(f"计算 {len(stale)} 张图片的感知哈希，耗时 {time.perf_counter() - start:.2f}s")
+
+        entries = {}
+        for rel in files:
+            value = fresh[rel] if rel in fresh else int(cached[rel][1], 16)
+            if value is None:
+                continue
+            entries[rel] = [mtimes[rel], f"{value:016x}", masks[rel]]
+            index.hashes[rel] = value
+            index.tree.add(value, rel)
+
+        if save and (stale or len(entries) != len(cached)):
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": 2, "entries": entries}, f)
+        return index
+
+    def near_duplicates(self, path, radius=6):
+        """
+        查询一张图片 (索引内的相对路径或任意图片路径) 的近似重复
+
+        Returns:
+            list: [(汉明距离, 相对路径), ...]，不含自身
+        """
+        value = self.hashes.get(path)
+        if value is None:
+            value = phash_file(path)
+            if value is None:
+                return []
+        return [(d, rel) for d, rel in self.tree.query(value, radius) if rel != path]
+
+    def cluster(self, radius=6):
+        """
+        对整个语料聚类：按路径顺序取尚未归类的图片作为代表，
+        把距离代表不超过 radius 的未归类图片归入同一类 (类内任意两张的距离不超过 2 * radius；
+        并查集那样的传递连通会把连续录像里缓慢变化的画面串成一个大类)
+
+        Returns:
+            list: 多于一张图片的类，每类为相对路径列表 (第一个为代表)，按大小降序
+        """
+        assigned = set()
+        groups = []
+        for rel in sorted(self.hashes):
+            if rel in assigned:
+                continue
+            members = [other for _, other in self.tree.query(self.hashes[rel], radius)
+                       if other not in assigned and other != rel]
+            assigned.add(rel)
+            assigned.update(members)
+            if members:
+                groups.append([rel] + sorted(members))
+        return sorted(groups, key=len, reverse=True)
+
+
+def dedup_sequence(hashes, radius=4):
+    """
+    路线内去重：与上一张保留图片的汉明距离不超过 radius 的图片视为重复 (悬停、加载画面)
+
+    Args:
+        hashes: 按路线顺序排列的哈希列表
+
+    Returns:
+        list: 保留的序号
+    """
+    kept = []
+    last = None
+    for i, value in enumerate(hashes):
+        if value is None:
+            kept.append(i)  # 读图失败的保留，交给人工检查
+        elif last is None or hamming(value, last) > radius:
+            kept.append(i)
+            last = value
+    return kept
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="光遇辅助程序关键帧感知哈希索引")
+    parser.add_argument('--root', '-r', default="dataset", help='数据集根目录')
+    parser.add_argument('--query', '-q', help='查询该图片的近似重复')
+    parser.add_argument('--cluster', action='store_true', help='对整个语料聚类并列出重复组')
+    parser.add_argument('--radius', type=int, default=6, help='近似重复的最大汉明距离 (0-64)')
+    parser.add_argument('--workers', '-j', type=int, default=0, help='计算哈希的进程数 (0 为 CPU 核数)')
+
+    args = parser.parse_args()
+    if not os.path.exists(args.root):
+        print(f"错误：目录不存在 -> {args.root}")
+        return
+
+    index = PhashIndex.build(args.root, args.workers or None)
+    print(f"索引共 {len(index.hashes)} 张图片")
+
+    if args.query:
+        start = time.perf_counter()
+        results = index.near_duplicates(args.query, args.radius)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"近似重复 {len(results)} 张 (访问 {index.tree.last_visited}/{index.tree.size} 个节点，"
+              f"{elapsed:.2f}ms):")
+        for d, rel in results:
+            print(f"  {d:2d}  {rel}")
+
+    if args.cluster:
+        start = time.perf_counter()
+        groups = index.cluster(args.radius)
+        elapsed = time.perf_counter() - start
+        duplicates = sum(len(g) - 1 for g in groups)
+        print(f"聚类完成：{len(groups)} 组，可去掉 {duplicates} 张重复图片，耗时 {elapsed:.2f}s")
+        for group in groups[:20]:
+            print(f"  {len(group):4d} 张: {group[0]} ... {group[-1]}")
+
+
+if __name__ == "__main__":
+    main()
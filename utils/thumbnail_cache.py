@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+光遇辅助程序路点缩略图缓存
+在后台线程中解码并预加载接下来几个路点的缩略图，UI 线程只负责创建 PhotoImage
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from core.ui_mask import UI_MASK_FILES
+
+
+# 数据集目录下预先生成的缩略图子目录 (文件名与原图相同)
+THUMB_DIR_NAME = "thumbs"
+
+
+def load_sequence(dataset_dir):
+    """
+    读取数据集的路点顺序：优先使用 waypoints.json，否则按文件名排序
+
+    Returns:
+        list: 路点图片的完整路径列表
+    """
+    wp_file = os.path.join(dataset_dir, "waypoints.json")
+    if os.path.exists(wp_file):
+        with open(wp_file, 'r', encoding='utf-8') as f:
+            names = [wp['img_name'] for wp in json.load(f)]
+    else:
+        names = sorted(f for f in os.listdir(dataset_dir)
+                       if (f.endswith('.jpg') or f.endswith('.png')) and f not in UI_MASK_FILES)
+    return [os.path.join(dataset_dir, name) for name in names]
+
+
+class ThumbnailCache:
+    """
+    LRU 缩略图缓存
+    get() 不阻塞：未命中时交给后台线程解码，解码完成后下一次 get() 即可命中；
+    每次请求都会顺带预加载路线中接下来的 prefetch 个路点
+    """
+
+    def __init__(self, size=(480, 270), capacity=32, prefetch=4):
+        """
+        Args:
+            size: 缩略图最大尺寸 (宽, 高)
+            capacity: 缓存的缩略图数量上限
+            prefetch: 每次请求后预加载的后续路点数量
+        """
+        self.size = size
+        self.capacity = capacity
+        self.prefetch = prefetch
+        self.stats = {"hits": 0, "misses": 0, "decoded": 0, "precomputed": 0}
+
+        self._cache = OrderedDict()   # 路径 -> PIL.Image
+        self._sequences = {}          # 数据集目录 -> 路点路径列表
+        self._wanted = []             # 待解码路径，队首优先
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ThumbnailCache", daemon=True)
+        self._thread.start()
+
+    def get(self, path):
+        """
+        获取缩略图，未命中时返回 None 并安排后台解码
+
+        Returns:
+            PIL.Image 或 None
+        """
+        with self._cond:
+            img = self._cache.get(path)
+            if img is not None:
+                self._cache.move_to_end(path)
+                self.stats["hits"] += 1
+                self._want([("prefetch", path)], front=True)
+            else:
+                self.stats["misses"] += 1
+                # 当前路点最优先，随后是路线上的下几个路点
+                self._want([path, ("prefetch", path)], front=True)
+            self._cond.notify()
+        return img
+
+    def peek(self, path):
+        """只查询缓存，不安排解码 (用于等待后台解码完成时的轮询)"""
+        with self._cond:
+            return self._cache.get(path)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _want(self, targets, front=False):
+        """登记需要处理的任务，保持 targets 内的先后顺序 (调用方持有锁)"""
+        for target in reversed(targets) if front else targets:
+            if target in self._wanted:
+                self._wanted.remove(target)
+            if front:
+                self._wanted.insert(0, target)
+            else:
+                self._wanted.append(target)
+
+    def _next_paths(self, path):
+        """路线中 path 之后的 prefetch 个路点 (在后台线程中调用，可能读取 waypoints.json)"""
+        dataset_dir = os.path.dirname(path)
+        seq = self._sequences.get(dataset_dir)
+        if seq is None:
+            try:
+                seq = load_sequence(dataset_dir)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"读取路点顺序失败: {e}")
+                seq = []
+            self._sequences[dataset_dir] = seq
+        if path not in seq:
+            return []
+        start = seq.index(path) + 1
+        return seq[start:start + self.prefetch]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._wanted and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                target = self._wanted.pop(0)
+
+            if isinstance(target, tuple):
+                # 预加载任务：展开为后续路点的解码任务 (排在已有任务之后)
+                paths = self._next_paths(target[1])
+                with self._cond:
+                    self._want([p for p in paths if p not in self._cache])
+                continue
+
+            with self._cond:
+                if target in self._cache:
+                    continue
+            img = self._decode(target)
+            if img is None:
+                continue
+            with self._cond:
+                self._cache[target] = img
+                self._cache.move_to_end(target)
+                while len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+
+    def _decode(self, path):
+        """解码缩略图：优先读取预生成的缩略图，否则用 JPEG 草稿模式快速缩小后再精确缩放"""
+        thumb_path = os.path.join(os.path.dirname(path), THUMB_DIR_NAME, os.path.basename(path))
+        source = thumb_path if os.path.exists(thumb_path) else path
+        if not os.path.exists(source):
+            return None
+        try:
+            with Image.open(source) as img:
+                img.draft('RGB', self.size)
+                img = img.convert('RGB')
+                img.thumbnail(self.size)
+        except OSError as e:
+            print(f"缩略图解码失败 {path}: {e}")
+            return None
+        self.stats["precomputed" if source == thumb_path else "decoded"] += 1
+        return img
@@ -8,8 +8,19 @@
 import cv2
 import numpy as np
 import os
+import json
+import time
 import argparse
-from skimage.metrics import structural_similarity as ssim
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from core.features import feature_path
+from core.ui_mask import load_ui_mask, mask_signature, save_ui_mask
+from utils.frame_similarity import SIMILARITY_BACKENDS, DEFAULT_SIMILARITY, create_similarity
+from utils.keyframe_writer import KeyframeWriter
+from utils.thumbnail_cache import THUMB_DIR_NAME
+
+
+CHECKPOINT_FILE = ".extract_checkpoint.npz"
 
 
 def resize_video(video_path, output_path, target_width=640, target_height=360):
@@ -102,86 +113,782 @@ def get_sky_mask(frame_width, frame_height):
     return mask
 
 
-def extract_keyframes(video_path, output_folder, threshold=0.6, target_size=(640, 360)):
+def resolve_mask(output_folder, frame_width, frame_height, ui_mask=None):
     """
-    智能关键帧提取，根据画面变化自动提取关键帧
-    
+    选择提取关键帧使用的遮罩：优先使用学习得到的 UI 遮罩 (learn_ui_mask.py)，没有时使用 get_sky_mask 的固定矩形
+    学习得到的遮罩会按处理分辨率保存到输出目录的 ui_mask.png，运行时导航读取同一文件
+
     Args:
-        video_path: 输入视频路径
-        output_folder: 输出文件夹
-        threshold: 画面变化阈值 (0-1)，值越小提取越频繁
-        target_size: 目标分辨率
-        
+        output_folder: 关键帧输出目录 (数据集目录)，其中已有 ui_mask.png 时自动使用
+        frame_width, frame_height: 处理分辨率
+        ui_mask: 可选，指定的遮罩文件或其所在的数据集目录
+
     Returns:
-        int: 提取的关键帧数量
+        tuple: (遮罩, 是否为学习得到的遮罩)
     """
-    # 创建输出文件夹
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    source = ui_mask or output_folder
+    mask = load_ui_mask(source, (frame_width, frame_height))
+    if mask is None:
+        if ui_mask:
+            print(f"警告：未找到 UI 遮罩 {ui_mask}，改用固定矩形遮罩")
+        return get_sky_mask(frame_width, frame_height), False
+    existing = load_ui_mask(output_folder)
+    if existing is None or not np.array_equal(existing, mask):
+        save_ui_mask(output_folder, mask)
+    print(f"使用学习得到的 UI 遮罩: {source} (遮挡 {float((mask == 0).mean()):.1%})")
+    return mask, True
+
+
+def dataset_mask(dataset_folder, frame_width, frame_height):
+    """
+    读取数据集的关键帧所用的遮罩 (与 resolve_mask 的选择相同，但不写文件)：
+    目录中有 ui_mask.png 时缩放到给定分辨率后使用，否则为 get_sky_mask 的固定矩形
+    """
+    mask = load_ui_mask(dataset_folder, (frame_width, frame_height))
+    return mask if mask is not None else get_sky_mask(frame_width, frame_height)
+
+
+def open_video(video_path):
+    """
+    打开视频并读取基本信息
     
+    Returns:
+        tuple: (cv2.VideoCapture, 信息字典 {fps, width, height, frames})，打开失败返回 (None, None)
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"无法打开视频文件: {video_path}")
-        return 0
+        return None, None
+    info = {
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 30.0,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+    }
+    return cap, info
+
+
+def read_frames(cap, total_frames=0, start=0, stop=None, stride=1, timing=None):
+    """
+    逐帧解码 (生成器)
+    每帧都 grab() 解码以保持位置，只对帧序号是 stride 整数倍的帧 retrieve() 取出图像，
+    其余帧省去颜色转换以及后续的缩放、遮罩和相似度计算
     
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    Args:
+        cap: cv2.VideoCapture
+        total_frames: 总帧数，非 0 时每 100 帧打印一次进度
+        start: 起始帧序号，非 0 时先定位到该帧
+        stop: 结束帧序号 (不含)，为 None 时读到视频结尾
+        stride: 采样间隔，1 为逐帧
+        timing: 可选的字典，累加 grab / retrieve 秒数和 retrieved 帧数
     
-    # 获取我们定义的遮罩
-    mask = get_sky_mask(width, height)
+    Yields:
+        tuple: (帧序号, BGR 帧)
+    """
+    index = start
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    while stop is None or index < stop:
+        t0 = time.perf_counter()
+        if not cap.grab():
+            break
+        t1 = time.perf_counter()
+        if timing is not None:
+            timing["grab"] = timing.get("grab", 0.0) + t1 - t0
+        if index % stride == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            if timing is not None:
+                timing["retrieve"] = timing.get("retrieve", 0.0) + time.perf_counter() - t1
+                timing["retrieved"] = timing.get("retrieved", 0) + 1
+            yield index, frame
+        index += 1
+        if total_frames and index % 100 == 0:
+            print(f"处理进度: {index}/{total_frames} ({index/total_frames:.1%})")
+
+
+def resize_frames(frames, target_size=None, writer=None):
+    """
+    缩放到标准分辨率 (生成器)，可顺带写出缩放后的视频
     
-    prev_frame_gray = None
-    frame_count = 0
-    saved_count = 0
+    Args:
+        frames: (帧序号, 帧) 迭代器
+        target_size: 目标分辨率 (宽, 高)，为 None 时保持原分辨率
+        writer: 可选的 cv2.VideoWriter
+    """
+    for index, frame in frames:
+        if target_size is not None and (frame.shape[1], frame.shape[0]) != tuple(target_size):
+            frame = cv2.resize(frame, tuple(target_size))
+        if writer is not None:
+            writer.write(frame)
+        yield index, frame
+
+
+def mask_frames(frames, mask):
+    """
+    转灰度并应用遮罩 (生成器)
     
-    print(f"正在提取关键帧: {video_path}")
-    print(f"视频信息: {width}x{height}, {fps} FPS")
-    print(f"关键帧提取阈值: {threshold}")
+    Yields:
+        tuple: (帧序号, 彩色帧, 遮罩后的灰度帧)
+    """
+    for index, frame in frames:
+        # 转灰度 (降低计算量，且跑图主要靠轮廓)，只计算有效区域的差异
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        yield index, frame, cv2.bitwise_and(gray, gray, mask=mask)
+
+
+def select_keyframes(frames, threshold, similarity=None, reference=None):
+    """
+    按与上一个关键帧的相似度选择关键帧 (生成器)
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    Args:
+        frames: (帧序号, 彩色帧, 遮罩后的灰度帧) 迭代器
+        threshold: 画面变化阈值 (0-1)，相似度低于 1 - threshold 时保存
+        similarity: 相似度后端 (utils.frame_similarity)，默认使用 OpenCV SSIM
+        reference: 可选，上一个关键帧的遮罩灰度图；为 None 时第一帧直接作为关键帧
         
-        # 1. 转灰度 (降低计算量，且跑图主要靠轮廓)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    后端的 select_last_match 为 True 时 (nav_orb)，相似度跌破阈值时保存仍达标的上一帧，
+    再用它重新评估当前帧，相邻关键帧的相似度都不低于 1 - threshold
         
-        # 2. 应用遮罩 (只计算有效区域的差异)
-        masked_gray = cv2.bitwise_and(gray, gray, mask=mask)
+    Yields:
+        tuple: (帧序号, 彩色帧, 相似度)，第一帧的相似度为 None
+    """
+    if similarity is None:
+        similarity = create_similarity()
+    last_match = getattr(similarity, "select_last_match", False)
+    ref_signature = similarity.prepare(reference) if reference is not None else None
+    previous = None  # 上一帧 (帧序号, 彩色帧, 签名, 相似度)，仅在 last_match 模式下使用
+    for index, frame, masked_gray in frames:
+        signature = similarity.prepare(masked_gray)
+        if ref_signature is None:
+            yield index, frame, None
+            ref_signature = signature
+            continue
+        # 相似度越接近1，表示图像越相似
+        score = similarity.compare(ref_signature, signature)
+        if score < (1 - threshold) and last_match and previous is not None:
+            yield previous[0], previous[1], previous[3]
+            ref_signature = previous[2]
+            score = similarity.compare(ref_signature, signature)
+        if score < (1 - threshold):
+            yield index, frame, score
+            ref_signature = signature
+            previous = None
+        else:
+            previous = (index, frame, signature, score)
+
+
+def select_keyframes_multi(frames, thresholds, similarity=None):
+    """
+    同一遍帧流上按多个阈值同时选择关键帧 (生成器)，每个阈值各自维护参考帧，
+    对每个阈值的选择结果与单独调用 select_keyframes 完全一致
+    每帧的签名只计算一次；几个阈值的参考帧是同一帧时 (如开头、关键帧重合处) 相似度也只比较一次
+    
+    Args:
+        frames: (帧序号, 彩色帧, 遮罩后的灰度帧) 迭代器
+        thresholds: 阈值列表
+        similarity: 相似度后端
         
-        should_save = False
+    Yields:
+        tuple: (阈值序号, 帧序号, 彩色帧, 相似度)
+    """
+    if similarity is None:
+        similarity = create_similarity()
+    last_match = getattr(similarity, "select_last_match", False)
+    references = [None] * len(thresholds)  # 各阈值的参考帧 (帧序号, 签名)
+    previous = [None] * len(thresholds)    # 各阈值的上一帧 (帧序号, 彩色帧, 签名, 相似度)，仅 last_match 模式使用
+    for index, frame, masked_gray in frames:
+        signature = similarity.prepare(masked_gray)
+        scores = {}  # 参考帧序号 -> 当前帧与它的相似度
         
-        if prev_frame_gray is None:
-            should_save = True
-        else:
-            # 3. 计算结构相似性指数 (SSIM)
-            # SSIM值越接近1，表示图像越相似
-            current_ssim = ssim(prev_frame_gray, masked_gray)
-            
-            # 如果画面变动超过一定阈值
-            if current_ssim < (1 - threshold):
-                should_save = True
+        def score_against(reference):
+            if reference[0] not in scores:
+                scores[reference[0]] = similarity.compare(reference[1], signature)
+            return scores[reference[0]]
         
-        if should_save:
-            # 保存关键帧
+        for t, threshold in enumerate(thresholds):
+            if references[t] is None:
+                yield t, index, frame, None
+                references[t] = (index, signature)
+                continue
+            score = score_against(references[t])
+            if score < (1 - threshold) and last_match and previous[t] is not None:
+                prev_index, prev_frame, prev_signature, prev_score = previous[t]
+                yield t, prev_index, prev_frame, prev_score
+                references[t] = (prev_index, prev_signature)
+                score = score_against(references[t])
+            if score < (1 - threshold):
+                yield t, index, frame, score
+                references[t] = (index, signature)
+                previous[t] = None
+            else:
+                previous[t] = (index, frame, signature, score)
+
+
+def write_keyframes(keyframes, output_folder, fps, writer=None, first=0, on_saved=None):
+    """
+    保存关键帧 (管线终点)，编码和写盘在 KeyframeWriter 的后台线程中进行
+    
+    Args:
+        writer: KeyframeWriter，为 None 时使用默认配置的写出池并在结束时关闭
+        first: 第一个关键帧的编号 (断点续传时接着已有的编号)
+        on_saved: 可选回调 on_saved(编号, 帧序号)，每个关键帧提交写出之前调用一次
+    
+    Returns:
+        int: 保存后的关键帧总数
+    """
+    own_writer = writer is None
+    if own_writer:
+        writer = KeyframeWriter()
+    saved_count = first
+    try:
+        for index, frame, score in keyframes:
             filename = f"{output_folder}/frame_{saved_count:04d}.jpg"
-            cv2.imwrite(filename, frame)  # 保存原彩图用于调试，运行时再转灰度
+            if on_saved is not None:
+                # 先记入断点再提交：任何时刻被中断，已提交的关键帧都已有记录
+                on_saved(saved_count, index)
+            writer.submit(filename, frame)  # 保存原彩图用于调试，运行时再转灰度
+            _log_keyframe(saved_count, index, fps, score)
+            saved_count += 1
+    finally:
+        if own_writer:
+            writer.close()
+    return saved_count
+
+
+def _log_keyframe(saved_count, index, fps, score):
+    score_info = f", Similarity: {score:.3f}" if score is not None else ""
+    print(f"Saved keyframe {saved_count} at time {index/fps:.2f}s{score_info}")
+
+
+def _track_gray(frames, recent):
+    """透传 (帧序号, 彩色帧, 遮罩灰度帧)，并在 recent 中按帧序号记下最近两帧的遮罩灰度图"""
+    for index, frame, gray in frames:
+        recent[index] = gray
+        if len(recent) > 2:
+            recent.pop(next(iter(recent)))
+        yield index, frame, gray
+
+
+class ExtractionCheckpoint:
+    """
+    关键帧提取断点：已确认写完的关键帧的帧序号，以及其中最后一个关键帧的遮罩灰度图 (续传时的参考帧)
+    状态只在关键帧处记录，从最后一个关键帧之后的采样帧继续，选择结果与一次跑完完全一致；
+    关键帧是异步写出的，只有连续写完的前缀才会记入断点
+    """
+
+    def __init__(self, output_folder, params, interval=10.0):
+        """
+        Args:
+            output_folder: 关键帧输出目录，断点文件保存在其中
+            params: 影响选择结果的参数 (视频、阈值、后端等)，与断点中记录的不一致时不续传
+            interval: 最短保存间隔 (秒)
+        """
+        self.path = os.path.join(output_folder, CHECKPOINT_FILE)
+        self.params = params
+        self.interval = interval
+        self.indices = []   # 已提交关键帧的帧序号，下标即关键帧编号
+        self._grays = {}    # 关键帧编号 -> 遮罩灰度图，写完并记入断点后丢弃
+        self._saved = 0
+        self._last_save = time.perf_counter()
+
+    def load(self):
+        """
+        Returns:
+            tuple: (关键帧帧序号列表, 参考帧遮罩灰度图)，没有可用断点时返回 None
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                reference = data["reference"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"断点文件损坏，重新开始提取: {e}")
+            return None
+        if meta.get("params") != self.params or not meta.get("indices"):
+            print("断点与本次提取参数不一致，重新开始提取")
+            return None
+        self.indices = list(meta["indices"])
+        self._saved = len(self.indices)
+        self._grays[len(self.indices) - 1] = reference
+        return list(self.indices), reference
+
+    @property
+    def saved(self):
+        """断点文件中已记录的关键帧数量"""
+        return self._saved
+
+    def add(self, number, index, gray):
+        """记录一个已提交 (未必写完) 的关键帧"""
+        self._grays[number] = gray  # 先存参考帧，indices 中出现的编号总有对应的灰度图
+        self.indices.append(index)
+
+    def maybe_save(self, completed):
+        """距上次保存超过 interval 时保存"""
+        if time.perf_counter() - self._last_save >= self.interval:
+            self.save(completed)
+
+    def save(self, completed):
+        """
+        保存断点 (先写临时文件再替换，中途被杀也不会留下损坏的断点)
+
+        Args:
+            completed: 从编号 0 起连续写完的关键帧数量 (超过已记录的数量时按已记录的数量保存)
+        """
+        self._last_save = time.perf_counter()
+        completed = min(completed, len(self.indices))
+        if completed <= self._saved:
+            return
+        meta = {"params": self.params, "indices": self.indices[:completed]}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=json.dumps(meta), reference=self._grays[completed - 1])
+        os.replace(tmp_path, self.path)
+        self._saved = completed
+        for number in [n for n in self._grays if n < completed - 1]:
+            del self._grays[number]
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _keyframe_intact(path):
+    """关键帧文件存在且以 JPEG 结束标记结尾 (写到一半被中断的文件没有结束标记)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(-2, os.SEEK_END)
+            return f.read(2) == b'\xff\xd9'
+    except OSError:
+        return False
+
+
+def _repair_keyframes(cap, output_folder, indices, target_size, thumbs=False, features=False, feature_mask=None):
+    """
+    续传前校验已有关键帧：只重新生成损坏或缺失的 (按记录的帧序号定位解码)，完好的只补缩略图和特征
+    
+    Returns:
+        int: 重新生成的关键帧数量
+    """
+    repaired = 0
+    writer = KeyframeWriter(thumbs=thumbs, features=features, feature_mask=feature_mask)
+    try:
+        for number, index in enumerate(indices):
+            filename = f"{output_folder}/frame_{number:04d}.jpg"
+            if _keyframe_intact(filename):
+                name = os.path.basename(filename)
+                if ((features and not os.path.exists(feature_path(output_folder, name)))
+                        or (thumbs and not os.path.exists(os.path.join(output_folder, THUMB_DIR_NAME, name)))):
+                    writer.submit_existing(filename)
+                continue
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = cap.read()
+            if not ret:
+                raise IOError(f"无法重新解码第 {index} 帧")
+            if target_size is not None and (frame.shape[1], frame.shape[0]) != tuple(target_size):
+                frame = cv2.resize(frame, tuple(target_size))
+            writer.submit(filename, frame)
+            repaired += 1
+    finally:
+        writer.close()
+    return repaired
+
+
+def plan_segments(total_frames, workers, min_frames=150):
+    """
+    把视频按帧序号平均切成若干段，每段至少 min_frames 帧
+    
+    Returns:
+        list: [(起始帧, 结束帧(不含)), ...]
+    """
+    count = max(1, min(workers, total_frames // max(1, min_frames)))
+    bounds = [total_frames * i // count for i in range(count + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(count)]
+
+
+def _scan_segment(video_path, start, stop, target_size, threshold, similarity, output_folder, mask, stride=1):
+    """
+    子进程：定位到 start 后独立解码一段，把该段第一帧当作参考帧推测性地选择关键帧
+    推测的关键帧先写成临时文件，由主进程拼接时决定保留、改名或删除
+    
+    Returns:
+        tuple: ([(帧序号, 相似度, 临时文件路径), ...], 最后一个关键帧的遮罩灰度图, 解码帧数)
+    """
+    cap, _ = open_video(video_path)
+    if cap is None:
+        raise IOError(f"无法打开视频文件: {video_path}")
+    if hasattr(similarity, "set_mask"):
+        similarity.set_mask(mask)
+    recent = {}
+    keyframes = []
+    last_gray = None
+    decoded = 0
+    try:
+        frames = resize_frames(read_frames(cap, start=start, stop=stop, stride=stride), target_size)
+        for index, frame, score in select_keyframes(_track_gray(mask_frames(frames, mask), recent),
+                                                    threshold, similarity):
+            path = os.path.join(output_folder, f".segment_{index:07d}.jpg")
+            cv2.imwrite(path, frame)
+            keyframes.append((index, score, path))
+            last_gray = recent[index]
+        decoded = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - start
+    finally:
+        cap.release()
+    return keyframes, last_gray, decoded
+
+
+def extract_keyframes_parallel(video_path, output_folder, threshold=0.6, target_size=(640, 360),
+                               workers=None, stats=None, similarity=DEFAULT_SIMILARITY, features=False,
+                               stride=1, thumbs=False, ui_mask=None):
+    """
+    分段并行的关键帧提取，输出与 extract_keyframes 的顺序提取完全一致
+    
+    各段在进程池中从段首独立解码并推测性地选择关键帧。主进程按顺序拼接：
+    从上一段真实的最后一个关键帧出发重跑本段开头，直到重跑选中的关键帧与推测结果重合，
+    此后两者的参考帧相同、选择必然一致，直接采用推测结果；未重合的推测关键帧丢弃
+    
+    Args:
+        workers: 进程数，为 None 时使用 CPU 核数
+        其余参数同 extract_keyframes (不支持同时写出缩放视频)；
+        stride 采样网格按全局帧序号对齐，各段与顺序提取取到的是同一批帧
+        
+    Returns:
+        int: 提取的关键帧数量
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    
+    cap, info = open_video(video_path)
+    if cap is None:
+        return 0
+    
+    workers = workers or os.cpu_count() or 1
+    target_size = tuple(target_size) if target_size is not None else (info["width"], info["height"])
+    if isinstance(similarity, str):
+        similarity = create_similarity(similarity)
+    segments = plan_segments(info["frames"], workers)
+    mask, learned = resolve_mask(output_folder, *target_size, ui_mask=ui_mask)
+    if hasattr(similarity, "set_mask"):
+        similarity.set_mask(mask)
+    
+    print(f"正在分段提取关键帧: {video_path}")
+    print(f"视频信息: {info['width']}x{info['height']}, {info['fps']} FPS, "
+          f"处理分辨率: {target_size[0]}x{target_size[1]}")
+    print(f"关键帧提取阈值: {threshold}, 相似度后端: {similarity.name}, "
+          f"{len(segments)} 段 / {workers} 进程")
+    
+    start_time = time.perf_counter()
+    saved_count = 0
+    frame_count = 0
+    resync_frames = 0
+    ref_gray = None
+    ref_index = 0
+    last_match = getattr(similarity, "select_last_match", False)
+    writer = KeyframeWriter(thumbs=thumbs, features=features, feature_mask=mask if learned else None)
+    leftovers = []
+    # 与引擎子进程一致使用 spawn，Linux 和 Windows 行为相同
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+    try:
+        futures = [pool.submit(_scan_segment, video_path, seg_start, seg_stop, target_size,
+                               threshold, similarity, output_folder, mask, stride)
+                   for seg_start, seg_stop in segments]
+        for (seg_start, seg_stop), future in zip(segments, futures):
+            speculative, spec_last_gray, decoded = future.result()
+            frame_count += decoded
+            spec_index = {index: i for i, (index, _, _) in enumerate(speculative)}
+            accepted = []  # (帧序号, 相似度, 临时文件路径 或 彩色帧)
             
-            # 处理第一帧的情况，current_ssim可能未定义
-            ssim_info = f", SSIM: {current_ssim:.3f}" if 'current_ssim' in locals() else ""
-            print(f"Saved keyframe {saved_count} at time {frame_count/fps:.2f}s{ssim_info}")
+            if seg_start == 0:
+                # 第一段的参考帧就是视频第一帧，推测结果即真实结果
+                accepted = list(speculative)
+                synced = 0
+            else:
+                # 从真实参考帧重跑，直到与推测的关键帧重合
+                # last_match 模式下段首跌破阈值时保存的是上一个采样帧，所以要从段首前一个采样帧开始重跑
+                previous_sample = (seg_start - 1) // stride * stride
+                rerun_start = previous_sample if last_match and ref_index < previous_sample else seg_start
+                synced = None
+                recent = {}
+                frames = resize_frames(read_frames(cap, start=rerun_start, stop=seg_stop, stride=stride),
+                                       target_size)
+                for index, frame, score in select_keyframes(_track_gray(mask_frames(frames, mask), recent),
+                                                            threshold, similarity, reference=ref_gray):
+                    if index in spec_index:
+                        synced = spec_index[index]
+                        accepted.append((index, score, speculative[synced][2]))
+                        break
+                    accepted.append((index, score, frame))
+                    ref_gray = recent[index]
+                    ref_index = index
+                resync_frames += int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - rerun_start
+                if synced is not None:
+                    accepted.extend(speculative[synced + 1:])
             
-            prev_frame_gray = masked_gray
-            saved_count += 1
+            if synced is not None:
+                ref_gray = spec_last_gray
+                ref_index = speculative[-1][0]
+            kept = {item[2] for item in accepted if isinstance(item[2], str)}
+            leftovers.extend(path for _, _, path in speculative if path not in kept)
             
-        frame_count += 1
+            for index, score, source in accepted:
+                filename = os.path.join(output_folder, f"frame_{saved_count:04d}.jpg")
+                if isinstance(source, str):
+                    os.replace(source, filename)
+                    writer.submit_existing(filename)
+                else:
+                    writer.submit(filename, source)
+                _log_keyframe(saved_count, index, info["fps"], score)
+                saved_count += 1
+            print(f"处理进度: {seg_stop}/{info['frames']} ({seg_stop/info['frames']:.1%})")
+    finally:
+        pool.shutdown(cancel_futures=True)
+        writer.close()
+        cap.release()
+        for path in leftovers:
+            if os.path.exists(path):
+                os.remove(path)
+    elapsed = time.perf_counter() - start_time
     
-    cap.release()
+    throughput = frame_count / elapsed if elapsed > 0 else 0.0
     print(f"关键帧提取完成，共提取: {saved_count} 帧")
+    print(f"共处理 {frame_count} 帧 (拼接重跑 {resync_frames} 帧)，耗时 {elapsed:.2f}s，吞吐 {throughput:.1f} 帧/秒")
+    print(writer.summary())
+    if stats is not None:
+        stats.update(frames=frame_count, keyframes=saved_count, seconds=elapsed, fps=throughput,
+                     segments=len(segments), resync_frames=resync_frames)
     return saved_count
 
 
+def extract_keyframes(video_path, output_folder, threshold=0.6, target_size=(640, 360),
+                      resized_output=None, stats=None, similarity=DEFAULT_SIMILARITY, features=False,
+                      stride=1, thumbs=False, writers=2, resume=True, checkpoint_interval=10.0, ui_mask=None):
+    """
+    智能关键帧提取，根据画面变化自动提取关键帧
+    单次解码的流式管线：解码 -> 缩放 -> 灰度/遮罩 -> 相似度选择 -> 只写出关键帧
+    
+    Args:
+        video_path: 输入视频路径
+        output_folder: 输出文件夹
+        threshold: 画面变化阈值 (0-1)，值越小提取越频繁
+        target_size: 目标分辨率 (宽, 高)，为 None 时使用原分辨率
+        resized_output: 可选，同时写出缩放后的视频到该路径
+        stats: 可选的字典，写入 frames / keyframes / seconds / fps 统计
+        similarity: 相似度后端名称 (ssim / fast_ssim / thumb / orb / nav_orb) 或后端实例
+        features: 同时把导航特征保存到 features/ 目录，运行时直接加载
+        stride: 采样间隔，只对每 stride 帧中的一帧做完整处理 (关键帧位置精度随之降为 stride 帧)；
+            同时写出缩放视频时必须逐帧，stride 被忽略
+        thumbs: 同时写出缩略图到 thumbs/ 目录 (ThumbnailCache 优先读取)
+        writers: 关键帧写出线程数
+        resume: 定期保存断点，输出目录中有参数一致的断点时从断点继续 (同时写出缩放视频时不支持)
+        checkpoint_interval: 断点最短保存间隔 (秒)
+        ui_mask: 可选，学习得到的 UI 遮罩文件；不指定时使用输出目录中的 ui_mask.png，都没有时使用固定矩形
+        
+    Returns:
+        int: 提取的关键帧数量
+    """
+    # 创建输出文件夹
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    
+    cap, info = open_video(video_path)
+    if cap is None:
+        return 0
+    
+    width, height = tuple(target_size) if target_size is not None else (info["width"], info["height"])
+    writer = None
+    if resized_output:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(resized_output, fourcc, info["fps"], (width, height))
+    
+    # 获取遮罩 (学习得到的 UI 遮罩或固定矩形，按处理分辨率)
+    mask, learned = resolve_mask(output_folder, width, height, ui_mask)
+    feature_mask = mask if learned else None
+    
+    print(f"正在提取关键帧: {video_path}")
+    print(f"视频信息: {info['width']}x{info['height']}, {info['fps']} FPS, 处理分辨率: {width}x{height}")
+    print(f"关键帧提取阈值: {threshold}")
+    if isinstance(similarity, str):
+        similarity = create_similarity(similarity)
+    if hasattr(similarity, "set_mask"):
+        similarity.set_mask(mask)
+    print(f"相似度后端: {similarity.name}")
+    
+    if writer is not None:
+        stride = 1
+    
+    checkpoint = None
+    first = 0
+    start_index = 0
+    reference = None
+    if resume and writer is None:
+        params = {"video": os.path.abspath(video_path), "frames": info["frames"], "size": [width, height],
+                  "threshold": threshold, "similarity": similarity.name,
+                  "scale": getattr(similarity, "scale", None), "stride": stride, "mask": mask_signature(mask)}
+        checkpoint = ExtractionCheckpoint(output_folder, params, checkpoint_interval)
+        state = checkpoint.load()
+        if state is not None:
+            indices, reference = state
+            first = len(indices)
+            start_index = indices[-1] + stride
+            repaired = _repair_keyframes(cap, output_folder, indices, (width, height), thumbs, features,
+                                         feature_mask)
+            print(f"从断点继续：已有 {first} 个关键帧 (重新生成 {repaired} 个损坏的)，从第 {start_index} 帧开始")
+    
+    timing = {}
+    recent = {}
+    start = time.perf_counter()
+    frames = read_frames(cap, info["frames"], start=start_index, stride=stride, timing=timing)
+    frames = resize_frames(frames, (width, height), writer)
+    keyframes = select_keyframes(_track_gray(mask_frames(frames, mask), recent), threshold, similarity,
+                                 reference=reference)
+    keyframe_writer = KeyframeWriter(workers=writers, thumbs=thumbs, features=features, feature_mask=feature_mask)
+    
+    def on_saved(number, index):
+        checkpoint.add(number, index, recent[index])
+        checkpoint.maybe_save(first + keyframe_writer.completed)
+    
+    finished = False
+    try:
+        saved_count = write_keyframes(keyframes, output_folder, info["fps"], keyframe_writer, first,
+                                      on_saved if checkpoint is not None else None)
+        frame_count = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - start_index
+        keyframe_writer.close()
+        finished = True
+    finally:
+        if not finished:
+            # 中断 (Ctrl-C / 异常)：等已提交的关键帧写完，把连续写完的部分记入断点
+            try:
+                keyframe_writer.close()
+            except Exception as e:
+                print(f"关键帧写出失败: {e}")
+            if checkpoint is not None:
+                checkpoint.save(first + keyframe_writer.completed)
+                print(f"提取中断，已保存断点 ({checkpoint.saved} 个关键帧)，"
+                      f"重新运行同一命令即可继续")
+        elif checkpoint is not None:
+            checkpoint.remove()
+        cap.release()
+        if writer is not None:
+            writer.release()
+    elapsed = time.perf_counter() - start
+    
+    throughput = frame_count / elapsed if elapsed > 0 else 0.0
+    retrieved = timing.get("retrieved", 0)
+    grab_s = timing.get("grab", 0.0)
+    retrieve_s = timing.get("retrieve", 0.0)
+    rest_s = elapsed - grab_s - retrieve_s
+    print(f"关键帧提取完成，共提取: {saved_count} 帧")
+    print(f"共处理 {frame_count} 帧，耗时 {elapsed:.2f}s，吞吐 {throughput:.1f} 帧/秒")
+    if frame_count and retrieved:
+        print(f"耗时拆分: 解码 grab {grab_s:.2f}s ({grab_s / frame_count * 1000:.2f}ms/帧)，"
+              f"取帧 retrieve {retrieve_s:.2f}s ({retrieved} 帧)，"
+              f"缩放/遮罩/相似度/提交写出 {rest_s:.2f}s ({rest_s / retrieved * 1000:.2f}ms/采样帧)")
+    print(keyframe_writer.summary())
+    if stats is not None:
+        stats.update(frames=frame_count, keyframes=saved_count, seconds=elapsed, fps=throughput,
+                     retrieved=retrieved, grab_seconds=grab_s, retrieve_seconds=retrieve_s,
+                     write=dict(keyframe_writer.stats))
+    return saved_count
+
+
+def extract_keyframes_sweep(video_path, output_folder, thresholds, target_size=(640, 360), stats=None,
+                            similarity=DEFAULT_SIMILARITY, stride=1, write=False, features=False, thumbs=False,
+                            writers=2, ui_mask=None):
+    """
+    阈值扫描：只解码一遍，同时得到多个阈值下的关键帧选择结果，用于挑选 --threshold
+    每个阈值写出一份清单 sweep_t<阈值>.json (帧序号、时间、相似度)，全部阈值的统计写到 sweep_summary.json；
+    write 为 True 时同时把各阈值的候选数据集写到 t<阈值>/ 子目录 (与单独提取的输出一致)
+    
+    Args:
+        thresholds: 阈值列表
+        write: 是否写出候选数据集 (关键帧图片)
+        其余参数同 extract_keyframes
+        
+    Returns:
+        dict: 阈值 -> 关键帧数量
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    
+    cap, info = open_video(video_path)
+    if cap is None:
+        return {}
+    
+    thresholds = sorted(set(thresholds))
+    width, height = tuple(target_size) if target_size is not None else (info["width"], info["height"])
+    mask, learned = resolve_mask(output_folder, width, height, ui_mask)
+    if isinstance(similarity, str):
+        similarity = create_similarity(similarity)
+    if hasattr(similarity, "set_mask"):
+        similarity.set_mask(mask)
+    
+    print(f"阈值扫描: {video_path}")
+    print(f"视频信息: {info['width']}x{info['height']}, {info['fps']} FPS, 处理分辨率: {width}x{height}")
+    print(f"相似度后端: {similarity.name}, 阈值: {', '.join(f'{t:g}' for t in thresholds)}")
+    
+    folders = [os.path.join(output_folder, f"t{t:g}") for t in thresholds]
+    selected = [[] for _ in thresholds]
+    keyframe_writer = None
+    if write:
+        keyframe_writer = KeyframeWriter(workers=writers, thumbs=thumbs, features=features,
+                                         feature_mask=mask if learned else None)
+        for folder in folders:
+            os.makedirs(folder, exist_ok=True)
+            if learned:
+                save_ui_mask(folder, mask)
+    
+    timing = {}
+    start = time.perf_counter()
+    try:
+        frames = resize_frames(read_frames(cap, info["frames"], stride=stride, timing=timing), (width, height))
+        for t, index, frame, score in select_keyframes_multi(mask_frames(frames, mask), thresholds, similarity):
+            if keyframe_writer is not None:
+                keyframe_writer.submit(os.path.join(folders[t], f"frame_{len(selected[t]):04d}.jpg"), frame)
+            selected[t].append((index, score))
+        frame_count = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    finally:
+        if keyframe_writer is not None:
+            keyframe_writer.close()
+        cap.release()
+    elapsed = time.perf_counter() - start
+    
+    fps = info["fps"]
+    summary = []
+    for threshold, keyframes, folder in zip(thresholds, selected, folders):
+        scores = [score for _, score in keyframes if score is not None]
+        times = [index / fps for index, _ in keyframes]
+        entry = {"threshold": threshold, "keyframes": len(keyframes),
+                 "mean_interval": (times[-1] - times[0]) / (len(times) - 1) if len(times) > 1 else None,
+                 "min_score": min(scores) if scores else None,
+                 "mean_score": sum(scores) / len(scores) if scores else None}
+        manifest = {"video": os.path.abspath(video_path), "similarity": similarity.name,
+                    "size": [width, height], "stride": stride, "fps": fps, "threshold": threshold,
+                    "dataset": folder if write else None,
+                    "keyframes": [{"frame": index, "time": index / fps, "score": score}
+                                  for index, score in keyframes]}
+        with open(os.path.join(output_folder, f"sweep_t{threshold:g}.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        summary.append(entry)
+    with open(os.path.join(output_folder, "sweep_summary.json"), 'w', encoding='utf-8') as f:
+        json.dump({"video": os.path.abspath(video_path), "similarity": similarity.name, "frames": frame_count,
+                   "seconds": elapsed, "results": summary}, f, indent=2)
+    
+    throughput = frame_count / elapsed if elapsed > 0 else 0.0
+    print(f"扫描完成：一遍解码 {frame_count} 帧，耗时 {elapsed:.2f}s，吞吐 {throughput:.1f} 帧/秒")
+    for entry in summary:
+        interval = f"{entry['mean_interval']:.2f}s" if entry["mean_interval"] is not None else "-"
+        min_score = f"{entry['min_score']:.3f}" if entry["min_score"] is not None else "-"
+        print(f"  阈值 {entry['threshold']:g}: {entry['keyframes']} 个关键帧，平均间隔 {interval}，最低相似度 {min_score}")
+    if keyframe_writer is not None:
+        print(keyframe_writer.summary())
+    if stats is not None:
+        stats.update(frames=frame_count, seconds=elapsed, fps=throughput,
+                     keyframes={entry["threshold"]: entry["keyframes"] for entry in summary})
+    return {entry["threshold"]: entry["keyframes"] for entry in summary}
+
+
 def main():
     """
     主函数
@@ -194,6 +901,31 @@ def main():
     parser.add_argument('--width', '-w', type=int, default=640, help='目标宽度')
     parser.add_argument('--height', '-H', type=int, default=360, help='目标高度')
     parser.add_argument('--resize_only', action='store_true', help='只调整视频分辨率，不提取关键帧')
+    parser.add_argument('--save_resized', action='store_true', help='提取关键帧时同时写出缩放后的视频')
+    parser.add_argument('--similarity', choices=sorted(SIMILARITY_BACKENDS), default=DEFAULT_SIMILARITY,
+                        help='关键帧相似度后端 (ssim 为 scikit-image 全分辨率实现)')
+    parser.add_argument('--similarity_scale', type=float, default=1.0,
+                        help='fast_ssim 的降采样比例 (1.0 与 skimage 结果一致，0.5 约快 4 倍)')
+    parser.add_argument('--min_overlap', type=float, default=None,
+                        help='按导航特征重叠率选择关键帧：使用 nav_orb，相邻关键帧的重叠率不低于该值')
+    parser.add_argument('--features', action='store_true',
+                        help='同时保存导航特征到 features/ 目录，运行时跳过读图和特征提取')
+    parser.add_argument('--thumbs', action='store_true',
+                        help='同时写出缩略图到 thumbs/ 目录，界面直接读取')
+    parser.add_argument('--writers', type=int, default=2, help='关键帧编码/写盘线程数')
+    parser.add_argument('--no_resume', action='store_true',
+                        help='不使用断点：忽略已有断点从头提取，运行中也不保存断点')
+    parser.add_argument('--checkpoint_interval', type=float, default=10.0, help='断点最短保存间隔 (秒)')
+    parser.add_argument('--stride', type=int, default=1,
+                        help='采样间隔：每 stride 帧只完整处理一帧，其余只 grab 解码 (1 为逐帧)')
+    parser.add_argument('--sweep', default=None,
+                        help='阈值扫描：逗号分隔的多个阈值 (如 0.3,0.4,0.5)，一遍解码得到各阈值的关键帧清单和数量汇总')
+    parser.add_argument('--sweep_write', action='store_true',
+                        help='阈值扫描时同时把各阈值的候选数据集写到输出目录的 t<阈值>/ 子目录')
+    parser.add_argument('--ui_mask', default=None,
+                        help='学习得到的 UI 遮罩 (learn_ui_mask.py 生成)；不指定时自动使用输出目录中的 ui_mask.png')
+    parser.add_argument('--workers', '-j', type=int, default=1,
+                        help='分段并行提取的进程数 (1 为顺序提取，0 为 CPU 核数)')
     
     args = parser.parse_args()
     
@@ -205,14 +937,60 @@ def main():
     base_name = os.path.splitext(os.path.basename(args.input))[0]
     resized_video_path = f"{args.output}/{base_name}_resized.mp4"
     
-    # 1. 调整视频分辨率
-    resize_success = resize_video(args.input, resized_video_path, args.width, args.height)
-    if not resize_success:
-        return
-    
-    # 2. 提取关键帧
-    if not args.resize_only:
-        extract_keyframes(resized_video_path, args.output, args.threshold)
+    if args.resize_only:
+        # 只调整视频分辨率
+        if not resize_video(args.input, resized_video_path, args.width, args.height):
+            return
+    else:
+        if args.min_overlap is not None:
+            # nav_orb 的分数就是重叠率，重叠率低于 1 - threshold 时切换关键帧
+            args.similarity = "nav_orb"
+            args.threshold = 1 - args.min_overlap
+        similarity = (create_similarity(args.similarity, scale=args.similarity_scale)
+                      if args.similarity == "fast_ssim" else args.similarity)
+        if args.sweep:
+            # 阈值扫描只解码一遍，各阈值共用解码和签名计算，按顺序处理
+            extract_keyframes_sweep(
+                args.input, args.output,
+                [float(t) for t in args.sweep.split(',') if t.strip()],
+                target_size=(args.width, args.height),
+                similarity=similarity,
+                stride=args.stride,
+                write=args.sweep_write,
+                features=args.features,
+                thumbs=args.thumbs,
+                writers=args.writers,
+                ui_mask=args.ui_mask
+            )
+        elif args.workers != 1 and not args.save_resized:
+            # 分段并行：各段独立解码，拼接后与顺序提取结果一致
+            extract_keyframes_parallel(
+                args.input, args.output, args.threshold,
+                target_size=(args.width, args.height),
+                workers=args.workers or None,
+                similarity=similarity,
+                features=args.features,
+                stride=args.stride,
+                thumbs=args.thumbs,
+                ui_mask=args.ui_mask
+            )
+        else:
+            if args.workers != 1:
+                print("写出缩放视频需要按顺序解码，改用单进程提取")
+            # 单次解码：缩放、遮罩、选择关键帧在同一遍完成，缩放后的视频只在需要时写出
+            extract_keyframes(
+                args.input, args.output, args.threshold,
+                target_size=(args.width, args.height),
+                resized_output=resized_video_path if args.save_resized else None,
+                similarity=similarity,
+                features=args.features,
+                stride=args.stride,
+                thumbs=args.thumbs,
+                writers=args.writers,
+                resume=not args.no_resume,
+                checkpoint_interval=args.checkpoint_interval,
+                ui_mask=args.ui_mask
+            )
     
     print("视频处理完成！")
 